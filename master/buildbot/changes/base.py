@@ -13,10 +13,13 @@
 #
 # Copyright Buildbot Team Members
 
+import random
+
 from twisted.application import service
 from twisted.internet import defer
 from twisted.internet import reactor
 from twisted.internet import task
+from twisted.python import failure
 from twisted.python import log
 from zope.interface import implements
 
@@ -34,6 +37,126 @@ class ChangeSource(service.Service, util.ComparableMixin):
         pass
 
 
+class _SharedCall(object):
+
+    f = None
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.waiters = []
+
+    def addItems(self, items):
+        for item in items:
+            if item not in self.items:
+                self.items.append(item)
+
+    def covers(self, items):
+        return all(item in self.items for item in items)
+
+    def wait(self):
+        d = defer.Deferred()
+        self.waiters.append(d)
+        return d
+
+    def fire(self, result):
+        waiters, self.waiters = self.waiters, []
+        for d in waiters:
+            if isinstance(result, failure.Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
+
+
+class PollCoordinator(object):
+
+    """I coordinate the VCS commands run by pollers.
+
+    At most C{maxCommands} commands run at once, whichever poller they come
+    from; the others wait their turn.  Pollers that fetch into the same
+    place (a mirror of a repository, say) can share the work through
+    L{share}, so that several pollers watching one repository do not fetch
+    it several times over.
+    """
+
+    def __init__(self, maxCommands=8):
+        self.maxCommands = maxCommands
+        self.active = 0
+        self.waiting = []
+        # key -> _SharedCall, for running and queued shared calls
+        self.running = {}
+        self.queued = {}
+
+    def setMaxCommands(self, maxCommands):
+        self.maxCommands = maxCommands
+        self._startWaiting()
+
+    def run(self, f, *args, **kwargs):
+        """Call C{f}, which runs a command and returns a Deferred, as soon as
+        fewer than C{maxCommands} commands are running.  Returns a Deferred
+        firing with the result of C{f}."""
+        d = defer.Deferred()
+        self.waiting.append((d, f, args, kwargs))
+        self._startWaiting()
+        return d
+
+    def _startWaiting(self):
+        while self.waiting and self.active < self.maxCommands:
+            d, f, args, kwargs = self.waiting.pop(0)
+            self.active += 1
+            rd = defer.maybeDeferred(f, *args, **kwargs)
+            rd.addBoth(self._commandFinished)
+            rd.chainDeferred(d)
+
+    def _commandFinished(self, res):
+        self.active -= 1
+        self._startWaiting()
+        return res
+
+    def share(self, key, items, f):
+        """Call C{f} with a list of items, sharing the call with other
+        callers using the same C{key}.
+
+        Calls with the same key never run at once.  If one is running and
+        its items include all of C{items}, the caller just waits for its
+        result.  Otherwise the caller's items are added to the next call for
+        that key, which starts when the running one is finished.  Returns a
+        Deferred firing with the result of the call that covered C{items}.
+        """
+        running = self.running.get(key)
+        if running is not None and running.covers(items):
+            return running.wait()
+        if running is None:
+            call = _SharedCall(items)
+            d = call.wait()
+            self._startShared(key, call, f)
+            return d
+        call = self.queued.get(key)
+        if call is None:
+            call = self.queued[key] = _SharedCall(items)
+        else:
+            call.addItems(items)
+        # the latest caller's f runs the call
+        call.f = f
+        return call.wait()
+
+    def _startShared(self, key, call, f):
+        self.running[key] = call
+        d = defer.maybeDeferred(f, list(call.items))
+
+        @d.addBoth
+        def finished(res):
+            del self.running[key]
+            call.fire(res)
+            queued = self.queued.pop(key, None)
+            if queued is not None:
+                self._startShared(key, queued, queued.f)
+        return d
+
+
+pollCoordinator = PollCoordinator()
+"the L{PollCoordinator} shared by all pollers of this master process"
+
+
 class PollingChangeSource(ChangeSource):
 
     """
@@ -50,7 +173,15 @@ class PollingChangeSource(ChangeSource):
     pollAtLaunch = False
     "determines when the first poll occurs. True = immediately on launch, False = wait for one pollInterval."
 
+    pollJitter = 0.25
+    """the first poll is delayed by a random part of this fraction of
+    C{pollInterval}, so that pollers do not all poll at the same time"""
+
+    coordinator = pollCoordinator
+    "the L{PollCoordinator} that VCS commands should be run through"
+
     _loop = None
+    _startCall = None
 
     def __init__(self, name=None, pollInterval=60 * 10, pollAtLaunch=False):
         if name:
@@ -80,12 +211,22 @@ class PollingChangeSource(ChangeSource):
 
     def startLoop(self):
         self._loop = task.LoopingCall(self.doPoll)
-        self._loop.start(self.pollInterval, now=self.pollAtLaunch)
+        delay = 0
+        if not self.pollAtLaunch and self.pollJitter:
+            delay = random.uniform(0, self.pollJitter * self.pollInterval)
+        if delay:
+            self._startCall = reactor.callLater(
+                delay, self._loop.start, self.pollInterval, now=False)
+        else:
+            self._loop.start(self.pollInterval, now=self.pollAtLaunch)
 
     def stopLoop(self):
+        if self._startCall and self._startCall.active():
+            self._startCall.cancel()
+        self._startCall = None
         if self._loop and self._loop.running:
             self._loop.stop()
-            self._loop = None
+        self._loop = None
 
     def startService(self):
         ChangeSource.startService(self)
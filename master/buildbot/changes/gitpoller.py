@@ -114,7 +114,9 @@ class GitPoller(base.PollingChangeSource, StateMixin):
         return str
 
     def _getBranches(self):
-        d = self._dovccmd('ls-remote', [self.repourl])
+        d = self.coordinator.share(
+            ('git ls-remote', self.repourl), [],
+            lambda _: self._dovccmd('ls-remote', [self.repourl]))
 
         @d.addCallback
         def parseRemote(rows):
@@ -158,8 +160,12 @@ class GitPoller(base.PollingChangeSource, StateMixin):
             '+%s:%s' % (self._removeHeads(branch), self._trackerBranch(branch))
             for branch in branches
         ]
-        yield self._dovccmd('fetch',
-                            [self.repourl] + refspecs, path=self.workdir)
+        # pollers of the same repository with the same workdir share the
+        # fetch, each adding the branches it wants
+        yield self.coordinator.share(
+            ('git fetch', self.workdir, self.repourl), refspecs,
+            lambda refspecs: self._dovccmd('fetch', [self.repourl] + refspecs,
+                                           path=self.workdir))
 
         revs = {}
         for branch in branches:
@@ -295,8 +301,8 @@ class GitPoller(base.PollingChangeSource, StateMixin):
                 src='git')
 
     def _dovccmd(self, command, args, path=None):
-        d = utils.getProcessOutputAndValue(self.gitbin,
-                                           [command] + args, path=path, env=os.environ)
+        d = self.coordinator.run(utils.getProcessOutputAndValue, self.gitbin,
+                                 [command] + args, path=path, env=os.environ)
 
         def _convert_nonzero_to_failure(res,
                                         command,
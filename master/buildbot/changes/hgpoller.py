@@ -86,24 +86,37 @@ class HgPoller(base.PollingChangeSource):
             return workdir
         return os.path.join(self.master.basedir, workdir)
 
-    def _getRevDetails(self, rev):
-        """Return a deferred for (date, author, files, comments) of given rev.
-
-        Deferred will be in error if rev is unknown.
+    # ASCII record, field and file separators for the 'hg log' template;
+    # they cannot appear in descriptions, author names or file names
+    RECORD_SEP = '\x1e'
+    FIELD_SEP = '\x1f'
+    FILE_SEP = '\x1d'
+
+    def _getRevsDetails(self, revrange):
+        """Return a deferred for the details of all revisions of our branch
+        in revrange, oldest first.
+
+        This is a single 'hg log' call; the result is a list of
+        (rev, node, date, author, files, comments) tuples.
         """
-        args = ['log', '-r', rev, os.linesep.join((
-            '--template={date|hgdate}',
-            '{author}',
-            "{files % '{file}" + os.pathsep + "'}",
-            '{desc|strip}'))]
-        # Mercurial fails with status 255 if rev is unknown
-        d = utils.getProcessOutput(self.hgbin, args, path=self._absWorkdir(),
-                                   env=os.environ, errortoo=False)
-
-        def process(output):
-            # all file names are on one line
-            date, author, files, comments = output.decode(self.encoding, "replace").split(
-                os.linesep, 3)
+        template = self.FIELD_SEP.join((
+            '{rev}', '{node}', '{date|hgdate}', '{author}',
+            "{files % '{file}" + self.FILE_SEP + "'}",
+            '{desc|strip}')) + self.RECORD_SEP
+        args = ['log', '-b', self.branch, '-r', revrange,
+                '--template=' + template]
+        d = self.coordinator.run(utils.getProcessOutput, self.hgbin, args,
+                                 path=self._absWorkdir(), env=os.environ,
+                                 errortoo=False)
+        d.addCallback(lambda output: list(self._parseRevsDetails(output)))
+        return d
+
+    def _parseRevsDetails(self, output):
+        for record in output.split(self.RECORD_SEP):
+            if not record.strip():
+                continue
+            rev, node, date, author, files, comments = record.decode(
+                self.encoding, "replace").split(self.FIELD_SEP, 5)
 
             if not self.usetimestamps:
                 stamp = None
@@ -114,10 +127,8 @@ class HgPoller(base.PollingChangeSource):
                     log.msg('hgpoller: caught exception converting output %r '
                             'to timestamp' % date)
                     raise
-            return stamp, author.strip(), files.split(os.pathsep)[:-1], comments.strip()
-
-        d.addCallback(process)
-        return d
+            yield (int(rev), str(node.strip()), stamp, author.strip(),
+                   files.split(self.FILE_SEP)[:-1], comments.strip())
 
     def _isRepositoryReady(self):
         """Easy to patch in tests."""
@@ -131,9 +142,9 @@ class HgPoller(base.PollingChangeSource):
         if self._isRepositoryReady():
             return defer.succeed(None)
         log.msg('hgpoller: initializing working dir from %s' % self.repourl)
-        d = utils.getProcessOutputAndValue(self.hgbin,
-                                           ['init', self._absWorkdir()],
-                                           env=os.environ)
+        d = self.coordinator.run(utils.getProcessOutputAndValue, self.hgbin,
+                                 ['init', self._absWorkdir()],
+                                 env=os.environ)
         d.addCallback(self._convertNonZeroToFailure)
         d.addErrback(self._stopOnFailure)
         d.addCallback(lambda _: log.msg(
@@ -147,19 +158,28 @@ class HgPoller(base.PollingChangeSource):
         d.addCallback(lambda _: log.msg(
             "hgpoller: polling hg repo at %s" % self.repourl))
 
+        # pollers of different branches that share a workdir share the pull
+        d.addCallback(lambda _: self.coordinator.share(
+            ('hg pull', self._absWorkdir(), self.repourl), [self.branch],
+            self._pull))
+
+        return d
+
+    def _pull(self, branches):
         # get a deferred object that performs the fetch
-        args = ['pull', '-b', self.branch, self.repourl]
+        args = ['pull']
+        for branch in branches:
+            args += ['-b', branch]
+        args.append(self.repourl)
 
         # This command always produces data on stderr, but we actually do not
         # care about the stderr or stdout from this command.
         # We set errortoo=True to avoid an errback from the deferred.
         # The callback which will be added to this
         # deferred will not use the response.
-        d.addCallback(lambda _: utils.getProcessOutput(
-            self.hgbin, args, path=self._absWorkdir(),
-            env=os.environ, errortoo=True))
-
-        return d
+        return self.coordinator.run(utils.getProcessOutput,
+                                    self.hgbin, args, path=self._absWorkdir(),
+                                    env=os.environ, errortoo=True)
 
     def _getStateObjectId(self):
         """Return a deferred for object id in state db.
@@ -212,9 +232,9 @@ class HgPoller(base.PollingChangeSource):
         (if really buildbotting a branch that does not have any changeset
         yet, one shouldn't be surprised to get errors)
         """
-        d = utils.getProcessOutput(self.hgbin,
-                                   ['heads', self.branch, '--template={rev}' + os.linesep],
-                                   path=self._absWorkdir(), env=os.environ, errortoo=False)
+        d = self.coordinator.run(utils.getProcessOutput, self.hgbin,
+                                 ['heads', self.branch, '--template={rev}' + os.linesep],
+                                 path=self._absWorkdir(), env=os.environ, errortoo=False)
 
         def no_head_err(exc):
             log.err("hgpoller: could not find branch %r in repository %r" % (
@@ -263,19 +283,12 @@ class HgPoller(base.PollingChangeSource):
         else:
             revrange = '%d:%s' % (current + 1, head)
 
-        # two passes for hg log makes parsing simpler (comments is multi-lines)
-        revListArgs = ['log', '-b', self.branch, '-r', revrange,
-                       r'--template={rev}:{node}\n']
-        results = yield utils.getProcessOutput(self.hgbin, revListArgs,
-                                               path=self._absWorkdir(), env=os.environ, errortoo=False)
-
-        revNodeList = [rn.split(':', 1) for rn in results.strip().split()]
+        revs = yield self._getRevsDetails(revrange)
 
         log.msg('hgpoller: processing %d changes: %r in %r'
-                % (len(revNodeList), revNodeList, self._absWorkdir()))
-        for rev, node in revNodeList:
-            timestamp, author, files, comments = yield self._getRevDetails(
-                node)
+                % (len(revs), [(r[0], r[1]) for r in revs],
+                   self._absWorkdir()))
+        for rev, node, timestamp, author, files, comments in revs:
             yield self.master.addChange(
                 author=author,
                 revision=node,
@@ -16,6 +16,7 @@
 from buildbot import config
 from buildbot import interfaces
 from buildbot import util
+from buildbot.changes import base
 from buildbot.process import metrics
 from twisted.application import service
 from twisted.internet import defer
@@ -48,6 +49,8 @@ class ChangeManager(config.ReconfigurableServiceMixin, service.MultiService):
         timer = metrics.Timer("ChangeManager.reconfigService")
         timer.start()
 
+        base.pollCoordinator.setMaxCommands(new_config.maxPollerCommands)
+
         removed, added = util.diffSets(
             set(self),
             new_config.change_sources)
@@ -158,7 +158,7 @@ class P4Source(base.PollingChangeSource, util.ComparableMixin):
 
     def _get_process_output(self, args):
         env = dict([(e, os.environ.get(e)) for e in self.env_vars if os.environ.get(e)])
-        d = utils.getProcessOutput(self.p4bin, args, env)
+        d = self.coordinator.run(utils.getProcessOutput, self.p4bin, args, env)
         return d
 
     def _acquireTicket(self, protocol):
@@ -26,11 +26,15 @@ from twisted.python import log
 
 from buildbot import util
 from buildbot.changes import base
+from buildbot.util.state import StateMixin
 
 import os
 import urllib
 import xml.dom.minidom
 
+from cStringIO import StringIO
+from xml.etree import cElementTree
+
 # these split_file_* functions are available for use as values to the
 # split_file= argument.
 
@@ -69,7 +73,38 @@ def split_file_projects_branches(path):
     return f
 
 
-class SVNPoller(base.PollingChangeSource, util.ComparableMixin):
+def parse_logentries(output):
+    """
+    Parse the output of C{svn log --xml --verbose} into a list of compact
+    logentry dictionaries, in the order svn reported them.  Each dictionary
+    has the keys C{revision} (an int), C{author}, C{msg} and C{paths}, a
+    list of C{(kind, action, path)} tuples, or None if the revision had no
+    C{<paths>} element.  Elements are discarded as soon as they have been
+    parsed, so memory use does not grow with the number of entries.
+    """
+    logentries = []
+    try:
+        for _, el in cElementTree.iterparse(StringIO(output)):
+            if el.tag != 'logentry':
+                continue
+            paths = el.find('paths')
+            if paths is not None:
+                paths = [(p.get('kind', u''), p.get('action', u''),
+                          p.text or u'')
+                         for p in paths.findall('path')]
+            logentries.append(dict(
+                revision=int(el.get('revision')),
+                author=unicode(el.findtext('author', u'<unknown>')),
+                msg=unicode(el.findtext('msg', u'<unknown>')),
+                paths=paths))
+            el.clear()
+    except SyntaxError:
+        log.msg("SVNPoller: parse error in '%s'" % output)
+        raise
+    return logentries
+
+
+class SVNPoller(base.PollingChangeSource, StateMixin, util.ComparableMixin):
 
     """
     Poll a Subversion repository for changes and submit them to the change
@@ -132,6 +167,22 @@ class SVNPoller(base.PollingChangeSource, util.ComparableMixin):
                         "skipping and not using") % self.svnurl)
                 log.err()
 
+    def startService(self):
+        # a cache file, if given, takes precedence over the stored state
+        if self.last_change is not None:
+            d = defer.succeed(self.last_change)
+        else:
+            d = self.getState('last_change', None)
+
+        def setLastChange(last_change):
+            self.last_change = last_change
+        d.addCallback(setLastChange)
+
+        d.addCallback(lambda _:
+                      base.PollingChangeSource.startService(self))
+        d.addErrback(log.err, 'while initializing SVNPoller')
+        return d
+
     def describe(self):
         return "SVNPoller: watching %s" % self.svnurl
 
@@ -191,7 +242,11 @@ class SVNPoller(base.PollingChangeSource, util.ComparableMixin):
 
     def getProcessOutput(self, args):
         # this exists so we can override it during the unit tests
-        d = utils.getProcessOutput(self.svnbin, args, self.environ)
+        # pollers of the same svnurl run the same commands; share them
+        d = self.coordinator.share(
+            ('svn', self.svnbin) + tuple(args), [],
+            lambda _: self.coordinator.run(utils.getProcessOutput,
+                                           self.svnbin, args, self.environ))
         return d
 
     def get_prefix(self):
@@ -243,60 +298,56 @@ class SVNPoller(base.PollingChangeSource, util.ComparableMixin):
             args.extend(["--password=%s" % self.svnpasswd])
         if self.extra_args:
             args.extend(self.extra_args)
-        args.extend(["--limit=%d" % (self.histmax), self.svnurl])
+        if self.last_change is None:
+            # the first poll only needs to know where HEAD is
+            args.append("--limit=1")
+        else:
+            # only ask for revisions we have not seen yet; the range starts at
+            # last_change itself, since svn refuses a range starting beyond
+            # HEAD, and get_new_logentries drops it again.  A burst of more
+            # than histmax commits is picked up over the following polls.
+            args.extend(["--revision=%d:HEAD" % self.last_change,
+                         "--limit=%d" % self.histmax])
+        args.append(self.svnurl)
         d = self.getProcessOutput(args)
         return d
 
     def parse_logs(self, output):
-        # parse the XML output, return a list of <logentry> nodes
-        try:
-            doc = xml.dom.minidom.parseString(output)
-        except xml.parsers.expat.ExpatError:
-            log.msg("SVNPoller: SVNPoller.parse_logs: ExpatError in '%s'" % output)
-            raise
-        logentries = doc.getElementsByTagName("logentry")
-        return logentries
+        # parse the XML output, return a list of compact logentries
+        return parse_logentries(output)
 
     def get_new_logentries(self, logentries):
         last_change = old_last_change = self.last_change
 
         # given a list of logentries, calculate new_last_change, and
         # new_logentries, where new_logentries contains only the ones after
-        # last_change
+        # last_change, oldest first
 
-        new_last_change = None
+        new_last_change = last_change
         new_logentries = []
         if logentries:
-            new_last_change = int(logentries[0].getAttribute("revision"))
-
+            revisions = [e['revision'] for e in logentries]
             if last_change is None:
                 # if this is the first time we've been run, ignore any changes
                 # that occurred before now. This prevents a build at every
                 # startup.
+                new_last_change = max(revisions)
                 log.msg('SVNPoller: starting at change %s' % new_last_change)
-            elif last_change == new_last_change:
-                # an unmodified repository will hit this case
-                log.msg('SVNPoller: no changes')
             else:
-                for el in logentries:
-                    if last_change == int(el.getAttribute("revision")):
-                        break
-                    new_logentries.append(el)
-                new_logentries.reverse()  # return oldest first
-
+                new_logentries = sorted(
+                    [e for e in logentries if e['revision'] > last_change],
+                    key=lambda e: e['revision'])
+                if new_logentries:
+                    new_last_change = new_logentries[-1]['revision']
+
+        if new_last_change == last_change:
+            # an unmodified repository will hit this case
+            log.msg('SVNPoller: no changes')
         self.last_change = new_last_change
         log.msg('SVNPoller: _process_changes %s .. %s' %
                 (old_last_change, new_last_change))
         return new_logentries
 
-    def _get_text(self, element, tag_name):
-        try:
-            child_nodes = element.getElementsByTagName(tag_name)[0].childNodes
-            text = "".join([t.data for t in child_nodes])
-        except:
-            text = "<unknown>"
-        return text
-
     def _transform_path(self, path):
         if not path.startswith(self._prefix):
             log.msg(format="SVNPoller: ignoring path '%(path)s' which doesn't"
@@ -318,7 +369,7 @@ class SVNPoller(base.PollingChangeSource, util.ComparableMixin):
         changes = []
 
         for el in new_logentries:
-            revision = str(el.getAttribute("revision"))
+            revision = str(el['revision'])
 
             revlink = ''
 
@@ -327,24 +378,19 @@ class SVNPoller(base.PollingChangeSource, util.ComparableMixin):
                     revlink = self.revlinktmpl % urllib.quote_plus(revision)
 
             log.msg("Adding change revision %s" % (revision,))
-            author = self._get_text(el, "author")
-            comments = self._get_text(el, "msg")
+            author = el['author']
+            comments = el['msg']
             # there is a "date" field, but it provides localtime in the
             # repository's timezone, whereas we care about buildmaster's
             # localtime (since this will get used to position the boxes on
             # the Waterfall display, etc). So ignore the date field, and
             # addChange will fill in with the current time
             branches = {}
-            try:
-                pathlist = el.getElementsByTagName("paths")[0]
-            except IndexError:  # weird, we got an empty revision
+            if el['paths'] is None:  # weird, we got an empty revision
                 log.msg("ignoring commit with no paths")
                 continue
 
-            for p in pathlist.getElementsByTagName("path"):
-                kind = p.getAttribute("kind")
-                action = p.getAttribute("action")
-                path = "".join([t.data for t in p.childNodes])
+            for kind, action, path in el['paths']:
                 # the rest of buildbot is certainly not yet ready to handle
                 # unicode filenames, because they get put in RemoteCommands
                 # which get sent via PB to the buildslave, and PB doesn't
@@ -417,4 +463,6 @@ class SVNPoller(base.PollingChangeSource, util.ComparableMixin):
                 f.write(str(self.last_change))
 
         log.msg("SVNPoller: finished polling %s" % res)
-        return res
+        d = self.setState('last_change', self.last_change)
+        d.addCallback(lambda _: res)
+        return d
@@ -73,6 +73,7 @@ class MasterConfig(object):
         self.logCompressionMethod = 'bz2'
         self.logMaxTailSize = None
         self.logMaxSize = None
+        self.maxPollerCommands = 8
         self.properties = properties.Properties()
         self.mergeRequests = None
         self.codebaseGenerator = None
@@ -111,7 +112,8 @@ class MasterConfig(object):
         "change_source", "codebaseGenerator", "changeCacheSize", "changeHorizon",
         'db', "db_poll_interval", "db_url", "debugPassword", "eventHorizon",
         "logCompressionLimit", "logCompressionMethod", "logHorizon",
-        "logMaxSize", "logMaxTailSize", "manhole", "mergeRequests", "metrics",
+        "logMaxSize", "logMaxTailSize", "manhole", "maxPollerCommands",
+        "mergeRequests", "metrics",
         "multiMaster", "prioritizeBuilders", "projectName", "projectURL",
         "properties", "protocols", "revlink", "schedulers", "slavePortnum",
         "slaves", "status", "title", "titleURL", "user_managers", "validation"
@@ -263,6 +265,9 @@ class MasterConfig(object):
 
         copy_int_param('logMaxSize')
         copy_int_param('logMaxTailSize')
+        copy_int_param('maxPollerCommands')
+        if self.maxPollerCommands < 1:
+            error("c['maxPollerCommands'] must be at least 1")
 
         properties = config_dict.get('properties', {})
         if not isinstance(properties, dict):
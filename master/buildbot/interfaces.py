@@ -317,6 +317,13 @@ class ISlaveStatus(Interface):
         """Return a timestamp (seconds since epoch) indicating when the most
         recent message was received from the buildslave."""
 
+    def getWorkspace(buildername):
+        """Return a dict describing what the last build of the named builder
+        left in its workspace on this slave, or None if it has not built
+        there since the master started.  The dict has the 'time' the build
+        finished, and 'sources', mapping each codebase to a dict with its
+        'branch' and 'revision'."""
+
 
 class ISchedulerStatus(Interface):
 
@@ -431,7 +438,8 @@ class IBuilderStatus(Interface):
                            to find some that match the search parameters,
                            especially if there aren't any matching builds.
                            This argument imposes a hard limit on the number
-                           of builds that will be examined.
+                           of builds that will be examined, counting from
+                           max_buildnum if it is given.
         """
 
     def subscribe(receiver):
@@ -551,10 +559,14 @@ class IBuildStatus(Interface):
     # while the build is running, the following methods make sense.
     # Afterwards they return None
 
-    def getETA():
+    def getETA(percentile=50):
         """Returns the number of seconds from now in which the build is
         expected to finish, or None if we can't make a guess. This guess will
-        be refined over time."""
+        be refined over time.
+
+        When the builder has a history of successful builds, the guess is
+        the given percentile (0-100) of the recorded step durations, so
+        getETA(90) gives a pessimistic estimate."""
 
     def getCurrentStep():
         """Return an IBuildStepStatus object representing the currently
@@ -680,10 +692,11 @@ class IBuildStepStatus(Interface):
     # while the step is running, the following methods make sense.
     # Afterwards they return None
 
-    def getETA():
+    def getETA(percentile=50):
         """Returns the number of seconds from now in which the step is
         expected to finish, or None if we can't make a guess. This guess will
-        be refined over time."""
+        be refined over time, and is based on the given percentile (0-100)
+        of the step's recorded durations when there are any."""
 
     # Once you know the step has finished, the following methods are legal.
     # Before ths step has finished, they all return None.
@@ -850,6 +863,17 @@ class IStatusLog(Interface):
         trailing newline).
         """
 
+    def iterLines(channels=[LOG_CHANNEL_STDOUT, LOG_CHANNEL_STDERR]):
+        """Generate the lines of the given channels (including the trailing
+        newline) without reading the whole log into memory."""
+
+    def getHead(lines=20, channels=[LOG_CHANNEL_STDOUT, LOG_CHANNEL_STDERR]):
+        """Return a list of the first 'lines' lines of the log."""
+
+    def getTail(lines=20, channels=[LOG_CHANNEL_STDOUT, LOG_CHANNEL_STDERR]):
+        """Return a list of the last 'lines' lines of the log. Only that
+        many lines are held in memory while the log is read."""
+
     def getTextWithHeaders():
         """Return one big string with the contents of the Log. This merges
         all chunks (including headers) together."""
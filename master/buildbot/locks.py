@@ -13,9 +13,9 @@
 #
 # Copyright Buildbot Team Members
 
-
 from buildbot import util
 from buildbot.util import subscription
+from buildbot.util.bbcollections import OrderedDict
 from buildbot.util.eventual import eventually
 from twisted.internet import defer
 from twisted.python import log
@@ -35,16 +35,25 @@ class BaseLock:
     We maintain the wait queue in FIFO order, and ensure that counting waiters
     in the queue behind exclusive waiters cannot acquire the lock. This ensures
     that exclusive waiters are not starved.
+
+    The owner counts are kept up to date as the lock is claimed and released,
+    and the wait queue is an ordered dictionary keyed by waiter, so finding,
+    adding and removing a waiter takes constant time.  Checking whether a
+    waiter may claim the lock looks at no more than C{maxCount} entries at
+    the head of the queue, however long it is.
     """
     description = "<BaseLock>"
 
     def __init__(self, name, maxCount=1):
         # Name of the lock
         self.name = name
-        # Current queue, tuples (waiter, LockAccess, deferred)
-        self.waiting = []
+        # Current queue in FIFO order, waiter -> (LockAccess, deferred)
+        self.waiting = OrderedDict()
         # Current owners, tuples (owner, LockAccess)
         self.owners = []
+        # number of exclusive and counting owners
+        self.num_excl = 0
+        self.num_counting = 0
         # maximal number of counting owners
         self.maxCount = maxCount
 
@@ -60,13 +69,7 @@ class BaseLock:
 
             @return: Tuple (number exclusive owners, number counting owners)
         """
-        num_excl, num_counting = 0, 0
-        for owner in self.owners:
-            if owner[1].mode == 'exclusive':
-                num_excl = num_excl + 1
-            else:  # mode == 'counting'
-                num_counting = num_counting + 1
-
+        num_excl, num_counting = self.num_excl, self.num_counting
         assert (num_excl == 1 and num_counting == 0) \
             or (num_excl == 0 and num_counting <= self.maxCount)
         return num_excl, num_counting
@@ -77,22 +80,26 @@ class BaseLock:
                  % (self, requester, access, self.owners))
         num_excl, num_counting = self._getOwnersCount()
 
-        # Find all waiters ahead of the requester in the wait queue
-        for idx, waiter in enumerate(self.waiting):
-            if waiter[0] == requester:
-                w_index = idx
-                break
-        else:
-            w_index = len(self.waiting)
-        ahead = self.waiting[:w_index]
-
         if access.mode == 'counting':
-            # Wants counting access
-            return num_excl == 0 and num_counting + len(ahead) < self.maxCount \
-                and all([w[1].mode == 'counting' for w in ahead])
+            # Wants counting access: there must be room for the requester
+            # and every waiter ahead of it, all of which must be counting
+            if num_excl > 0:
+                return False
+            free = self.maxCount - num_counting
+            for ahead, (waiter, (w_access, d)) in \
+                    enumerate(self.waiting.iteritems()):
+                if waiter == requester:
+                    break
+                if ahead + 1 >= free or w_access.mode != 'counting':
+                    return False
+            return free > 0
         else:
-            # Wants exclusive access
-            return num_excl == 0 and num_counting == 0 and len(ahead) == 0
+            # Wants exclusive access: no owners, and nobody ahead of it
+            if num_excl > 0 or num_counting > 0:
+                return False
+            for waiter in self.waiting:
+                return waiter == requester
+            return True
 
     def claim(self, owner, access):
         """ Claim the lock (lock must be available) """
@@ -102,8 +109,12 @@ class BaseLock:
 
         assert isinstance(access, LockAccess)
         assert access.mode in ['counting', 'exclusive']
-        self.waiting = [w for w in self.waiting if w[0] != owner]
+        self.waiting.pop(owner, None)
         self.owners.append((owner, access))
+        if access.mode == 'exclusive':
+            self.num_excl += 1
+        else:
+            self.num_counting += 1
         debuglog(" %s is claimed '%s'" % (self, access.mode))
 
     def subscribeToReleases(self, callback):
@@ -121,11 +132,16 @@ class BaseLock:
             debuglog("%s already released" % self)
             return
         self.owners.remove(entry)
+        if access.mode == 'exclusive':
+            self.num_excl -= 1
+        else:
+            self.num_counting -= 1
         # who can we wake up?
         # After an exclusive access, we may need to wake up several waiting.
         # Break out of the loop when the first waiting client should not be awakened.
         num_excl, num_counting = self._getOwnersCount()
-        for i, (w_owner, w_access, d) in enumerate(self.waiting):
+        woken = []
+        for w_owner, (w_access, d) in self.waiting.iteritems():
             if w_access.mode == 'counting':
                 if num_excl > 0 or num_counting == self.maxCount:
                     break
@@ -138,11 +154,14 @@ class BaseLock:
                 else:
                     num_excl = num_excl + 1
 
-            # If the waiter has a deferred, wake it up and clear the deferred
-            # from the wait queue entry to indicate that it has been woken.
             if d:
-                self.waiting[i] = (w_owner, w_access, None)
-                eventually(d.callback, self)
+                woken.append((w_owner, w_access, d))
+
+        # If the waiter has a deferred, wake it up and clear the deferred
+        # from the wait queue entry to indicate that it has been woken.
+        for w_owner, w_access, d in woken:
+            self.waiting[w_owner] = (w_access, None)
+            eventually(d.callback, self)
 
         # notify any listeners
         self.release_subs.deliver()
@@ -160,19 +179,15 @@ class BaseLock:
             return defer.succeed(self)
         d = defer.Deferred()
 
-        # Are we already in the wait queue?
-        w = [i for i, w in enumerate(self.waiting) if w[0] == owner]
-        if w:
-            self.waiting[w[0]] = (owner, access, d)
-        else:
-            self.waiting.append((owner, access, d))
+        # if we are already in the wait queue, this keeps our place
+        self.waiting[owner] = (access, d)
         return d
 
     def stopWaitingUntilAvailable(self, owner, access, d):
         debuglog("%s stopWaitingUntilAvailable(%s)" % (self, owner))
         assert isinstance(access, LockAccess)
-        assert (owner, access, d) in self.waiting
-        self.waiting = [w for w in self.waiting if w[0] != owner]
+        assert self.waiting.get(owner) == (access, d)
+        del self.waiting[owner]
 
     def isOwner(self, owner, access):
         return (owner, access) in self.owners
@@ -14,8 +14,10 @@
 # Copyright Buildbot Team Members
 
 
+import heapq
 import types
 
+from collections import defaultdict
 from twisted.internet import defer
 from twisted.internet import error
 from twisted.python import components
@@ -43,6 +45,150 @@ class BuildFailed(Exception):
 class BuildStop(Exception):
     pass
 
+class ParallelStepsScheduler(object):
+
+    """I decide which of a batch of steps may start next.
+
+    The steps form a dependency graph through C{BuildStep.dependsOnStep}.
+    Steps whose dependencies have all completed wait in a priority queue,
+    ordered by the length of the longest chain of expected durations that
+    starts with them (the critical path), so long chains are started first.
+    Durations come from the C{expectedTime} callable, which is given a step
+    name and returns seconds or None; steps without history get the mean of
+    the known durations.
+
+    A step is only handed out while fewer than C{maxCount} steps are running
+    and while the C{slaveResources} it asks for fit into C{resourceLimits}.
+
+    @ivar launched: set of steps handed out by L{nextStep}
+    @ivar unrunnable: steps that can never start, because they depend on a
+                      step outside this batch that has not completed, are
+                      part of a dependency cycle, or depend on such a step
+    """
+
+    def __init__(self, steps, expectedTime=None, maxCount=2,
+                 resourceLimits=None):
+        self.maxCount = maxCount
+        self.resourceLimits = resourceLimits or {}
+        self.resourcesInUse = defaultdict(int)
+        self.running = 0
+        self.launched = set()
+        self.unrunnable = []
+
+        batch = set(steps)
+        self.dependents = defaultdict(list)
+        self.pendingDeps = {}
+        blocked = set()
+        for step in steps:
+            count = 0
+            for dep in step._dependsOnStep or ():
+                if dep._completionResult is not None:
+                    continue
+                if dep in batch:
+                    self.dependents[dep].append(step)
+                    count += 1
+                else:
+                    blocked.add(step)
+            self.pendingDeps[step] = count
+
+        self.priority = self._criticalPaths(steps, expectedTime)
+
+        unrunnable = set(s for s in steps
+                         if s in blocked or s not in self.priority)
+        queue = list(unrunnable)
+        for step in queue:
+            for child in self.dependents[step]:
+                if child not in unrunnable:
+                    unrunnable.add(child)
+                    queue.append(child)
+
+        self.ready = []
+        self._seq = 0
+        for step in steps:
+            if step in unrunnable:
+                self.unrunnable.append(step)
+            elif self.pendingDeps[step] == 0:
+                self._push(step)
+
+    def _criticalPaths(self, steps, expectedTime):
+        durations = {}
+        if expectedTime is not None:
+            for step in steps:
+                t = expectedTime(step.name)
+                if t is not None:
+                    durations[step] = t
+        if durations:
+            default = sum(durations.itervalues()) / len(durations)
+        else:
+            default = 1.0
+
+        # topological order (Kahn); steps in a cycle never get an order
+        indegree = dict(self.pendingDeps)
+        order = [s for s in steps if indegree[s] == 0]
+        for step in order:
+            for child in self.dependents[step]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    order.append(child)
+
+        paths = {}
+        for step in reversed(order):
+            longest = max([paths[c] for c in self.dependents[step]] or [0])
+            paths[step] = durations.get(step, default) + longest
+        return paths
+
+    def _push(self, step):
+        self._seq += 1
+        heapq.heappush(self.ready, (-self.priority[step], self._seq, step))
+
+    def _claims(self, step):
+        claims = {}
+        for name, amount in (step.slaveResources or {}).items():
+            if name in self.resourceLimits:
+                # a step asking for more than there is runs on its own
+                claims[name] = min(amount, self.resourceLimits[name])
+        return claims
+
+    def _fits(self, claims):
+        for name, amount in claims.items():
+            if self.resourcesInUse[name] + amount > self.resourceLimits[name]:
+                return False
+        return True
+
+    def nextStep(self):
+        """Return the next step to start, or None if none may start now."""
+        if self.running >= self.maxCount:
+            return None
+        skipped = []
+        found = None
+        while self.ready:
+            entry = heapq.heappop(self.ready)
+            step = entry[2]
+            claims = self._claims(step)
+            if self._fits(claims):
+                for name, amount in claims.items():
+                    self.resourcesInUse[name] += amount
+                found = step
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self.ready, entry)
+        if found is not None:
+            self.running += 1
+            self.launched.add(found)
+        return found
+
+    def stepFinished(self, step):
+        """Release C{step}'s resources and queue the steps it unblocks."""
+        self.running -= 1
+        for name, amount in self._claims(step).items():
+            self.resourcesInUse[name] -= amount
+        for child in self.dependents.pop(step, ()):
+            self.pendingDeps[child] -= 1
+            if self.pendingDeps[child] == 0 and child in self.priority:
+                self._push(child)
+
+
 class Build(properties.PropertiesMixin):
 
     """I represent a single build by a single slave. Specialized Builders can
@@ -456,7 +602,16 @@ class Build(properties.PropertiesMixin):
             raise BuildFailed()
 
     @defer.inlineCallbacks
-    def processStepsInParallel(self, steps, maxCount=2):
+    def processStepsInParallel(self, steps, maxCount=2, resourceLimits=None):
+        """Run C{steps} concurrently, honouring C{dependsOnStep}.
+
+        At most C{maxCount} steps run at once.  C{resourceLimits} maps slave
+        resource names to their capacity; a step claims the amounts listed in
+        its C{slaveResources} while it runs.  Among the ready steps, those
+        heading the longest remaining chain of expected step durations start
+        first.  Steps whose dependencies can never complete are skipped.
+        Only C{steps} are scheduled here; steps queued by other means are
+        left for L{runExistedSteps}."""
         assert len(self.currentSteps) == 0
         for step in steps:
             if step._step_status is None:
@@ -464,75 +619,61 @@ class Build(properties.PropertiesMixin):
             elif not step in self.steps:
                 self.steps.append(step)
 
-        build = self
-
-        class ParallelStepsProcessor():
-
-            def __init__(self):
-                self.launched = []
-                self.launched_deferred_results = []
-
-            def inProgress(self):
-                return len(self.launched)
-
-            def launch(self, step):
-                assert not step in build.currentSteps
-                if build.stopped:
-                    raise BuildStop()
-                build.currentSteps.append(step)
-                deferedResult = step.startStep(build.remote)
-                self.launched.append(step)
-                self.launched_deferred_results.append(deferedResult)
-
-            @defer.inlineCallbacks
-            def waitForOneStepCompletion(self):
-                """Returns True on build termination"""
-                results, index = yield defer.DeferredList(self.launched_deferred_results, fireOnOneCallback=True, fireOnOneErrback=True, consumeErrors=False)
-                completedStep = self.launched[index]
-                del self.launched[index]
-                del self.launched_deferred_results[index]
-                build.currentSteps.remove(completedStep)
-                terminate = build.stepDone(results, completedStep)  # interpret/merge results
-                yield completedStep.onCompletion(results)
-                if terminate:
-                    build.terminate = True
-                defer.returnValue(terminate)
-
-            def getNextStep(self):
-                for s in build.steps:
-                    if s.isReady():
-                        build.steps.remove(s)
-                        return s
-                return len(build.steps) == 0
-
-            def __enter__(self):
-                return self
-
-            def __exit__(self, type, value, tb):
-                try:
-                    while self.inProgress() > 0:
-                        yield self.waitForOneStepCompletion()
-                except:
-                    log.err()
-                for step in self.launched:
-                    if step in build.currentSteps:
-                        build.currentSteps.remove(step)
-
-
-        with ParallelStepsProcessor() as parallelSteps:
+        expectedTime = None
+        if self.progress:
+            expectedTime = self.progress.expectedStepTime
+        scheduler = ParallelStepsScheduler(steps, expectedTime=expectedTime,
+                                           maxCount=maxCount,
+                                           resourceLimits=resourceLimits)
+        completions = defer.DeferredQueue()
+        isTerminateStage = self.terminate
+        failure = None
+        try:
             while True:
-                step = parallelSteps.getNextStep()
-                if step is True:
-                    if parallelSteps.inProgress() == 0:
-                        break
-                elif step is not False:
-                    parallelSteps.launch(step)
-
-                if parallelSteps.inProgress() == maxCount or step in [True, False]:
-                    if (yield parallelSteps.waitForOneStepCompletion()):
+                halted = (failure is not None or self.stopped or
+                          (self.terminate and not isTerminateStage))
+                while not halted:
+                    step = scheduler.nextStep()
+                    if step is None:
                         break
+                    assert not step in self.currentSteps
+                    self.currentSteps.append(step)
+                    d = step.startStep(self.remote)
+                    d.addBoth(lambda res, step=step:
+                              completions.put((step, res)))
+                if not scheduler.running:
+                    break
+
+                step, results = yield completions.get()
+                self.currentSteps.remove(step)
+                scheduler.stepFinished(step)
+                if isinstance(results, Failure):
+                    if failure is None:
+                        failure = results
+                    continue
+                terminate = self.stepDone(results, step)  # interpret/merge results
+                yield step.onCompletion(results)
+                if terminate:
+                    self.terminate = True
+
+            if scheduler.unrunnable and failure is None and not self.stopped:
+                # these would wait forever; run them as skipped steps so that
+                # they get a status and the build does not run them later
+                log.msg("%s: skipping steps with unsatisfiable dependencies: "
+                        "%s" % (self, [s.name for s in scheduler.unrunnable]))
+                for step in scheduler.unrunnable:
+                    step.doStepIf = False
+                    yield self._processStep(step)
+        finally:
+            done = scheduler.launched.union(scheduler.unrunnable)
+            if done:
+                self.steps = [s for s in self.steps if s not in done]
 
-        if self.terminate:
+        if failure is not None:
+            failure.raiseException()
+        if self.stopped:
+            raise BuildStop()
+        if not isTerminateStage and self.terminate:
             raise BuildFailed()
 
     @defer.inlineCallbacks
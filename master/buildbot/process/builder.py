@@ -14,11 +14,13 @@
 # Copyright Buildbot Team Members
 
 
+import random
 import weakref
 
 from twisted.application import internet
 from twisted.application import service
 from twisted.internet import defer
+from twisted.internet import reactor
 from twisted.python import failure
 from twisted.python import log
 from twisted.spread import pb
@@ -26,11 +28,13 @@ from zope.interface import implements
 
 from buildbot import config
 from buildbot import interfaces
+from buildbot import util
 from buildbot.process import buildrequest
 from buildbot.process import slavebuilder
 from buildbot.process.build import Build
 from buildbot.process.properties import Properties
 from buildbot.process.slavebuilder import BUILDING
+from buildbot.status.builder import EXCEPTION
 from buildbot.status.builder import RETRY
 from buildbot.status.buildrequest import BuildRequestStatus
 from buildbot.status.progress import Expectations
@@ -45,6 +49,83 @@ def enforceChosenSlave(bldr, slavebuilder, breq):
     return True
 
 
+class WarmestSlaveFirst(object):
+
+    """
+    A C{nextSlave} function that prefers slaves whose workspace for the
+    builder is warm, so that incremental builds reuse an existing checkout
+    and build tree.
+
+    A slave's workspace is warmer the more codebases of the request being
+    matched it last built on the same branch; among equally warm slaves the
+    one that built most recently wins, and ties between cold slaves are
+    broken at random as with the default C{nextSlave}.  When called without
+    a request, the oldest pending request is used.
+
+    If the warmest slave is running a build, the request is held back for up
+    to C{maxWait} seconds (measured from its submission) in the hope that
+    the slave frees up, after which the best available slave is used.
+    """
+
+    _reactor = reactor
+
+    def __init__(self, maxWait=300):
+        self.maxWait = maxWait
+        self._rechecks = {}
+
+    @defer.inlineCallbacks
+    def __call__(self, bldr, slavebuilders, breq=None):
+        if not slavebuilders:
+            defer.returnValue(None)
+            return
+
+        if breq is None:
+            brdicts = yield bldr.master.db.buildrequests.getBuildRequests(
+                buildername=bldr.name, claimed=False)
+            if not brdicts:
+                defer.returnValue(random.choice(slavebuilders))
+                return
+            brdict = min(brdicts, key=lambda brd: brd['submitted_at'])
+            breq = yield buildrequest.BuildRequest.fromBrdict(bldr.master,
+                                                              brdict)
+
+        scored = [(self.getWarmth(bldr, sb, breq), sb) for sb in slavebuilders]
+        best = max(score for score, sb in scored)
+        candidates = [sb for score, sb in scored if score == best]
+
+        if self.maxWait:
+            # only a slave running a build will become available by itself
+            busy = [sb for sb in bldr.slaves if sb.state == BUILDING]
+            if busy and max(self.getWarmth(bldr, sb, breq)[:2]
+                            for sb in busy) > best[:2]:
+                waited = util.now() - breq.submittedAt
+                if waited < self.maxWait:
+                    self._recheckLater(bldr, self.maxWait - waited)
+                    defer.returnValue(None)
+                    return
+
+        defer.returnValue(random.choice(candidates))
+
+    def getWarmth(self, bldr, slavebuilder, breq):
+        """Return a sortable score of how warm this slave's workspace is for
+        the given request."""
+        workspace = slavebuilder.slave.slave_status.getWorkspace(bldr.name)
+        if workspace is None:
+            return (0, 0, 0)
+        sources = workspace['sources']
+        matching = len([ss for codebase, ss in breq.sources.iteritems()
+                        if codebase in sources and
+                        sources[codebase]['branch'] == ss.branch])
+        return (1, matching, workspace['time'])
+
+    def _recheckLater(self, bldr, delay):
+        timer = self._rechecks.get(bldr.name)
+        if timer and timer.active():
+            return
+        self._rechecks[bldr.name] = self._reactor.callLater(
+            delay, bldr.botmaster.maybeStartBuildsForBuilder, bldr.name)
+
+
 class Builder(config.ReconfigurableServiceMixin,
               pb.Referenceable,
               service.MultiService):
@@ -470,6 +551,10 @@ class Builder(config.ReconfigurableServiceMixin,
             d.addErrback(log.err, 'while marking build requests as completed')
 
         if sb.slave:
+            if results not in (EXCEPTION, RETRY):
+                # remember what is checked out there, for WarmestSlaveFirst
+                sb.slave.slave_status.recordWorkspace(
+                    self.name, build.build_status.getSourceStamps(absolute=True))
             sb.slave.releaseLocks()
 
         self.updateBigStatus()
@@ -19,13 +19,29 @@ from twisted.internet import defer
 from twisted.python import log
 from twisted.python.failure import Failure
 
+from buildbot import util
 from buildbot.db.buildrequests import AlreadyClaimedError
 from buildbot.process import metrics
 from buildbot.process.buildrequest import BuildRequest
 
+import inspect
 import random
 
 
+def _acceptsArgs(fn, count):
+    """Return True if C{fn} can be called with C{count} positional
+    arguments."""
+    if not inspect.isfunction(fn) and not inspect.ismethod(fn):
+        fn = getattr(fn, '__call__', None)
+    try:
+        args, varargs, _, _ = inspect.getargspec(fn)
+    except TypeError:
+        return False
+    if inspect.ismethod(fn) and fn.im_self is not None:
+        args = args[1:]
+    return varargs is not None or len(args) >= count
+
+
 class BuildChooserBase(object):
     #
     # WARNING: This API is experimental and in active development.
@@ -170,6 +186,7 @@ class BasicBuildChooser(BuildChooserBase):
         self.nextSlave = self.bldr.config.nextSlave
         if not self.nextSlave:
             self.nextSlave = lambda _, slaves: random.choice(slaves) if slaves else None
+        self.nextSlaveWantsRequest = _acceptsArgs(self.nextSlave, 3)
 
         self.slavepool = self.bldr.getAvailableSlaves()
 
@@ -189,16 +206,20 @@ class BasicBuildChooser(BuildChooserBase):
         nextBuild = (None, None)
 
         while True:
-            #  1. pick a slave
-            slave = yield self._popNextSlave()
-            if not slave:
+            if not (self.preferredSlaves or self.slavepool or
+                    self.rejectedSlaves):
                 break
 
-            #  2. pick a build
+            #  1. pick a build
             breq = yield self._getNextUnclaimedBuildRequest()
             if not breq:
                 break
 
+            #  2. pick a slave for it
+            slave = yield self._popNextSlave(breq)
+            if not slave:
+                break
+
             # either satisfy this build or we leave it for another day
             self._removeBuildRequest(breq)
 
@@ -210,7 +231,7 @@ class BasicBuildChooser(BuildChooserBase):
                     break
                 # try a different slave
                 recycledSlaves.append(slave)
-                slave = yield self._popNextSlave()
+                slave = yield self._popNextSlave(breq)
 
             # recycle the slaves that we didnt use to the head of the queue
             # this helps ensure we run 'nextSlave' only once per slave choice
@@ -271,7 +292,7 @@ class BasicBuildChooser(BuildChooserBase):
         defer.returnValue(nextBreq)
 
     @defer.inlineCallbacks
-    def _popNextSlave(self):
+    def _popNextSlave(self, breq):
         # use 'preferred' slaves first, if we have some ready
         if self.preferredSlaves:
             slave = self.preferredSlaves.pop(0)
@@ -280,7 +301,11 @@ class BasicBuildChooser(BuildChooserBase):
 
         while self.slavepool:
             try:
-                slave = yield self.nextSlave(self.bldr, self.slavepool)
+                if self.nextSlaveWantsRequest:
+                    slave = yield self.nextSlave(self.bldr, self.slavepool,
+                                                 breq)
+                else:
+                    slave = yield self.nextSlave(self.bldr, self.slavepool)
             except Exception:
                 slave = None
 
@@ -315,6 +340,72 @@ class BasicBuildChooser(BuildChooserBase):
         return self.bldr.canStartBuild(slave, breq)
 
 
+class ShortestJobFirst(object):
+
+    """
+    A C{prioritizeBuilders} function that starts builders with short expected
+    builds first, aging the waiting requests so that long builders are not
+    starved.
+
+    Each builder with pending requests is given the cost
+    C{duration - aging * wait}, where C{duration} is the expected duration
+    of its builds (from L{BuilderStatus.getExpectedDuration}) and C{wait} is
+    the age of its oldest unclaimed request, and builders are started in
+    order of increasing cost.  With C{aging=0} this is plain
+    shortest-job-first; as C{aging} grows the order approaches
+    oldest-request-first.  With the default of 0.25, four seconds of waiting
+    are worth one second of expected build time.
+
+    Builders without history are given C{defaultDuration}, or the mean of the
+    known durations if that is None.
+    """
+
+    def __init__(self, aging=0.25, defaultDuration=None, percentile=50):
+        self.aging = aging
+        self.defaultDuration = defaultDuration
+        self.percentile = percentile
+
+    @defer.inlineCallbacks
+    def __call__(self, master, builders):
+        timer = metrics.Timer("ShortestJobFirst()")
+        timer.start()
+        oldest = yield defer.gatherResults([
+            defer.maybeDeferred(bldr.getOldestRequestTime)
+            for bldr in builders])
+        submitted = [t and util.datetime2epoch(t) for t in oldest]
+        durations = [self.getExpectedDuration(bldr) for bldr in builders]
+        rv = self.sortBuilders(builders, submitted, durations, util.now())
+        timer.stop()
+        defer.returnValue(rv)
+
+    def getExpectedDuration(self, bldr):
+        builder_status = getattr(bldr, 'builder_status', None)
+        if builder_status is None:
+            return None
+        return builder_status.getExpectedDuration(percentile=self.percentile)
+
+    def sortBuilders(self, builders, submitted, durations, now):
+        """Return C{builders} sorted by increasing cost, given the
+        submission time of the oldest request of each builder (None if it has
+        none) and each builder's expected duration (None if unknown)."""
+        default = self.defaultDuration
+        if default is None:
+            known = [d for d in durations if d]
+            default = sum(known) / len(known) if known else 1.0
+
+        def key(item):
+            bldr, submitted_at, duration = item
+            if submitted_at is None:
+                # nothing to start; keep these at the end
+                return (1, 0, 0)
+            wait = max(now - submitted_at, 0)
+            if duration is None:
+                duration = default
+            return (0, duration - self.aging * wait, submitted_at)
+        items = sorted(zip(builders, submitted, durations), key=key)
+        return [item[0] for item in items]
+
+
 class BuildRequestDistributor(service.Service):
 
     """
@@ -135,6 +135,7 @@ class BuildStep(object, properties.PropertiesMixin):
              'description',
              'descriptionDone',
              'descriptionSuffix',
+             'slaveResources',
              ]
 
     name = "generic"
@@ -142,6 +143,9 @@ class BuildStep(object, properties.PropertiesMixin):
     descriptionDone = None  # alternate description when the step is complete
     descriptionSuffix = None  # extra information to append to suffix
     locks = []
+    # amounts of slave resources (e.g. {'cpu': 4}) claimed while this step
+    # runs under Build.processStepsInParallel
+    slaveResources = None
     progressMetrics = ()  # 'time' is implicit
     useProgress = True  # set to False if step is really unpredictable
     build = None
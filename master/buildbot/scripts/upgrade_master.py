@@ -24,6 +24,7 @@ from buildbot import monkeypatches
 from buildbot.db import connector
 from buildbot.master import BuildMaster
 from buildbot.scripts import base
+from buildbot.status import buildrecord
 from buildbot.util import in_reactor
 from twisted.internet import defer
 from twisted.python import runtime
@@ -168,6 +169,23 @@ def upgradeDatabase(config, master_cfg):
     yield db.model.upgrade()
 
 
+def upgradeBuildRecords(config, master_cfg):
+    if not config['quiet']:
+        print "upgrading build records"
+
+    for builder_cfg in master_cfg.builders:
+        builddir = os.path.join(config['basedir'], builder_cfg.builddir)
+        if not os.path.isdir(builddir):
+            continue
+        converted, failed = buildrecord.upgradeDirectory(builddir)
+        if converted and not config['quiet']:
+            print " converted %d builds of builder %s" % (converted,
+                                                          builder_cfg.name)
+        for filename in failed:
+            print "Could not convert build pickle %s; it was left as is" \
+                % (filename,)
+
+
 @in_reactor
 @defer.inlineCallbacks
 def upgradeMaster(config, _noMonkey=False):
@@ -194,6 +212,7 @@ def upgradeMaster(config, _noMonkey=False):
 
     upgradeFiles(config)
     yield upgradeDatabase(config, master_cfg)
+    upgradeBuildRecords(config, master_cfg)
 
     if not config['quiet']:
         print "upgrade complete"
@@ -23,14 +23,13 @@ from buildbot import interfaces
 from buildbot import sourcestamp
 from buildbot import util
 from buildbot.process import properties
+from buildbot.status import buildrecord
 from buildbot.status.buildstep import BuildStepStatus
-from cPickle import dump
 from twisted.internet import defer
 from twisted.internet import reactor
 from twisted.persisted import styles
 from twisted.python import components
 from twisted.python import log
-from twisted.python import runtime
 from zope.interface import implements
 
 
@@ -62,6 +61,9 @@ class BuildStatus(styles.Versioned, properties.PropertiesMixin):
     finishedWatchers = []
     testResults = {}
 
+    # (filename, offset) of the steps in a build record, until they are read
+    _stepsRecord = None
+
     def __init__(self, parent, master, number):
         """
         @type  parent: L{BuilderStatus}
@@ -188,9 +190,15 @@ class BuildStatus(styles.Versioned, properties.PropertiesMixin):
     # while the build is running, the following methods make sense.
     # Afterwards they return None
 
-    def getETA(self):
+    def getETA(self, percentile=50):
         if self.finished is not None:
             return None
+        history = self.builder.getDurationHistory()
+        if history is not None:
+            eta = history.getRemainingTime(self.builder.name, self,
+                                           percentile)
+            if eta is not None:
+                return eta
         if not self.progress:
             return None
         eta = self.progress.eta()
@@ -401,9 +409,10 @@ class BuildStatus(styles.Versioned, properties.PropertiesMixin):
             # someone looking at just this build will be confused as to why
             # the last log is truncated.
         for k in ['builder', 'watchers', 'updates', 'finishedWatchers',
-                  'master']:
+                  'master', '_stepsRecord']:
             if k in d:
                 del d[k]
+        d['steps'] = self.steps
         return d
 
     def __setstate__(self, d):
@@ -415,9 +424,42 @@ class BuildStatus(styles.Versioned, properties.PropertiesMixin):
     def setProcessObjects(self, builder, master):
         self.builder = builder
         self.master = master
-        for step in self.steps:
+        # steps that are not read yet get these when they are
+        for step in self.__dict__.get('steps', []):
             step.setProcessObjects(self, master)
 
+    def loadStepsFrom(self, filename, offset):
+        """Arrange for my steps to be read from the build record in
+        C{filename}, at C{offset}, the first time they are needed.  This is
+        called when loading a build, so that looking at its results does not
+        unpickle all of its steps and logs."""
+        self._stepsRecord = (filename, offset)
+        self.__dict__.pop('steps', None)
+
+    def __getattr__(self, name):
+        # only called for missing attributes; 'steps' is missing until read
+        # (this is an old-style class, so no property)
+        if name == 'steps' and self._stepsRecord:
+            (filename, offset), self._stepsRecord = self._stepsRecord, None
+            self.steps = []
+            self._loadSteps(filename, offset)
+            return self.steps
+        raise AttributeError(name)
+
+    def _loadSteps(self, filename, offset):
+        try:
+            steps = buildrecord.readSteps(filename, offset)
+            styles.doUpgrade()
+        except Exception:
+            log.err(None, "while reading the steps of build %s-#%d from %s"
+                    % (getattr(self.builder, 'name', '?'), self.number,
+                       filename))
+            return
+        self.steps = steps
+        for step in steps:
+            step.setProcessObjects(self, self.master)
+        self.checkLogfiles()
+
     def upgradeToVersion1(self):
         if hasattr(self, "sourceStamp"):
             # the old .sourceStamp attribute wasn't actually very useful
@@ -461,18 +503,14 @@ class BuildStatus(styles.Versioned, properties.PropertiesMixin):
         if os.path.isdir(filename):
             # leftover from 0.5.0, which stored builds in directories
             shutil.rmtree(filename, ignore_errors=True)
-        tmpfilename = filename + ".tmp"
+        saveQueue = self.builder.getSaveQueue()
+        if saveQueue is not None:
+            saveQueue.save(self, filename, "build %s-#%d"
+                           % (self.builder.name, self.number),
+                           write=buildrecord.writeBuildRecord)
+            return
         try:
-            with open(tmpfilename, "wb") as f:
-                dump(self, f, -1)
-            if runtime.platformType == 'win32':
-                # windows cannot rename a file on top of an existing one, so
-                # fall back to delete-first. There are ways this can fail and
-                # lose the builder's history, so we avoid using it in the
-                # general (non-windows) case
-                if os.path.exists(filename):
-                    os.unlink(filename)
-            os.rename(tmpfilename, filename)
+            buildrecord.writeBuildRecord(filename, self, fsync=False)
         except:
             log.msg("unable to save build %s-#%d" % (self.builder.name,
                                                      self.number))
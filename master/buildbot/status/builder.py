@@ -20,13 +20,14 @@ import itertools
 import os
 import re
 
-from cPickle import dump
 from cPickle import load
 
 from buildbot import interfaces
 from buildbot import util
 from buildbot.status.build import BuildStatus
 from buildbot.status.buildrequest import BuildRequestStatus
+from buildbot.status import buildrecord
+from buildbot.status import writebehind
 from buildbot.status.event import Event
 from buildbot.util.lru import LRUCache
 from twisted.internet import defer
@@ -76,6 +77,10 @@ class BuilderStatus(styles.Versioned):
     tags = None
     currentBigState = "offline"  # or idle/waiting/interlocked/building
     basedir = None  # filled in by our parent
+    status = None  # filled in by our parent
+
+    # the events are read from this pickle on first use; see loadEventsFrom
+    _eventsFilename = None
 
     def __init__(self, buildername, tags, master, description):
         self.name = buildername
@@ -103,6 +108,8 @@ class BuilderStatus(styles.Versioned):
         # up. Nor do we save self.watchers, nor anything that gets set by our
         # parent like .basedir and .status
         d = styles.Versioned.__getstate__(self)
+        d['events'] = self.events
+        d.pop('_eventsFilename', None)
         d['watchers'] = []
         del d['buildCache']
         for b in self.currentBuilds:
@@ -143,12 +150,67 @@ class BuilderStatus(styles.Versioned):
             del self.category
         self.wasUpgraded = True
 
+    def loadEventsFrom(self, filename):
+        """Arrange for my events to be read from the builder pickle in
+        C{filename} the first time they are needed, rather than now.  This
+        is called by the top-level Status object, so that starting a master
+        with many builders does not unpickle all of them."""
+        self._eventsFilename = filename
+        self.__dict__.pop('events', None)
+
+    def __getattr__(self, name):
+        # only called for missing attributes; 'events' is missing until
+        # loaded (this is an old-style class, so no property)
+        if name == 'events' and self._eventsFilename:
+            filename, self._eventsFilename = self._eventsFilename, None
+            self.events = []
+            self._loadEvents(filename)
+            return self.events
+        raise AttributeError(name)
+
+    def _loadEvents(self, filename):
+        log.msg("loading status pickle from %s" % filename)
+        try:
+            with open(filename, "rb") as f:
+                saved = load(f)
+
+            # (bug #1068) if we need to upgrade, we probably need to rewrite
+            # this pickle, too.  We determine this by looking at the list of
+            # Versioned objects that have been unpickled, and (after doUpgrade)
+            # checking to see if any of them set wasUpgraded.  The Versioneds'
+            # upgradeToVersionNN methods all set this.
+            versioneds = styles.versionedsToUpgrade
+            styles.doUpgrade()
+            self.events = saved.events
+            if True in [hasattr(o, 'wasUpgraded') for o in versioneds.values()]:
+                log.msg("re-writing upgraded builder pickle")
+                self.saveYourself()
+        except IOError:
+            log.msg("no saved status pickle at %s" % filename)
+        except:
+            log.msg("error while loading status pickle, ignoring it")
+            log.msg("error follows:")
+            log.err()
+
     def determineNextBuildNumber(self):
-        """Scan our directory of saved BuildStatus instances to determine
-        what our self.nextBuildNumber should be. Set it one larger than the
-        highest-numbered build we discover. This is called by the top-level
-        Status object shortly after we are created or loaded from disk.
+        """Determine what our self.nextBuildNumber should be.  This is read
+        from the small counter file that L{newBuild} keeps up to date; if it
+        is missing or stale, scan our directory of saved BuildStatus
+        instances and set it one larger than the highest-numbered build we
+        discover. This is called by the top-level Status object shortly
+        after we are created.
         """
+        try:
+            with open(os.path.join(self.basedir, "nextbuild")) as nbfile:
+                number = int(nbfile.read().strip())
+        except (IOError, ValueError):
+            number = None
+        # a master that did not keep the counter may have run since
+        if number is not None and \
+                not os.path.exists(self.makeBuildFilename(number)):
+            self.nextBuildNumber = number
+            return
+
         existing_builds = [int(f)
                            for f in os.listdir(self.basedir)
                            if re.match(r"^\d+$", f)]
@@ -157,6 +219,23 @@ class BuilderStatus(styles.Versioned):
         else:
             self.nextBuildNumber = 0
 
+    def _saveNextBuildNumber(self):
+        if not self.basedir:
+            return
+        filename = os.path.join(self.basedir, "nextbuild")
+        tmpfilename = filename + ".tmp"
+        try:
+            with open(tmpfilename, "w") as f:
+                f.write("%d\n" % self.nextBuildNumber)
+            if runtime.platformType == 'win32':
+                # windows cannot rename a file on top of an existing one
+                if os.path.exists(filename):
+                    os.unlink(filename)
+            os.rename(tmpfilename, filename)
+        except (IOError, OSError):
+            log.msg("unable to save the next build number of builder %s"
+                    % self.name)
+
     def saveYourself(self):
         for b in self.currentBuilds:
             if not b.isFinished:
@@ -164,19 +243,21 @@ class BuilderStatus(styles.Versioned):
                 # BuildStatus.saveYourself will mark it as interrupted.
                 b.saveYourself()
         filename = os.path.join(self.basedir, "builder")
-        tmpfilename = filename + ".tmp"
+        saveQueue = self.getSaveQueue()
+        if saveQueue is not None:
+            saveQueue.save(self, filename, "builder %s" % self.name)
+            return
         try:
-            with open(tmpfilename, "wb") as f:
-                dump(self, f, -1)
-            if runtime.platformType == 'win32':
-                # windows cannot rename a file on top of an existing one
-                if os.path.exists(filename):
-                    os.unlink(filename)
-            os.rename(tmpfilename, filename)
+            writebehind.writePickle(filename, self, fsync=False)
         except:
             log.msg("unable to save builder %s" % self.name)
             log.err()
 
+    def getSaveQueue(self):
+        """Return the L{SaveQueue} that writes status pickles in the
+        background, or None if I am not attached to a status object."""
+        return getattr(self.status, 'saveQueue', None)
+
     # build cache management
 
     def setCacheSize(self, size):
@@ -188,13 +269,20 @@ class BuilderStatus(styles.Versioned):
     def getBuildByNumber(self, number):
         return self.buildCache.get(number)
 
-    def loadBuildFromFile(self, number):
+    def loadBuildFromFile(self, number, withSteps=False):
+        """Load build C{number} from disk.  Unless C{withSteps}, its steps
+        are only read when they are first used."""
         filename = self.makeBuildFilename(number)
+        saveQueue = self.getSaveQueue()
+        if saveQueue is not None:
+            # a build that is still waiting to be written is still current
+            build = saveQueue.getPending(filename)
+            if build is not None:
+                return build
         try:
-            log.msg("Loading builder %s's build %d from on-disk pickle"
+            log.msg("Loading builder %s's build %d from disk"
                     % (self.name, number))
-            with open(filename, "rb") as f:
-                build = load(f)
+            build = buildrecord.readBuildRecord(filename, withSteps)
             build.setProcessObjects(self, self.master)
 
             # (bug #1068) if we need to upgrade, we probably need to rewrite
@@ -208,12 +296,14 @@ class BuilderStatus(styles.Versioned):
                 log.msg("re-writing upgraded build pickle")
                 build.saveYourself()
 
-            # check that logfiles exist
-            build.checkLogfiles()
+            # check that logfiles exist, unless that is left for when the
+            # steps are read
+            if 'steps' in build.__dict__:
+                build.checkLogfiles()
             return build
         except IOError:
             raise IndexError("no such build %d" % number)
-        except EOFError:
+        except (EOFError, buildrecord.RecordError):
             raise IndexError("corrupted build pickle %d" % number)
 
     def cacheMiss(self, number, **kwargs):
@@ -230,15 +320,10 @@ class BuilderStatus(styles.Versioned):
         # then fall back to loading it from disk
         return self.loadBuildFromFile(number)
 
-    def prune(self, events_only=False):
-        # begin by pruning our own events
-        eventHorizon = self.master.config.eventHorizon
-        self.events = self.events[-eventHorizon:]
-
-        if events_only:
-            return
-
-        # get the horizons straight
+    def getPruneHorizons(self):
+        """Return (earliest_build, earliest_log): the numbers of the oldest
+        build whose pickle, and of the oldest build whose logs, should be
+        kept according to buildHorizon and logHorizon."""
         buildHorizon = self.master.config.buildHorizon
         if buildHorizon is not None:
             earliest_build = self.nextBuildNumber - buildHorizon
@@ -253,7 +338,17 @@ class BuilderStatus(styles.Versioned):
 
         if earliest_log < earliest_build:
             earliest_log = earliest_build
+        return earliest_build, earliest_log
+
+    def prune(self, events_only=False):
+        # begin by pruning our own events
+        eventHorizon = self.master.config.eventHorizon
+        self.events = self.events[-eventHorizon:]
+
+        if events_only:
+            return
 
+        earliest_build, earliest_log = self.getPruneHorizons()
         if earliest_build == 0:
             return
 
@@ -397,10 +492,15 @@ class BuilderStatus(styles.Versioned):
                                filter_fn=None):
         got = 0
         branches = set(branches)
-        for Nb in itertools.count(1):
+        # builds above max_buildnum are not looked at, nor counted against
+        # max_search
+        first = 1
+        if max_buildnum is not None:
+            first = max(1, self.nextBuildNumber - max_buildnum)
+        for Nb in itertools.count(first):
             if Nb > self.nextBuildNumber:
                 break
-            if Nb > max_search:
+            if Nb - first >= max_search:
                 break
             build = self.getBuild(-Nb)
             if build is None:
@@ -551,6 +651,7 @@ class BuilderStatus(styles.Versioned):
         Steps). Create a BuildStatus object that it can use."""
         number = self.nextBuildNumber
         self.nextBuildNumber += 1
+        self._saveNextBuildNumber()
         # TODO: self.saveYourself(), to make sure we don't forget about the
         # build number we've just allocated. This is not quite as important
         # as it was before we switch to determineNextBuildNumber, but I think
@@ -570,6 +671,13 @@ class BuilderStatus(styles.Versioned):
         self.currentBuilds.append(s)
         self.buildCache.get(s.number, val=s)
 
+        slaveBuilds = getattr(self.status, 'slaveBuilds', None)
+        if slaveBuilds is not None:
+            slaveBuilds.buildStarted(self.getName(), s)
+        grid = getattr(self.status, 'gridMatrix', None)
+        if grid is not None:
+            grid.buildStarted(self.getName(), s)
+
         # now that the BuildStatus is prepared to answer queries, we can
         # announce the new build to all our watchers
 
@@ -601,7 +709,41 @@ class BuilderStatus(styles.Versioned):
                 log.msg("Exception caught notifying %r of buildFinished event" % w)
                 log.err()
 
-        self.prune()  # conserve disk
+        history = self.getDurationHistory()
+        if history is not None:
+            history.addBuild(name, s)
+        recent = getattr(self.status, 'recentBuilds', None)
+        if recent is not None:
+            recent.addBuild(name, s)
+        slaveBuilds = getattr(self.status, 'slaveBuilds', None)
+        if slaveBuilds is not None:
+            slaveBuilds.buildFinished(name, s)
+        grid = getattr(self.status, 'gridMatrix', None)
+        if grid is not None:
+            grid.buildFinished(name, s)
+
+        # conserve disk, in the background if the status has a janitor
+        janitor = getattr(self.status, 'janitor', None)
+        if janitor is not None:
+            janitor.schedule(self, s)
+        else:
+            self.prune()
+
+    def getDurationHistory(self):
+        """Return the L{DurationHistory} shared by all builders, or None if
+        I am not attached to a status object."""
+        return getattr(self.status, 'durations', None)
+
+    def getExpectedDuration(self, stepname=None, percentile=50):
+        """Return the expected duration in seconds of one of my builds, or
+        of the named step within it, based on recent successful builds.
+        Returns None if there is no history yet."""
+        history = self.getDurationHistory()
+        if history is None:
+            return None
+        if stepname is None:
+            return history.getBuildDuration(self.name, percentile)
+        return history.getStepDuration(self.name, stepname, percentile)
 
     def asDict(self):
         result = {}
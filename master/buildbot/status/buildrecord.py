@@ -0,0 +1,161 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Build records: the on-disk format of a finished build.
+
+A build record is a short signature line followed by length-prefixed
+sections::
+
+    BBREC 1
+    header <length>
+    <the build, without its steps, pickled>
+    steps <length>
+    <the list of its steps, pickled>
+
+Reading the header gives the build's times, results, text, source stamps
+and properties without unpickling any step or log; the steps are read from
+their offset in the file only if they are needed.  Builds saved by older
+masters are plain pickles of the whole build, which are still read, and are
+converted by L{upgradeDirectory} (run by C{buildbot upgrade-master}).
+"""
+
+from __future__ import with_statement
+
+import cPickle
+import os
+import re
+
+from buildbot.status import writebehind
+from twisted.persisted import styles
+from twisted.python import log
+
+MAGIC = 'BBREC'
+VERSION = 1
+
+build_re = re.compile(r"^[0-9]+$")
+
+
+class RecordError(Exception):
+    pass
+
+
+def writeBuildRecord(filename, build, fsync=True):
+    """Write C{build}, a L{BuildStatus} or a snapshot of one, to
+    C{filename} as a build record."""
+    state = dict(build.__getstate__())
+    steps = state.pop('steps', [])
+    header = writebehind.frozen(build.__class__, state)
+
+    def write(f):
+        f.write('%s %d\n' % (MAGIC, VERSION))
+        _writeSection(f, 'header', header)
+        _writeSection(f, 'steps', steps)
+    writebehind.writeAtomically(filename, write, fsync)
+
+
+def _writeSection(f, name, obj):
+    data = cPickle.dumps(obj, -1)
+    f.write('%s %d\n' % (name, len(data)))
+    f.write(data)
+
+
+def _readSection(f, name):
+    line = f.readline()
+    try:
+        got, length = line.split()
+        length = int(length)
+    except ValueError:
+        raise RecordError("bad section line %r" % line)
+    if got != name:
+        raise RecordError("expected section %r, got %r" % (name, got))
+    data = f.read(length)
+    if len(data) != length:
+        raise EOFError("truncated section %r" % name)
+    return cPickle.loads(data)
+
+
+def isBuildRecord(f):
+    """Return True if the open file C{f} holds a build record, leaving it
+    positioned after the signature line if so and at its start if not."""
+    line = f.readline()
+    if not line.startswith(MAGIC + ' '):
+        f.seek(0)
+        return False
+    version = line.split()[1]
+    if version != str(VERSION):
+        raise RecordError("unknown build record version %r" % version)
+    return True
+
+
+def readBuildRecord(filename, withSteps=False):
+    """Load a build from C{filename}, a build record or an old build pickle.
+
+    From a build record, only the header is read unless C{withSteps}; the
+    build is told where to find its steps (see
+    L{BuildStatus.loadStepsFrom}).  Raises IOError or EOFError if the file
+    is missing or truncated."""
+    with open(filename, "rb") as f:
+        if not isBuildRecord(f):
+            return cPickle.load(f)
+        build = _readSection(f, 'header')
+        if withSteps:
+            build.steps = _readSection(f, 'steps')
+        else:
+            build.loadStepsFrom(filename, f.tell())
+    return build
+
+
+def readSteps(filename, offset):
+    """Read the steps of the build record in C{filename}, whose steps
+    section starts at C{offset}."""
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        return _readSection(f, 'steps')
+
+
+def convertBuild(filename):
+    """Rewrite the old build pickle C{filename} as a build record.  Returns
+    False if it already is one."""
+    with open(filename, "rb") as f:
+        if isBuildRecord(f):
+            return False
+        build = cPickle.load(f)
+    styles.doUpgrade()
+    # the steps and logs expect these to be set, so they can drop them
+    build.setProcessObjects(None, None)
+    writeBuildRecord(filename, build)
+    return True
+
+
+def upgradeDirectory(dirname):
+    """Convert the old build pickles in the builder directory C{dirname}
+    to build records.  Returns the number of builds converted and a list
+    of the files that could not be (which are logged and left alone)."""
+    converted = 0
+    failed = []
+    for name in sorted(os.listdir(dirname)):
+        if not build_re.match(name):
+            continue
+        filename = os.path.join(dirname, name)
+        if not os.path.isfile(filename):
+            continue
+        try:
+            if convertBuild(filename):
+                converted += 1
+        except Exception:
+            log.err(None, "while converting build pickle %s" % filename)
+            failed.append(filename)
+    return converted, failed
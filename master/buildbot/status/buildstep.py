@@ -136,11 +136,15 @@ class BuildStepStatus(styles.Versioned):
     # while the step is running, the following methods make sense.
     # Afterwards they return None
 
-    def getETA(self):
+    def getETA(self, percentile=50):
         if self.started is None:
             return None  # not started yet
         if self.finished is not None:
             return None  # already finished
+        expected = self.build.getBuilder().getExpectedDuration(self.name,
+                                                               percentile)
+        if expected is not None:
+            return max(expected - (util.now() - self.started), 0)
         if not self.progress:
             return None  # no way to predict
         return self.progress.remaining()
@@ -0,0 +1,177 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from collections import deque
+
+from buildbot import util
+from buildbot.status.results import SKIPPED
+from buildbot.status.results import SUCCESS
+from buildbot.status.results import WARNINGS
+from buildbot.status.statefile import StateFile
+
+
+class DurationSketch(object):
+
+    """I keep the most recent durations of one thing (a whole build, or one
+    step of it) and answer percentile queries over them.
+
+    Only the last C{size} samples are kept, so the answers follow changes in
+    build times without being dominated by old history.
+    """
+
+    size = 50
+
+    def __init__(self, samples=(), size=None):
+        if size is not None:
+            self.size = size
+        self.samples = deque(samples, self.size)
+        self._sorted = None
+
+    def add(self, duration):
+        self.samples.append(round(duration, 1))
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, p):
+        """Return the C{p}th percentile (0-100) of the samples, interpolating
+        between neighbours, or None if there are no samples."""
+        if not self.samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        values = self._sorted
+        rank = (len(values) - 1) * min(max(p, 0), 100) / 100.0
+        lo = int(rank)
+        hi = min(lo + 1, len(values) - 1)
+        return values[lo] + (values[hi] - values[lo]) * (rank - lo)
+
+
+class DurationHistory(StateFile):
+
+    """I hold a L{DurationSketch} for every builder and for every step name
+    within each builder, and persist them to a small JSON state file.
+
+    Only builds and steps that ended in SUCCESS or WARNINGS are recorded, as
+    failing runs usually stop early and would drag the estimates down.
+    Steps are keyed by name, so steps added while a build runs are tracked
+    like any other.
+    """
+
+    description = 'duration history'
+
+    def __init__(self, filename=None):
+        StateFile.__init__(self, filename)
+        self.builds = {}
+        self.steps = {}
+
+    # recording
+
+    def addBuild(self, buildername, build_status):
+        """Record the durations of a finished build and its steps."""
+        if build_status.getResults() not in (SUCCESS, WARNINGS):
+            return
+        start, end = build_status.getTimes()
+        if start is None or end is None:
+            return
+        self._sketch(self.builds, buildername).add(end - start)
+
+        steps = self.steps.setdefault(buildername, {})
+        for step in build_status.getSteps():
+            if not step.isFinished():
+                continue
+            result = step.getResults()[0]
+            if result not in (SUCCESS, WARNINGS):
+                continue
+            start, end = step.getTimes()
+            if start is None or end is None:
+                continue
+            self._sketch(steps, step.getName()).add(end - start)
+        self.changed()
+
+    def _sketch(self, d, key):
+        try:
+            return d[key]
+        except KeyError:
+            s = d[key] = DurationSketch()
+            return s
+
+    # queries
+
+    def getBuildDuration(self, buildername, percentile=50):
+        """Return the expected duration of a whole build, or None."""
+        sketch = self.builds.get(buildername)
+        if sketch is None:
+            return None
+        return sketch.percentile(percentile)
+
+    def getStepDuration(self, buildername, stepname, percentile=50):
+        """Return the expected duration of the named step, or None."""
+        sketch = self.steps.get(buildername, {}).get(stepname)
+        if sketch is None:
+            return None
+        return sketch.percentile(percentile)
+
+    def getRemainingTime(self, buildername, build_status, percentile=50):
+        """Estimate the seconds left in a running build.
+
+        If every unfinished step has a history, this is the sum of their
+        expected remaining times; otherwise it is the expected build
+        duration less the time elapsed so far.  Returns None if there is no
+        history to go on."""
+        now = util.now()
+        remaining = 0
+        for step in build_status.getSteps():
+            if step.isFinished():
+                continue
+            if step.isHidden() and step.getResults()[0] == SKIPPED:
+                continue
+            expected = self.getStepDuration(buildername, step.getName(),
+                                            percentile)
+            if expected is None:
+                remaining = None
+                break
+            started = step.getTimes()[0]
+            if started is not None:
+                expected = max(expected - (now - started), 0)
+            remaining += expected
+        if remaining is not None:
+            return remaining
+
+        expected = self.getBuildDuration(buildername, percentile)
+        started = build_status.getTimes()[0]
+        if expected is None or started is None:
+            return None
+        return max(expected - (now - started), 0)
+
+    # persistence
+
+    def asDict(self):
+        return {
+            'version': self.version,
+            'builds': dict((name, list(s.samples))
+                           for name, s in self.builds.iteritems()),
+            'steps': dict((name, dict((stepname, list(s.samples))
+                                      for stepname, s in steps.iteritems()))
+                          for name, steps in self.steps.iteritems()),
+        }
+
+    def fromDict(self, data):
+        self.builds = dict((name, DurationSketch(samples))
+                           for name, samples in data['builds'].iteritems())
+        self.steps = dict((name, dict((stepname, DurationSketch(samples))
+                                      for stepname, samples in steps.iteritems()))
+                          for name, steps in data['steps'].iteritems())
@@ -0,0 +1,453 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import heapq
+
+from collections import deque
+
+from buildbot.status.statefile import StateFile
+from buildbot.util import now
+from buildbot.util.bbcollections import OrderedDict
+
+
+class BuildSummary(object):
+
+    """A small record of a finished build: enough to filter on and to find
+    the build again, without loading its pickle."""
+
+    __slots__ = ['builder', 'number', 'start', 'end', 'results', 'branches']
+
+    def __init__(self, builder, number, start, end, results, branches):
+        self.builder = builder
+        self.number = number
+        self.start = start
+        self.end = end
+        self.results = results
+        self.branches = branches
+
+    @classmethod
+    def fromBuild(cls, buildername, build_status):
+        start, end = build_status.getTimes()
+        branches = sorted(set(ss.branch
+                              for ss in build_status.getSourceStamps()))
+        return cls(buildername, build_status.getNumber(), start, end,
+                   build_status.getResults(), branches)
+
+    def asList(self):
+        return [self.builder, self.number, self.start, self.end,
+                self.results, self.branches]
+
+    def __repr__(self):
+        return "<BuildSummary %s #%d>" % (self.builder, self.number)
+
+
+def sourceStampSummary(ss):
+    """Return what the build lines show of a source stamp:
+    C{[repository, codebase, branch, revision, specified]}, where
+    C{specified} is false if it has no branch, revision, patch or
+    changes."""
+    return [ss.repository, ss.codebase, ss.branch, ss.revision,
+            bool(ss.branch or ss.revision or ss.patch or ss.changes)]
+
+
+class SlaveBuildSummary(object):
+
+    """What the buildslave pages show of a build on a slave: enough to draw
+    its line without loading its pickle.  C{end} and C{results} are None
+    while the build is running.  C{sources} holds a L{sourceStampSummary}
+    for each source stamp, and C{got_revisions} the revisions the build
+    got, once it has finished."""
+
+    __slots__ = ['builder', 'number', 'start', 'end', 'results', 'text',
+                 'reason', 'sources', 'got_revisions', 'interested_users']
+
+    def __init__(self, builder, number, start, end, results, text, reason,
+                 sources, got_revisions, interested_users):
+        self.builder = builder
+        self.number = number
+        self.start = start
+        self.end = end
+        self.results = results
+        self.text = text
+        self.reason = reason
+        self.sources = sources
+        self.got_revisions = got_revisions
+        self.interested_users = interested_users
+
+    @classmethod
+    def fromBuild(cls, buildername, build_status):
+        start, end = build_status.getTimes()
+        if build_status.isFinished():
+            results = build_status.getResults()
+            text = " ".join(build_status.getText())
+            got_revisions = build_status.getAllGotRevisions() or {}
+        else:
+            results = text = None
+            got_revisions = {}
+        sources = [sourceStampSummary(ss)
+                   for ss in build_status.getSourceStamps()]
+        return cls(buildername, build_status.getNumber(), start, end,
+                   results, text, build_status.getReason(), sources,
+                   got_revisions, build_status.getInterestedUsers())
+
+    def asList(self):
+        return [self.builder, self.number, self.start, self.end,
+                self.results, self.text, self.reason, self.sources,
+                self.got_revisions, self.interested_users]
+
+    def __repr__(self):
+        return "<SlaveBuildSummary %s #%d>" % (self.builder, self.number)
+
+
+def sourceStampKey(sourcestamps):
+    """Return the key under which the grid views put builds of
+    C{sourcestamps} in the same row: builds of the same version of the
+    code, even if their source stamps differ in minor details."""
+    return tuple([(ss.branch, ss.revision, ss.patch, ss.codebase,
+                   ss.project) for ss in sourcestamps])
+
+
+class GridCell(object):
+
+    """What the grid views show of a build: its number, and its results
+    and text once it has finished (both None while it is running)."""
+
+    __slots__ = ['number', 'results', 'text']
+
+    def __init__(self, number, results, text):
+        self.number = number
+        self.results = results
+        self.text = text
+
+    @classmethod
+    def fromBuild(cls, build_status):
+        if build_status.isFinished():
+            return cls(build_status.getNumber(), build_status.getResults(),
+                       build_status.getText())
+        return cls(build_status.getNumber(), None, None)
+
+    def asList(self):
+        return [self.number, self.results, self.text]
+
+
+class GridRow(object):
+
+    """A row of the grid: the source stamps of a version of the code, the
+    earliest start of a build of it, and the latest build of it on each
+    builder.  C{sources} holds the parts of each source stamp that the
+    grid shows."""
+
+    __slots__ = ['key', 'sources', 'start', 'cells']
+
+    def __init__(self, key, sources, start, cells=None):
+        self.key = key
+        self.sources = sources
+        self.start = start
+        self.cells = cells or {}  # builder name -> GridCell
+
+    @classmethod
+    def fromBuild(cls, build_status):
+        sourcestamps = build_status.getSourceStamps(absolute=True)
+        sources = [dict(project=ss.project, codebase=ss.codebase,
+                        repository=ss.repository, branch=ss.branch,
+                        revision=ss.revision, hasPatch=ss.patch is not None)
+                   for ss in sourcestamps]
+        return cls(sourceStampKey(sourcestamps), sources,
+                   build_status.getTimes()[0])
+
+    def asList(self):
+        return [self.key, self.sources, self.start,
+                dict((name, cell.asList())
+                     for name, cell in self.cells.iteritems())]
+
+    def __repr__(self):
+        return "<GridRow %r>" % (self.key,)
+
+
+class RecentBuilds(StateFile):
+
+    """I keep summaries of the last C{size} builds to finish on this master,
+    across all builders, in the order they finished, and persist them to a
+    small JSON state file so that they survive a restart."""
+
+    description = 'recent builds'
+    size = 1000
+
+    def __init__(self, filename=None, size=None):
+        StateFile.__init__(self, filename)
+        if size is not None:
+            self.size = size
+        self.summaries = deque(maxlen=self.size)
+
+    def addBuild(self, buildername, build_status):
+        """Record a build that has just finished."""
+        self.summaries.append(BuildSummary.fromBuild(buildername,
+                                                     build_status))
+        self.changed()
+
+    def __len__(self):
+        return len(self.summaries)
+
+    def __iter__(self):
+        """Iterate over the summaries, most recently finished first."""
+        return reversed(self.summaries)
+
+    def oldestEnd(self):
+        """Return the finish time of the oldest build I know about, or None
+        if I know of none.  Every build that finished later is one of mine
+        (unless it finished before I was first loaded)."""
+        if not self.summaries:
+            return None
+        return self.summaries[0].end
+
+    def asDict(self):
+        return {
+            'version': self.version,
+            'builds': [s.asList() for s in self.summaries],
+        }
+
+    def fromDict(self, data):
+        # keep anything recorded before we were loaded
+        summaries = deque((BuildSummary(*fields)
+                           for fields in data['builds']),
+                          maxlen=self.size)
+        summaries.extend(self.summaries)
+        self.summaries = summaries
+
+
+class SlaveBuilds(StateFile):
+
+    """I keep summaries of the last C{size} builds of each buildslave, so
+    that the buildslave pages need not search the builders' histories for
+    builds that ran on a slave.  A build is recorded when it starts and
+    updated when it finishes.  C{completeSince} is the time from which I
+    have recorded every build, or None until I am started."""
+
+    description = 'slave builds'
+    version = 2
+    size = 50
+
+    def __init__(self, filename=None, size=None):
+        StateFile.__init__(self, filename)
+        if size is not None:
+            self.size = size
+        self.slaves = {}  # slavename -> deque of SlaveBuildSummary
+        self.completeSince = None
+
+    def start(self):
+        StateFile.start(self)
+        if self.completeSince is None:
+            # nothing was loaded: every build from now on is recorded; this
+            # is saved with the first build, or when stopped
+            self.completeSince = now()
+            self.dirty = True
+
+    def _summaries(self, slavename):
+        summaries = self.slaves.get(slavename)
+        if summaries is None:
+            summaries = self.slaves[slavename] = deque(maxlen=self.size)
+        return summaries
+
+    def buildStarted(self, buildername, build_status):
+        slavename = build_status.getSlavename()
+        if not slavename:
+            return
+        self._summaries(slavename).append(
+            SlaveBuildSummary.fromBuild(buildername, build_status))
+        self.changed()
+
+    def buildFinished(self, buildername, build_status):
+        slavename = build_status.getSlavename()
+        if not slavename:
+            return
+        summaries = self._summaries(slavename)
+        summary = SlaveBuildSummary.fromBuild(buildername, build_status)
+        # the build is usually one of the last few to have started
+        for i in xrange(len(summaries) - 1, -1, -1):
+            old = summaries[i]
+            if old.builder == buildername and old.number == summary.number:
+                summaries[i] = summary
+                break
+        else:
+            summaries.append(summary)
+        self.changed()
+
+    def getFinishedBuilds(self, slavename):
+        """Return the summaries of the finished builds of C{slavename} that
+        I know about, most recently finished first."""
+        return sorted((s for s in self.slaves.get(slavename, ())
+                       if s.end is not None),
+                      key=lambda s: s.end, reverse=True)
+
+    def asDict(self):
+        return {
+            'version': self.version,
+            'complete_since': self.completeSince,
+            'slaves': dict((slavename, [s.asList() for s in summaries])
+                           for slavename, summaries in self.slaves.iteritems()),
+        }
+
+    def fromDict(self, data):
+        self.completeSince = data.get('complete_since')
+        for slavename, builds in data['slaves'].iteritems():
+            # builds that were running when the master stopped never finished
+            loaded = [SlaveBuildSummary(*fields) for fields in builds
+                      if fields[3] is not None]
+            summaries = deque(loaded, maxlen=self.size)
+            # keep anything recorded before we were loaded
+            summaries.extend(self.slaves.get(slavename, ()))
+            self.slaves[slavename] = summaries
+
+
+class GridMatrix(StateFile):
+
+    """I keep the source stamp by builder matrix that the grid views show,
+    up to date as builds start and finish, so that drawing the grid does not
+    load any build.  I keep the last C{size} rows of each branch (that of a
+    build's first source stamp), and the rows of the last C{maxBranches}
+    branches to be built."""
+
+    description = 'grid'
+    size = 50
+    maxBranches = 100
+
+    def __init__(self, filename=None, size=None):
+        StateFile.__init__(self, filename)
+        if size is not None:
+            self.size = size
+        # branch -> OrderedDict of key -> GridRow, both oldest first
+        self.branches = OrderedDict()
+        # (builder name, build number) -> key of the row of a running build
+        self.running = {}
+
+    def _branch(self, build_status):
+        sourcestamps = build_status.getSourceStamps()
+        return sourcestamps[0].branch if sourcestamps else None
+
+    def _rows(self, branch):
+        rows = self.branches.pop(branch, None)
+        if rows is None:
+            rows = OrderedDict()
+            if len(self.branches) >= self.maxBranches:
+                self.branches.popitem(last=False)
+        self.branches[branch] = rows
+        return rows
+
+    def _addCell(self, rows, row, buildername, build_status):
+        if row.key in rows:
+            existing = rows[row.key]
+            existing.start = min(existing.start, row.start)
+            row = existing
+        else:
+            rows[row.key] = row
+            while len(rows) > self.size:
+                rows.popitem(last=False)
+        old = row.cells.get(buildername)
+        if old is None or old.number <= build_status.getNumber():
+            row.cells[buildername] = GridCell.fromBuild(build_status)
+        return row
+
+    def buildStarted(self, buildername, build_status):
+        rows = self._rows(self._branch(build_status))
+        row = self._addCell(rows, GridRow.fromBuild(build_status),
+                            buildername, build_status)
+        self.running[(buildername, build_status.getNumber())] = row.key
+        self.changed()
+
+    def buildFinished(self, buildername, build_status):
+        number = build_status.getNumber()
+        startKey = self.running.pop((buildername, number), None)
+        rows = self._rows(self._branch(build_status))
+        row = GridRow.fromBuild(build_status)
+        # a build of the latest revision gets its row once it knows which
+        # revision that was
+        if startKey is not None and startKey != row.key and startKey in rows:
+            started = rows[startKey]
+            cell = started.cells.get(buildername)
+            if cell is not None and cell.number == number:
+                del started.cells[buildername]
+                if not started.cells:
+                    del rows[startKey]
+        self._addCell(rows, row, buildername, build_status)
+        self.changed()
+
+    def getRows(self, num, builders, branches=None):
+        """Return the last C{num} rows, by earliest start, that have a build
+        on one of C{builders}, of the given branches (or of any branch),
+        oldest first."""
+        if branches is None:
+            candidates = [rows.itervalues()
+                          for rows in self.branches.itervalues()]
+        else:
+            candidates = [self.branches[b].itervalues() for b in branches
+                          if b in self.branches]
+        builders = set(builders)
+        rows = (row for rows in candidates for row in rows
+                if not builders.isdisjoint(row.cells))
+        return sorted(heapq.nlargest(num, rows, key=lambda row: row.start),
+                      key=lambda row: row.start)
+
+    def asDict(self):
+        return {
+            'version': self.version,
+            'branches': [[branch, [row.asList() for row in rows.itervalues()]]
+                         for branch, rows in self.branches.iteritems()],
+        }
+
+    def fromDict(self, data):
+        loaded = OrderedDict()
+        for branch, rows in data['branches']:
+            loaded[branch] = branchRows = OrderedDict()
+            for key, sources, start, cells in rows:
+                # JSON has no tuples; patches are tuples within the key
+                key = tuple(tuple(tuple(f) if isinstance(f, list) else f
+                                  for f in ss) for ss in key)
+                # builds that were running when the master stopped never
+                # finished
+                cells = dict((name, GridCell(*fields))
+                             for name, fields in cells.iteritems()
+                             if fields[1] is not None)
+                branchRows[key] = GridRow(key, sources, start, cells)
+        # keep anything recorded before we were loaded
+        for branch, rows in self.branches.iteritems():
+            branchRows = loaded.pop(branch, OrderedDict())
+            branchRows.update(rows)
+            while len(branchRows) > self.size:
+                branchRows.popitem(last=False)
+            loaded[branch] = branchRows
+        while len(loaded) > self.maxBranches:
+            loaded.popitem(last=False)
+        self.branches = loaded
+
+
+def mergeFinishedBuilds(generators):
+    """Merge generators that each produce finished builds, most recently
+    finished first, into one generator in the same order.  Only the head of
+    each generator is held, in a heap, so taking the next build costs
+    O(log k) for k generators."""
+    heap = []
+    for i, g in enumerate(generators):
+        for build in g:
+            heap.append((-build.getTimes()[1], i, build, g))
+            break
+    heapq.heapify(heap)
+    while heap:
+        _, i, build, g = heap[0]
+        yield build
+        for nextbuild in g:
+            heapq.heapreplace(heap, (-nextbuild.getTimes()[1], i, nextbuild, g))
+            break
+        else:
+            heapq.heappop(heap)
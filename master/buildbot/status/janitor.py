@@ -0,0 +1,253 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import bisect
+import os
+import re
+
+from buildbot.process import metrics
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet import threads
+from twisted.python import log
+
+build_re = re.compile(r"^([0-9]+)$")
+build_log_re = re.compile(r"^([0-9]+)-.*$")
+
+# suffixes a log file may have gained by being compressed
+LOG_SUFFIXES = ('', '.bz2', '.gz')
+
+
+class BuildFileIndex(object):
+
+    """I list the build pickles and log files of one builder directory,
+    sorted by build number, so that the files of expired builds can be
+    found without listing the directory again."""
+
+    def __init__(self):
+        self.builds = []  # build numbers with a pickle, ascending
+        self.lognums = []  # build numbers with log files, ascending
+        self.logfiles = {}  # build number -> log filenames
+
+    @classmethod
+    def fromListing(cls, filenames):
+        index = cls()
+        for filename in filenames:
+            mo = build_re.match(filename)
+            if mo:
+                index._addPickle(int(mo.group(1)))
+                continue
+            mo = build_log_re.match(filename)
+            if mo:
+                index._addLogfiles(int(mo.group(1)), [filename])
+        return index
+
+    def addBuild(self, number, logfilenames):
+        """Record the pickle of build C{number} and the log files it may
+        have (given relative to the builder directory)."""
+        self._addPickle(number)
+        self._addLogfiles(number, logfilenames)
+
+    def _addPickle(self, number):
+        i = bisect.bisect_left(self.builds, number)
+        if i == len(self.builds) or self.builds[i] != number:
+            self.builds.insert(i, number)
+
+    def _addLogfiles(self, number, logfilenames):
+        if not logfilenames:
+            return
+        if number not in self.logfiles:
+            bisect.insort(self.lognums, number)
+            self.logfiles[number] = set()
+        self.logfiles[number].update(logfilenames)
+
+    def __len__(self):
+        return len(self.builds) + len(self.lognums)
+
+    def expire(self, earliest_build, earliest_log, keep=()):
+        """Forget, and return the filenames of, the pickles of builds before
+        C{earliest_build} and the logs of builds before C{earliest_log},
+        except for the build numbers in C{keep}."""
+        expired = []
+
+        i = bisect.bisect_left(self.builds, earliest_build)
+        kept = []
+        for number in self.builds[:i]:
+            if number in keep:
+                kept.append(number)
+            else:
+                expired.append("%d" % number)
+        self.builds[:i] = kept
+
+        i = bisect.bisect_left(self.lognums, max(earliest_log, earliest_build))
+        kept = []
+        for number in self.lognums[:i]:
+            if number in keep:
+                kept.append(number)
+            else:
+                expired.extend(sorted(self.logfiles.pop(number)))
+        self.lognums[:i] = kept
+
+        return expired
+
+
+class HorizonJanitor(object):
+
+    """I remove builds and logs older than C{buildHorizon} and
+    C{logHorizon} from the builder directories in the background, so that
+    finishing a build does not wait for its builder directory to be pruned.
+
+    Builders are queued with L{schedule}, and while I am running I make one
+    pass every C{interval} seconds.  A pass works out which files of the
+    next queued builder have expired, using a L{BuildFileIndex} of its
+    directory, and then deletes at most C{batchSize} expired files in a
+    worker thread.  The directory is only listed the first time a builder
+    is pruned; after that the index is kept up to date as builds finish.
+
+    C{bytesReclaimed} and C{backlog} (the number of expired files still to
+    be deleted) are also reported as the C{HorizonJanitor.bytes_reclaimed}
+    and C{HorizonJanitor.backlog} metrics.
+    """
+
+    interval = 5
+    batchSize = 100
+
+    def __init__(self, interval=None, batchSize=None):
+        if interval is not None:
+            self.interval = interval
+        if batchSize is not None:
+            self.batchSize = batchSize
+        self.queue = []
+        self.indexes = {}  # builder basedir -> BuildFileIndex
+        self.pending = []  # absolute paths of expired files
+        self.bytesReclaimed = 0
+        self.running = False
+        self._call = None
+        self._pass = None
+        # for tests
+        self._reactor = reactor
+
+    @property
+    def backlog(self):
+        return len(self.pending)
+
+    def schedule(self, builder_status, build_status=None):
+        """Queue C{builder_status} to be pruned.  If C{build_status}, a
+        build of that builder which has just finished, is given, its files
+        are added to the builder's index."""
+        if build_status is not None:
+            index = self.indexes.get(builder_status.basedir)
+            if index is not None:
+                logfilenames = [l.filename + suffix
+                                for l in build_status.getLogs()
+                                if l.filename
+                                for suffix in LOG_SUFFIXES]
+                index.addBuild(build_status.getNumber(), logfilenames)
+        if builder_status not in self.queue:
+            self.queue.append(builder_status)
+        self._wake()
+
+    def start(self):
+        self.running = True
+        self._wake()
+
+    def stop(self):
+        """Stop pruning; returns a Deferred that fires when any deletion in
+        progress has finished."""
+        self.running = False
+        if self._call:
+            self._call.cancel()
+            self._call = None
+        if self._pass:
+            d = defer.Deferred()
+            self._pass.addBoth(lambda res: d.callback(None) or res)
+            return d
+        return defer.succeed(None)
+
+    def _wake(self):
+        if not self.running or self._call or self._pass:
+            return
+        if self.queue or self.pending:
+            self._call = self._reactor.callLater(self.interval, self._startPass)
+
+    def _startPass(self):
+        self._call = None
+        d = self._pass = self._doPass()
+        d.addErrback(log.err, "while pruning builder directories")
+
+        @d.addCallback
+        def done(_):
+            self._pass = None
+            self._wake()
+
+    @defer.inlineCallbacks
+    def _doPass(self):
+        if self.queue:
+            builder_status = self.queue.pop(0)
+            try:
+                yield self._expire(builder_status)
+            except Exception:
+                log.err(None, "while pruning builder %s"
+                        % builder_status.getName())
+
+        batch = self.pending[:self.batchSize]
+        if batch:
+            reclaimed = yield threads.deferToThread(self._unlinkAll, batch)
+            del self.pending[:len(batch)]
+            self.bytesReclaimed += reclaimed
+            log.msg("janitor: pruned %d files, %d bytes; %d files left"
+                    % (len(batch), reclaimed, len(self.pending)))
+            metrics.MetricCountEvent.log("HorizonJanitor.bytes_reclaimed",
+                                         reclaimed)
+        metrics.MetricCountEvent.log("HorizonJanitor.backlog",
+                                     len(self.pending), absolute=True)
+
+    @defer.inlineCallbacks
+    def _expire(self, builder_status):
+        basedir = builder_status.basedir
+        earliest_build, earliest_log = builder_status.getPruneHorizons()
+        if earliest_build <= 0 or not basedir:
+            return
+
+        index = self.indexes.get(basedir)
+        if index is None:
+            filenames = yield threads.deferToThread(self._listdir, basedir)
+            index = self.indexes[basedir] = \
+                BuildFileIndex.fromListing(filenames)
+
+        keep = set(builder_status.buildCache.cache)
+        self.pending.extend(os.path.join(basedir, filename)
+                            for filename in index.expire(earliest_build,
+                                                         earliest_log, keep))
+
+    @staticmethod
+    def _listdir(basedir):
+        # runs in a worker thread
+        if not os.path.exists(basedir):
+            return []
+        return os.listdir(basedir)
+
+    @staticmethod
+    def _unlinkAll(paths):
+        # runs in a worker thread
+        reclaimed = 0
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+                os.unlink(path)
+            except OSError:
+                continue
+            reclaimed += size
+        return reclaimed
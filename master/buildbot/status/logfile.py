@@ -13,9 +13,11 @@
 #
 # Copyright Buildbot Team Members
 
+import itertools
 import os
 
 from bz2 import BZ2File
+from collections import deque
 from cStringIO import StringIO
 from gzip import GzipFile
 
@@ -418,6 +420,32 @@ class LogFile:
         io = StringIO(alltext)
         return io.readlines()
 
+    def iterLines(self, channels=[STDOUT, STDERR]):
+        """Generate the lines of the given channels, with their trailing
+        newlines, reading the log a chunk at a time."""
+        assert not self._isNewStyle, "not available in new-style steps"
+        pending = []
+        for text in self.getChunks(channels, onlyText=True):
+            pending.append(text)
+            if '\n' not in text:
+                continue
+            lines = ''.join(pending).split('\n')
+            pending = [lines.pop()]
+            for line in lines:
+                yield line + '\n'
+        rest = ''.join(pending)
+        if rest:
+            yield rest
+
+    def getHead(self, lines=20, channels=[STDOUT, STDERR]):
+        """Return a list of the first C{lines} lines of the log."""
+        return list(itertools.islice(self.iterLines(channels), lines))
+
+    def getTail(self, lines=20, channels=[STDOUT, STDERR]):
+        """Return a list of the last C{lines} lines of the log.  The whole
+        log is read, but only C{lines} lines are kept in memory."""
+        return list(deque(self.iterLines(channels), lines))
+
     def subscribe(self, receiver, catchup):
         assert not self._isNewStyle, "not available in new-style steps"
         if self.finished:
@@ -14,19 +14,24 @@
 # Copyright Buildbot Team Members
 
 
+import codecs
 import re
 import types
 import urllib
 
 from StringIO import StringIO
+from collections import deque
+from email import encoders
 from email.message import Message
 from email.mime.multipart import MIMEMultipart
 from email.mime.nonmultipart import MIMENonMultipart
 from email.mime.text import MIMEText
 from email.utils import formatdate
+from gzip import GzipFile
 
 from twisted.internet import defer
 from twisted.internet import reactor
+from twisted.internet import threads
 from twisted.python import log as twlog
 from zope.interface import implements
 
@@ -208,6 +213,107 @@ def defaultMessage(mode, name, build, results, master_status):
     return {'body': text, 'type': 'plain'}
 
 
+def _tailChunks(chunks, maxSize):
+    """Return the chunks making up the last C{maxSize} bytes of C{chunks},
+    and the number of bytes left out, holding no more than that in memory."""
+    kept = deque()
+    size = skipped = 0
+    for chunk in chunks:
+        kept.append(chunk)
+        size += len(chunk)
+        while size - len(kept[0]) >= maxSize:
+            dropped = kept.popleft()
+            size -= len(dropped)
+            skipped += len(dropped)
+    if size > maxSize:
+        excess = size - maxSize
+        kept[0] = kept[0][excess:]
+        skipped += excess
+    return kept, skipped
+
+
+def readLogAttachment(log, filename, maxSize=None, compress=False):
+    """Build a MIME attachment with the text of C{log}, reading it a chunk at
+    a time and optionally gzipping it.  If the log is longer than C{maxSize}
+    bytes, only its end is attached.  Returns the attachment and the number
+    of bytes of the log it contains."""
+    buf = StringIO()
+    out = buf
+    if compress:
+        out = GzipFile(filename, 'wb', fileobj=buf)
+    chunks = log.getChunks([interfaces.LOG_CHANNEL_STDOUT,
+                            interfaces.LOG_CHANNEL_STDERR], onlyText=True)
+    if maxSize is not None:
+        chunks, skipped = _tailChunks(chunks, maxSize)
+        if skipped:
+            out.write("[... %d bytes omitted ...]\n" % skipped)
+    # guess at the encoding, and use replacement symbols for anything
+    # that's not in that encoding
+    decoder = codecs.getincrementaldecoder(LOG_ENCODING)('replace')
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if not isinstance(chunk, unicode):
+            chunk = decoder.decode(chunk)
+        out.write(chunk.encode(ENCODING))
+    out.write(decoder.decode('', True).encode(ENCODING))
+    if compress:
+        out.close()
+        a = MIMENonMultipart('application', 'x-gzip')
+        a.set_payload(buf.getvalue())
+        encoders.encode_base64(a)
+        filename += '.gz'
+    else:
+        a = MIMEText(buf.getvalue(), _charset=ENCODING)
+    a.add_header('Content-Disposition', "attachment", filename=filename)
+    return a, size
+
+
+class LogLines(object):
+
+    """The lines of a log, without their line endings, as a sequence that
+    only reads the log when it is used.  Iterating reads the log a chunk at
+    a time, slices of the first or last lines use the log's C{getHead} and
+    C{getTail}, and anything else reads the lines into a list once.  The log
+    itself is available as C{log}."""
+
+    def __init__(self, log):
+        self.log = log
+        self._lines = None
+
+    def _strip(self, lines):
+        return [line.rstrip('\r\n') for line in lines]
+
+    def _all(self):
+        if self._lines is None:
+            self._lines = self._strip(self.log.iterLines())
+        return self._lines
+
+    def __iter__(self):
+        if self._lines is not None:
+            return iter(self._lines)
+        return (line.rstrip('\r\n') for line in self.log.iterLines())
+
+    def __len__(self):
+        return len(self._all())
+
+    def __getitem__(self, index):
+        if self._lines is None and isinstance(index, slice) and \
+                index.step is None:
+            start, stop = index.start, index.stop
+            if start is None and stop is not None and stop >= 0:
+                return self._strip(self.log.getHead(stop))
+            if stop is None and start is not None and start < 0:
+                return self._strip(self.log.getTail(-start))
+        return self._all()[index]
+
+    def __eq__(self, other):
+        return self._all() == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+
 def defaultGetPreviousBuild(current_build):
     return current_build.getPreviousBuild()
 
@@ -237,7 +343,8 @@ class MailNotifier(base.StatusReceiverMultiService, buildset.BuildSetSummaryNoti
     compare_attrs = ["extraRecipients", "lookup", "fromaddr", "mode",
                      "tags", "builders", "addLogs", "relayhost",
                      "subject", "sendToInterestedUsers", "customMesg",
-                     "messageFormatter", "extraHeaders"]
+                     "messageFormatter", "extraHeaders", "compressLogs",
+                     "maxLogsSize"]
 
     possible_modes = ("change", "failing", "passing", "problem", "warnings", "exception")
 
@@ -251,6 +358,7 @@ class MailNotifier(base.StatusReceiverMultiService, buildset.BuildSetSummaryNoti
                  addPatch=True, useTls=False,
                  smtpUser=None, smtpPassword=None, smtpPort=25,
                  previousBuildGetter=defaultGetPreviousBuild,
+                 compressLogs=False, maxLogsSize=None,
                  categories=None  # deprecated, use tags
                  ):
         """
@@ -309,6 +417,15 @@ class MailNotifier(base.StatusReceiverMultiService, buildset.BuildSetSummaryNoti
                         set to a list of log names, to send a subset of the
                         logs. Defaults to False.
 
+        @type  compressLogs: boolean
+        @param compressLogs: if True, attach logs gzipped.
+
+        @type  maxLogsSize: int
+        @param maxLogsSize: the maximum number of bytes of log text attached
+                            to one message. A log that does not fit is cut
+                            to its last bytes, and logs after that are left
+                            out. Defaults to None, for no limit.
+
         @type  addPatch: boolean
         @param addPatch: if True, include the patch when the source stamp
                          includes one.
@@ -336,7 +453,9 @@ class MailNotifier(base.StatusReceiverMultiService, buildset.BuildSetSummaryNoti
                           usernames match their twistedmatrix.com account names.
 
         @type  customMesg: func
-        @param customMesg: (this function is deprecated)
+        @param customMesg: (this function is deprecated) The lines of each
+                           log in its 'logs' attribute are a L{LogLines}
+                           sequence, which reads the log only when used.
 
         @type  messageFormatter: func
         @param messageFormatter: function taking (mode, name, build, result,
@@ -411,6 +530,8 @@ class MailNotifier(base.StatusReceiverMultiService, buildset.BuildSetSummaryNoti
         self.tags = tags or categories
         self.builders = builders
         self.addLogs = addLogs
+        self.compressLogs = compressLogs
+        self.maxLogsSize = maxLogsSize
         self.relayhost = relayhost
         if '\n' in subject:
             config.error(
@@ -539,8 +660,9 @@ class MailNotifier(base.StatusReceiverMultiService, buildset.BuildSetSummaryNoti
 
     def getCustomMesgData(self, mode, name, build, results, master_status):
         #
-        # logs is a list of tuples that contain the log
-        # name, log url, and the log contents as a list of strings.
+        # logs is a list of tuples that contain the log name, log url, the
+        # log contents as a LogLines sequence of strings, and the step's
+        # results.  The log is only read when the sequence is used.
         #
         logs = list()
         for logf in build.getLogs():
@@ -552,7 +674,7 @@ class MailNotifier(base.StatusReceiverMultiService, buildset.BuildSetSummaryNoti
                          '%s/steps/%s/logs/%s' % (
                              master_status.getURLForThing(build),
                              stepName, logName),
-                         logf.getText().splitlines(),
+                         LogLines(logf),
                          logStatus))
 
         attrs = {'builderName': name,
@@ -656,39 +778,40 @@ class MailNotifier(base.StatusReceiverMultiService, buildset.BuildSetSummaryNoti
             for (i, patch) in enumerate(patches):
                 a = self.patch_to_attachment(patch, i)
                 m.attach(a)
-        if logs:
-            for log in logs:
-                name = "%s.%s" % (log.getStep().getName(),
-                                  log.getName())
-                if (self._shouldAttachLog(log.getName()) or
-                        self._shouldAttachLog(name)):
-                    # Use distinct filenames for the e-mail summary
-                    if self.buildSetSummary:
-                        filename = "%s.%s.%s" % (log.getStep().getBuild().getBuilder().getName(),
-                                                 log.getStep().getName(),
-                                                 log.getName())
-                    else:
-                        filename = name
-
-                    text = log.getText()
-                    if not isinstance(text, unicode):
-                        # guess at the encoding, and use replacement symbols
-                        # for anything that's not in that encoding
-                        text = text.decode(LOG_ENCODING, 'replace')
-                    a = MIMEText(text.encode(ENCODING),
-                                 _charset=ENCODING)
-                    a.add_header('Content-Disposition', "attachment",
-                                 filename=filename)
+        attachLogs = []
+        for log in logs or []:
+            name = "%s.%s" % (log.getStep().getName(),
+                              log.getName())
+            if (self._shouldAttachLog(log.getName()) or
+                    self._shouldAttachLog(name)):
+                # Use distinct filenames for the e-mail summary
+                if self.buildSetSummary:
+                    filename = "%s.%s.%s" % (log.getStep().getBuild().getBuilder().getName(),
+                                             log.getStep().getName(),
+                                             log.getName())
+                else:
+                    filename = name
+                attachLogs.append((log, filename))
+
+        if attachLogs:
+            d = self.getLogAttachments(attachLogs)
+
+            @d.addCallback
+            def attachAll(attachments):
+                for a in attachments:
                     m.attach(a)
+        else:
+            d = defer.succeed(None)
 
         # @todo: is there a better way to do this?
         # Add any extra headers that were requested, doing WithProperties
         # interpolation if only one build was given
         if self.extraHeaders:
-            if len(builds) == 1:
-                d = builds[0].render(self.extraHeaders)
-            else:
-                d = defer.succeed(self.extraHeaders)
+            @d.addCallback
+            def renderExtraHeaders(_):
+                if len(builds) == 1:
+                    return builds[0].render(self.extraHeaders)
+                return self.extraHeaders
 
             @d.addCallback
             def addExtraHeaders(extraHeaders):
@@ -699,10 +822,45 @@ class MailNotifier(base.StatusReceiverMultiService, buildset.BuildSetSummaryNoti
                                   "but it already exists in the Message - "
                                   "not adding it.")
                     m[k] = v
-            d.addCallback(lambda _: m)
-            return d
 
-        return defer.succeed(m)
+        d.addCallback(lambda _: m)
+        return d
+
+    def getLogAttachments(self, logs):
+        """Build attachments for a list of (log, filename) tuples, within
+        C{maxLogsSize}.  Logs are streamed from disk in a thread, so that
+        large logs neither block the reactor nor need to fit in memory more
+        than once.  Returns a Deferred firing with the attachments."""
+        def build():
+            attachments = []
+            omitted = []
+            remaining = self.maxLogsSize
+            for log, filename in logs:
+                if remaining is not None and remaining <= 0:
+                    omitted.append(filename)
+                    continue
+                a, size = readLogAttachment(log, filename, remaining,
+                                            self.compressLogs)
+                attachments.append(a)
+                if remaining is not None:
+                    remaining -= size
+            return attachments, omitted
+
+        if all(log.isFinished() for log, _ in logs):
+            d = threads.deferToThread(build)
+        else:
+            # an unfinished log shares its file with the writer, which must
+            # not be moved from another thread
+            d = defer.maybeDeferred(build)
+
+        @d.addCallback
+        def logOmitted(res):
+            attachments, omitted = res
+            if omitted:
+                twlog.msg("MailNotifier: not attaching logs %s, over "
+                          "maxLogsSize" % ", ".join(omitted))
+            return attachments
+        return d
 
     def buildMessageDict(self, name, build, results):
         if self.customMesg:
@@ -25,12 +25,14 @@ from buildbot.changes import changes
 from buildbot.status import builder
 from buildbot.status import buildrequest
 from buildbot.status import buildset
+from buildbot.status import durations
+from buildbot.status import history
+from buildbot.status import janitor
+from buildbot.status import writebehind
 from buildbot.util import bbcollections
 from buildbot.util.eventual import eventually
-from cPickle import load
 from twisted.application import service
 from twisted.internet import defer
-from twisted.persisted import styles
 from twisted.python import log
 from zope.interface import implements
 
@@ -55,6 +57,17 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
         self._build_request_sub = None
         self._change_sub = None
 
+        self.durations = durations.DurationHistory(
+            os.path.join(self.basedir, "durations.json"))
+        self.janitor = janitor.HorizonJanitor()
+        self.recentBuilds = history.RecentBuilds(
+            os.path.join(self.basedir, "recent_builds.json"))
+        self.slaveBuilds = history.SlaveBuilds(
+            os.path.join(self.basedir, "slave_builds.json"))
+        self.gridMatrix = history.GridMatrix(
+            os.path.join(self.basedir, "grid.json"))
+        self.saveQueue = writebehind.SaveQueue()
+
     # service management
 
     def startService(self):
@@ -72,6 +85,13 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
             self.master.subscribeToChanges(
                 self.changeAdded)
 
+        self.durations.start()
+        self.recentBuilds.start()
+        self.slaveBuilds.start()
+        self.gridMatrix.start()
+        self.saveQueue.start()
+        self.janitor.start()
+
         return service.MultiService.startService(self)
 
     @defer.inlineCallbacks
@@ -112,7 +132,14 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
             self._change_sub.unsubscribe()
             self._change_sub = None
 
-        return service.MultiService.stopService(self)
+        d = self.janitor.stop()
+        d.addCallback(lambda _: self.durations.stop())
+        d.addCallback(lambda _: self.recentBuilds.stop())
+        d.addCallback(lambda _: self.slaveBuilds.stop())
+        d.addCallback(lambda _: self.gridMatrix.stop())
+        d.addCallback(lambda _: self.saveQueue.stop())
+        d.addCallback(lambda _: service.MultiService.stopService(self))
+        return d
 
     # clean shutdown
 
@@ -257,6 +284,17 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
     def getSlave(self, slavename):
         return self.botmaster.slaves[slavename].slave_status
 
+    def getSlaveBuildSummaries(self, slavename):
+        """Return summaries of the last finished builds on C{slavename},
+        most recently finished first (see L{history.SlaveBuilds})."""
+        return self.slaveBuilds.getFinishedBuilds(slavename)
+
+    def getSlaveBuildSummariesCompleteSince(self):
+        """Return the time since which every build has been recorded in
+        the summaries returned by L{getSlaveBuildSummaries}, or None if
+        they may be missing builds."""
+        return self.slaveBuilds.completeSince
+
     def getBuildSets(self):
         d = self.master.db.buildsets.getBuildsets(complete=False)
 
@@ -268,7 +306,49 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
 
     def generateFinishedBuilds(self, builders=[], branches=[],
                                num_builds=None, finished_before=None,
-                               max_search=None):
+                               max_search=None, results=None,
+                               filter_fn=None):
+        # the most recent builds come from the summaries in recentBuilds,
+        # without looking at any other build
+        seen = set()
+        got = 0
+        for summary in self.recentBuilds:
+            if builders and summary.builder not in builders:
+                continue
+            if branches and not set(branches) & set(summary.branches):
+                continue
+            if finished_before is not None and summary.end >= finished_before:
+                continue
+            if results is not None and summary.results not in results:
+                continue
+            try:
+                bldr = self.getBuilder(summary.builder)
+            except KeyError:
+                continue
+            build = bldr.getBuild(summary.number)
+            if build is None:
+                continue
+            seen.add((summary.builder, summary.number))
+            if filter_fn is not None and not filter_fn(build):
+                continue
+            got += 1
+            yield build
+            if num_builds is not None and got >= num_builds:
+                return
+
+        # older builds are found by merging the builders' own histories,
+        # starting below the builds the summaries cover
+        lowest = {}
+        for summary in self.recentBuilds:
+            lowest[summary.builder] = min(summary.number,
+                                          lowest.get(summary.builder,
+                                                     summary.number))
+        oldest = self.recentBuilds.oldestEnd()
+        if oldest is not None:
+            # allow for builds that finished at the same time as the oldest
+            # summary; those we have already produced are skipped below
+            if finished_before is None or finished_before > oldest + 1:
+                finished_before = oldest + 1
 
         if max_search is None:
             # If max > buildCacheSize, it'll trash the cache...
@@ -286,59 +366,29 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
                          for bn in self.getBuilderNames()
                          if want_builder(bn)]
 
-        # 'sources' is a list of generators, one for each Builder we're
-        # using. When the generator is exhausted, it is replaced in this list
-        # with None.
         sources = []
         for bn in builder_names:
-            bldr = self.getBuilder(bn)
-            g = bldr.generateFinishedBuilds(branches,
-                                            finished_before=finished_before,
-                                            max_search=max_search)
-            sources.append(g)
-
-        # next_build the next build from each source
-        next_build = [None] * len(sources)
-
-        def refill():
-            for i, g in enumerate(sources):
-                if next_build[i]:
-                    # already filled
-                    continue
-                if not g:
-                    # already exhausted
-                    continue
-                try:
-                    next_build[i] = g.next()
-                except StopIteration:
-                    next_build[i] = None
-                    sources[i] = None
-
-        got = 0
-        while True:
-            refill()
-            # find the latest build among all the candidates
-            candidates = [(i, b, b.getTimes()[1])
-                          for i, b in enumerate(next_build)
-                          if b is not None]
-            candidates.sort(lambda x, y: cmp(x[2], y[2]))
-            if not candidates:
-                return
-
-            # and remove it from the list
-            i, build, finshed_time = candidates[-1]
-            next_build[i] = None
+            max_buildnum = None
+            if bn in lowest:
+                max_buildnum = lowest[bn] - 1
+            sources.append(self.getBuilder(bn).generateFinishedBuilds(
+                branches, finished_before=finished_before,
+                max_buildnum=max_buildnum, max_search=max_search,
+                results=results, filter_fn=filter_fn))
+        for build in history.mergeFinishedBuilds(sources):
+            if (build.getBuilder().getName(), build.getNumber()) in seen:
+                continue
             got += 1
             yield build
-            if num_builds is not None:
-                if got >= num_builds:
-                    return
+            if num_builds is not None and got >= num_builds:
+                return
 
     @defer.inlineCallbacks
     def subscribe(self, target):
         self.watchers.append(target)
         for name in self.botmaster.builderNames:
             yield self.announceNewBuilder(target, name, self.getBuilder(name))
+
     def unsubscribe(self, target):
         self.watchers.remove(target)
 
@@ -354,42 +404,17 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
         @rtype: L{BuilderStatus}
         """
         filename = os.path.join(self.basedir, basedir, "builder")
-        log.msg("trying to load status pickle from %s" % filename)
-        builder_status = None
-        try:
-            with open(filename, "rb") as f:
-                builder_status = load(f)
-            builder_status.master = self.master
-
-            # (bug #1068) if we need to upgrade, we probably need to rewrite
-            # this pickle, too.  We determine this by looking at the list of
-            # Versioned objects that have been unpickled, and (after doUpgrade)
-            # checking to see if any of them set wasUpgraded.  The Versioneds'
-            # upgradeToVersionNN methods all set this.
-            versioneds = styles.versionedsToUpgrade
-            styles.doUpgrade()
-            if True in [hasattr(o, 'wasUpgraded') for o in versioneds.values()]:
-                log.msg("re-writing upgraded builder pickle")
-                builder_status.saveYourself()
-
-        except IOError:
+        builder_status = builder.BuilderStatus(name, tags, self.master,
+                                               description)
+        if os.path.exists(filename):
+            # the saved pickle only holds past events; they are read when
+            # someone first asks for them
+            builder_status.loadEventsFrom(filename)
+        else:
             log.msg("no saved status pickle, creating a new one")
-        except:
-            log.msg("error while loading status pickle, creating a new one")
-            log.msg("error follows:")
-            log.err()
-        if not builder_status:
-            builder_status = builder.BuilderStatus(name, tags, self.master,
-                                                   description)
             builder_status.addPointEvent(["builder", "created"])
         log.msg("added builder %s with tags %r" % (name, tags))
-        # an unpickled object might not have tags set from before,
-        # so set it here to make sure
-        builder_status.setTags(tags)
-        builder_status.description = description
-        builder_status.master = self.master
         builder_status.basedir = os.path.join(self.basedir, basedir)
-        builder_status.name = name  # it might have been updated
         builder_status.status = self
 
         if not os.path.isdir(builder_status.basedir):
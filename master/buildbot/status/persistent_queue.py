@@ -18,9 +18,13 @@ from __future__ import with_statement
 
 import cPickle as pickle
 import os
+import struct
 
 from collections import deque
 
+from buildbot.util import json
+from twisted.python import runtime
+
 from zope.interface import Interface
 from zope.interface import implements
 
@@ -256,6 +260,295 @@ class DiskQueue(object):
             self.lastItemId = files[-1]
 
 
+class SegmentedDiskQueue(object):
+
+    """Keeps a list of abstract items in an append-only log on the disk.
+
+    Items are pickled into length-prefixed records appended to segment files
+    of about C{segmentSize} bytes, and read back sequentially from a cursor
+    that is saved in a checkpoint file.  A segment is deleted as a whole once
+    it has been read, so pushing and popping items costs O(1) amortized and
+    no directory scans.
+
+    Writes are flushed to the OS as they happen, but the segment is only
+    fsync'ed, and the checkpoint only rewritten, every C{syncEvery} pushes or
+    pops and when save() is called.  After a crash, items popped since the
+    last checkpoint are returned again.
+
+    Items left by L{DiskQueue} in the same directory are imported on
+    startup."""
+    implements(IQueue)
+
+    header = struct.Struct('>I')
+
+    def __init__(self, path, maxItems=None, pickleFn=pickle.dumps,
+                 unpickleFn=pickle.loads, segmentSize=4 * 1024 * 1024,
+                 syncEvery=100):
+        """
+        @path: directory to save the items.
+        @maxItems: maximum number of items to keep on disk, flush the
+        older ones.
+        @pickleFn: function used to pack the items to disk.
+        @unpickleFn: function used to unpack items from disk.
+        @segmentSize: size in bytes after which a new segment file is
+        started.
+        @syncEvery: number of changes after which the data is synced to disk.
+        """
+        self.path = path
+        self._maxItems = maxItems
+        if self._maxItems is None:
+            self._maxItems = 100000
+        if not os.path.isdir(self.path):
+            os.mkdir(self.path)
+        self.pickleFn = pickleFn
+        self.unpickleFn = unpickleFn
+        self.segmentSize = segmentSize
+        self.syncEvery = syncEvery
+
+        self._nbItems = 0
+        # segment ids on disk, oldest first; the last one is written to
+        self._segments = deque()
+        # offset of the first unread record in each segment, if not 0
+        self._startOffsets = {}
+        self._reader = None
+        self._writer = None
+        self._writeSize = 0
+        self._changes = 0
+        self._loadFromDisk()
+        self._importDiskQueue()
+
+    def pushItem(self, item):
+        ret = None
+        if self._nbItems == self._maxItems:
+            ret = self._readRecords(1)[0]
+            self._nbItems -= 1
+        self._appendRecord(self.pickleFn(item))
+        self._nbItems += 1
+        self._changed()
+        return ret
+
+    def insertBackChunk(self, chunk):
+        ret = None
+        excess = self._nbItems + len(chunk) - self._maxItems
+        if excess > 0:
+            ret = chunk[0:excess]
+            chunk = chunk[excess:]
+        if chunk:
+            # write the chunk as a new segment in front of the others
+            if self._segments:
+                segment = self._segments[0] - 1
+            else:
+                segment = 0
+            self._closeReader()
+            with open(self._segmentPath(segment), 'wb') as f:
+                for item in chunk:
+                    data = self.pickleFn(item)
+                    f.write(self.header.pack(len(data)))
+                    f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._segments.appendleft(segment)
+            if len(self._segments) == 1:
+                self._openWriter()
+            self._nbItems += len(chunk)
+            self._commit()
+        return ret
+
+    def popChunk(self, nbItems=None):
+        if nbItems is None:
+            nbItems = self._maxItems
+        ret = self._readRecords(min(nbItems, self._nbItems))
+        self._nbItems -= len(ret)
+        if ret and not self._nbItems:
+            # drained; remove the segments right away
+            self._commit()
+        else:
+            self._changed(len(ret))
+        return ret
+
+    def save(self):
+        self._commit()
+
+    def items(self):
+        ret = []
+        self._flushWriter()
+        for segment in self._segments:
+            with open(self._segmentPath(segment), 'rb') as f:
+                f.seek(self._startOffsets.get(segment, 0))
+                for data in self._iterRecords(f):
+                    ret.append(self.unpickleFn(data))
+        return ret
+
+    def nbItems(self):
+        return self._nbItems
+
+    def maxItems(self):
+        return self._maxItems
+
+    # Protected functions
+
+    def _segmentPath(self, segment):
+        return os.path.join(self.path, '%d.seg' % segment)
+
+    def _checkpointPath(self):
+        return os.path.join(self.path, 'checkpoint')
+
+    def _iterRecords(self, f):
+        while True:
+            header = f.read(self.header.size)
+            if len(header) < self.header.size:
+                return
+            length = self.header.unpack(header)[0]
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield data
+
+    def _appendRecord(self, data):
+        if self._segments and self._writeSize >= self.segmentSize:
+            if self._nbItems:
+                self._rollover()
+            else:
+                # everything has been read; this removes the old segments
+                self._commit()
+        if not self._segments:
+            self._segments.append(0)
+            self._openWriter()
+        self._writer.write(self.header.pack(len(data)))
+        self._writer.write(data)
+        self._writer.flush()
+        self._writeSize += self.header.size + len(data)
+
+    def _rollover(self):
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._writer.close()
+        self._segments.append(self._segments[-1] + 1)
+        self._openWriter()
+
+    def _openWriter(self):
+        path = self._segmentPath(self._segments[-1])
+        self._writer = open(path, 'ab')
+        self._writer.seek(0, os.SEEK_END)
+        self._writeSize = self._writer.tell()
+
+    def _flushWriter(self):
+        if self._writer:
+            self._writer.flush()
+
+    def _closeReader(self):
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+
+    def _dropFirstSegment(self):
+        self._closeReader()
+        segment = self._segments.popleft()
+        self._startOffsets.pop(segment, None)
+        os.remove(self._segmentPath(segment))
+
+    def _readRecords(self, count):
+        ret = []
+        while len(ret) < count:
+            segment = self._segments[0]
+            if len(self._segments) == 1:
+                self._flushWriter()
+            if self._reader is None:
+                self._reader = open(self._segmentPath(segment), 'rb')
+            # the segment may have grown since we last read it
+            self._reader.seek(self._startOffsets.get(segment, 0))
+            for data in self._iterRecords(self._reader):
+                ret.append(self.unpickleFn(data))
+                if len(ret) == count:
+                    break
+            self._startOffsets[segment] = self._reader.tell()
+            if len(ret) < count and len(self._segments) > 1:
+                # this segment is exhausted, and the next one holds the rest
+                self._dropFirstSegment()
+            elif len(ret) < count:
+                raise IOError('%s: %d items missing' % (self.path,
+                                                        count - len(ret)))
+        return ret
+
+    def _changed(self, changes=1):
+        self._changes += changes
+        if self._changes >= self.syncEvery:
+            self._commit()
+
+    def _commit(self):
+        """Sync the written records and save the read cursor."""
+        self._changes = 0
+        if self._nbItems == 0 and self._segments:
+            # empty: start afresh with an empty directory
+            self._closeReader()
+            self._writer.close()
+            self._writer = None
+            while self._segments:
+                self._dropFirstSegment()
+        if self._writer:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+        path = self._checkpointPath()
+        if not self._segments:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        offsets = dict((str(k), v) for k, v in self._startOffsets.iteritems()
+                       if v and k in self._segments)
+        WriteFile(path + '.tmp', json.dumps({'offsets': offsets}))
+        if runtime.platformType == 'win32' and os.path.exists(path):
+            os.remove(path)
+        os.rename(path + '.tmp', path)
+
+    def _loadFromDisk(self):
+        segments = []
+        for name in os.listdir(self.path):
+            if name.endswith('.seg'):
+                try:
+                    segments.append(int(name[:-4]))
+                except ValueError:
+                    pass
+        segments.sort()
+        self._segments = deque(segments)
+
+        path = self._checkpointPath()
+        if os.path.exists(path):
+            offsets = json.loads(ReadFile(path))['offsets']
+            self._startOffsets = dict((int(k), v)
+                                      for k, v in offsets.iteritems())
+
+        # count the records, and drop any partial record at the end of the
+        # last segment, left by a crash
+        for segment in segments:
+            with open(self._segmentPath(segment), 'r+b') as f:
+                f.seek(self._startOffsets.get(segment, 0))
+                end = f.tell()
+                while True:
+                    header = f.read(self.header.size)
+                    if len(header) < self.header.size:
+                        break
+                    length = self.header.unpack(header)[0]
+                    f.seek(length, os.SEEK_CUR)
+                    if f.tell() > os.fstat(f.fileno()).st_size:
+                        break
+                    end = f.tell()
+                    self._nbItems += 1
+                f.truncate(max(end, self._startOffsets.get(segment, 0)))
+        if self._segments:
+            self._openWriter()
+        self._commit()
+
+    def _importDiskQueue(self):
+        if not [name for name in os.listdir(self.path) if name.isdigit()]:
+            return
+        legacy = DiskQueue(self.path, maxItems=self._maxItems,
+                           pickleFn=self.pickleFn, unpickleFn=self.unpickleFn)
+        while legacy.nbItems():
+            for item in legacy.popChunk(1000):
+                self.pushItem(item)
+        self._commit()
+
+
 class PersistentQueue(object):
 
     """Keeps a list of abstract items and serializes it to the disk.
@@ -333,6 +626,7 @@ class PersistentQueue(object):
 
     def save(self):
         self.secondaryQueue.insertBackChunk(self.primaryQueue.popChunk())
+        self.secondaryQueue.save()
 
     def items(self):
         return self.primaryQueue.items() + self.secondaryQueue.items()
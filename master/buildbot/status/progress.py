@@ -145,6 +145,8 @@ class BuildProgress(pb.Referenceable):
     objects.
     """
 
+    expectations = None
+
     def __init__(self, stepProgresses=None):
         self.steps = {}
         if stepProgresses is not None:
@@ -161,12 +163,24 @@ class BuildProgress(pb.Referenceable):
 
     def setExpectationsFrom(self, exp):
         """Set our expectations from the builder's Expectations object."""
+        self.expectations = exp
         for name, metrics in exp.steps.items():
             s = self.steps.get(name)
             if s:
                 s.setExpectedTime(exp.times[name])
                 s.setExpectations(exp.steps[name])
 
+    def expectedStepTime(self, stepname):
+        """Return the expected duration of the named step in seconds, or
+        None if there is no history for it.  Steps added after the build
+        started are looked up in the builder's Expectations directly."""
+        s = self.steps.get(stepname)
+        if s is not None and s.expectedTime is not None:
+            return s.expectedTime
+        if self.expectations is not None:
+            return self.expectations.times.get(stepname)
+        return None
+
     def newExpectations(self):
         """Call this when one of the steps has changed its expectations.
         This should trigger us to update our ETA value and notify any
@@ -40,6 +40,7 @@ class SlaveStatus:
         self.info = {}
         self.info_change_callbacks = []
         self.connect_times = []
+        self.workspaces = {}
 
     def getName(self):
         return self.name
@@ -118,6 +119,24 @@ class SlaveStatus:
     def buildFinished(self, build):
         self.runningBuilds.remove(build)
 
+    def recordWorkspace(self, buildername, sourcestamps, when=None):
+        """Remember the sources the last build of C{buildername} left in
+        its workspace on this slave."""
+        if when is None:
+            when = time.time()
+        self.workspaces[buildername] = {
+            'time': when,
+            'sources': dict((ss.codebase, {'branch': ss.branch,
+                                           'revision': ss.revision})
+                            for ss in sourcestamps),
+        }
+
+    def getWorkspace(self, buildername):
+        """Return a dict with the 'time' of the last build of
+        C{buildername} on this slave and the 'branch' and 'revision' of each
+        codebase it built, keyed by codebase in 'sources'; or None."""
+        return self.workspaces.get(buildername)
+
     def getGraceful(self):
         """Return the graceful shutdown flag"""
         return self.graceful_shutdown
@@ -197,4 +216,5 @@ class SlaveStatus:
         result['connected'] = self.isConnected()
         result['runningBuilds'] = [b.asDict() for b in self.getRunningBuilds()]
         result['info'] = self.getInfoAsDict()
+        result['workspaces'] = self.workspaces
         return result
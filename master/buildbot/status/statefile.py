@@ -0,0 +1,91 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from __future__ import with_statement
+
+import os
+
+from buildbot.util import debounce
+from buildbot.util import json
+from twisted.python import log
+from twisted.python import runtime
+
+
+class StateFile(object):
+
+    """Persistence for the status summaries the master keeps across restarts:
+    a small JSON state file, written some time after each change and when
+    stopped, but only between L{start} and L{stop}.  Subclasses implement
+    C{asDict} and C{fromDict} and call C{changed} when they have something
+    new to save."""
+
+    version = 1
+    description = 'state'
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.dirty = False
+        self.saveSoon.stop()
+
+    def changed(self):
+        self.dirty = True
+        self.saveSoon()
+
+    def load(self):
+        if not self.filename or not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, 'rb') as f:
+                data = json.load(f)
+        except Exception:
+            log.err(None, "while loading %s from %s; starting over"
+                    % (self.description, self.filename))
+            return
+        if data.get('version') != self.version:
+            log.msg("ignoring %s with unknown version %r"
+                    % (self.description, data.get('version')))
+            return
+        self.fromDict(data)
+
+    def save(self):
+        if not self.filename or not self.dirty:
+            return
+        tmpfile = self.filename + '.tmp'
+        try:
+            with open(tmpfile, 'wb') as f:
+                json.dump(self.asDict(), f)
+            # windows cannot rename a file on top of an existing one
+            if runtime.platformType == 'win32' and os.path.exists(self.filename):
+                os.unlink(self.filename)
+            os.rename(tmpfile, self.filename)
+            self.dirty = False
+        except Exception:
+            log.err(None, "while saving %s to %s"
+                    % (self.description, self.filename))
+
+    @debounce.method(wait=30)
+    def saveSoon(self):
+        self.save()
+
+    def start(self):
+        self.load()
+        self.saveSoon.start()
+        if self.dirty:
+            self.saveSoon()
+
+    def stop(self):
+        d = self.saveSoon.stop()
+        d.addCallback(lambda _: self.save())
+        return d
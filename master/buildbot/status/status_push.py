@@ -20,6 +20,7 @@ from __future__ import with_statement
 
 Implements the HTTP receiver."""
 
+import copy
 import datetime
 import os
 import urllib
@@ -32,11 +33,12 @@ except ImportError:
     import json
 
 from buildbot import config
+from buildbot import interfaces
 from buildbot.status.base import StatusReceiverMultiService
-from buildbot.status.persistent_queue import DiskQueue
 from buildbot.status.persistent_queue import IndexedQueue
 from buildbot.status.persistent_queue import MemoryQueue
 from buildbot.status.persistent_queue import PersistentQueue
+from buildbot.status.persistent_queue import SegmentedDiskQueue
 from buildbot.status.web.status_json import FilterOut
 from twisted.internet import defer
 from twisted.internet import reactor
@@ -44,6 +46,59 @@ from twisted.python import log
 from twisted.web import client
 
 
+def diffSnapshot(old, new, path=None, changes=None):
+    """Return the list of changes that turn C{old} into C{new}.
+
+    Each change is either C{[path, value]}, setting the item at C{path} (a
+    list of dict keys and list indices) to C{value}, or C{[path]}, removing
+    a dict key.  Lists that grow only get their new items appended; lists
+    that shrink are replaced whole."""
+    if path is None:
+        path = []
+    if changes is None:
+        changes = []
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in new.iteritems():
+            if key in old:
+                diffSnapshot(old[key], value, path + [key], changes)
+            else:
+                changes.append([path + [key], value])
+        for key in old:
+            if key not in new:
+                changes.append([path + [key]])
+    elif (isinstance(old, (list, tuple)) and isinstance(new, (list, tuple))
+          and type(old) is type(new) and len(old) <= len(new)):
+        for i, value in enumerate(new):
+            if i < len(old):
+                diffSnapshot(old[i], value, path + [i], changes)
+            else:
+                changes.append([path + [i], value])
+    elif old != new or type(old) is not type(new):
+        changes.append([path, new])
+    return changes
+
+
+def applyDelta(snapshot, changes):
+    """Apply changes from L{diffSnapshot} to C{snapshot}, modifying it in
+    place, and return the result."""
+    for change in changes:
+        path = change[0]
+        if not path:
+            snapshot = change[1]
+            continue
+        parent = snapshot
+        for key in path[:-1]:
+            parent = parent[key]
+        key = path[-1]
+        if len(change) == 1:
+            del parent[key]
+        elif isinstance(parent, list) and key == len(parent):
+            parent.append(change[1])
+        else:
+            parent[key] = change[1]
+    return snapshot
+
+
 class StatusPush(StatusReceiverMultiService):
 
     """Event streamer to a abstract channel.
@@ -55,7 +110,8 @@ class StatusPush(StatusReceiverMultiService):
     """
 
     def __init__(self, serverPushCb, queue=None, path=None, filter=True,
-                 bufferDelay=1, retryDelay=5, blackList=None):
+                 bufferDelay=1, retryDelay=5, blackList=None, deltas=False,
+                 keyframeInterval=20):
         """
         @serverPushCb: callback to be used. It receives 'self' as parameter. It
         should call self.queueNextServerPush() when it's done to queue the next
@@ -71,6 +127,11 @@ class StatusPush(StatusReceiverMultiService):
         @retryDelay: amount of time between retries when no items were pushed on
         last serverPushCb call.
         @blackList: events that shouldn't be sent.
+        @deltas: when True, builds, steps and build properties are only sent
+        in full the first time they appear in an event; later events carry
+        the changes since the previous one, see diffSnapshot().
+        @keyframeInterval: in delta mode, send a full snapshot of an object
+        again after this many events about it.
         """
         StatusReceiverMultiService.__init__(self)
 
@@ -96,6 +157,11 @@ class StatusPush(StatusReceiverMultiService):
             return defer.maybeDeferred(serverPushCb, self)
         self.serverPushCb = hookPushCb
         self.blackList = blackList
+        self.deltas = deltas
+        self.keyframeInterval = keyframeInterval
+        # (builderName, buildNumber) -> {object key: [events since the last
+        # full snapshot, last snapshot sent]}
+        self.snapshots = {}
 
         # Other defaults.
         # IDelayedCall object that represents the next queued push.
@@ -241,16 +307,55 @@ class StatusPush(StatusReceiverMultiService):
         packet['event'] = event
         packet['payload'] = {}
         for obj_name, obj in objs.items():
+            key = None
+            if self.deltas:
+                key = self.getSnapshotKey(obj_name, obj, objs)
             if hasattr(obj, 'asDict'):
                 obj = obj.asDict()
             if self.filter:
                 obj = FilterOut(obj)
+            if key is not None:
+                obj = self.encodeDelta(packet, obj_name, key, obj)
             packet['payload'][obj_name] = obj
         self.queue.pushItem(packet)
         if self.task is None or not self.task.active():
             # No task queued since it was probably idle, let's queue a task.
             yield self.queueNextServerPush()
 
+    def getSnapshotKey(self, name, obj, objs):
+        """Return the (build, object) key under which snapshots of C{obj}
+        are kept in delta mode, or None to always send it in full."""
+        if interfaces.IBuildStatus.providedBy(obj):
+            build, objKey = obj, ('build',)
+        elif interfaces.IBuildStepStatus.providedBy(obj):
+            build, objKey = obj.getBuild(), ('step', obj.step_number)
+        elif name == 'properties' and 'step' in objs:
+            build, objKey = objs['step'].getBuild(), ('properties',)
+        else:
+            return None
+        return (build.getBuilder().getName(), build.getNumber()), objKey
+
+    def encodeDelta(self, packet, name, key, obj):
+        """Return the full snapshot or the list of changes to send for
+        C{obj}, recording which one it is in C{packet}."""
+        buildKey, objKey = key
+        packet.setdefault('ids', {})[name] = list(buildKey + objKey)
+        snapshots = self.snapshots.setdefault(buildKey, {})
+        previous = snapshots.get(objKey)
+        if not self.filter:
+            # FilterOut copies; asDict() may hand out live containers
+            snapshot = copy.deepcopy(obj)
+        else:
+            snapshot = obj
+        if previous is None or previous[0] >= self.keyframeInterval:
+            snapshots[objKey] = [1, snapshot]
+            return obj
+        changes = diffSnapshot(previous[1], snapshot)
+        previous[0] += 1
+        previous[1] = snapshot
+        packet.setdefault('deltas', []).append(name)
+        return changes
+
     # Events
 
     def initialPush(self):
@@ -340,8 +445,12 @@ class StatusPush(StatusReceiverMultiService):
         d.addErrback(log.err, 'while pushing status message')
 
     def buildFinished(self, builderName, build, results):
+        # the last event of a build always carries a full snapshot, and
+        # nothing is kept for it afterwards
+        self.snapshots.pop((builderName, build.getNumber()), None)
         d = self.push('buildFinished', build=build)
         d.addErrback(log.err, 'while pushing status message')
+        self.snapshots.pop((builderName, build.getNumber()), None)
 
     def builderRemoved(self, builderName):
         d = self.push('buildedRemoved', builderName=builderName)
@@ -401,7 +510,7 @@ class HttpStatusPush(StatusPush):
                     urlparse.urlparse(self.serverUrl)[1].split(':')[0])
             queue = PersistentQueue(
                 primaryQueue=MemoryQueue(maxItems=maxMemoryItems),
-                secondaryQueue=DiskQueue(path, maxItems=maxDiskItems))
+                secondaryQueue=SegmentedDiskQueue(path, maxItems=maxDiskItems))
         else:
             path = None
             queue = MemoryQueue(maxItems=maxMemoryItems)
@@ -16,6 +16,9 @@
 
 import cgi
 import jinja2
+import jinja2.ext
+import jinja2.nodes
+import jinja2.utils
 import locale
 import os
 import re
@@ -23,6 +26,7 @@ import sys
 import time
 import urllib
 import urlparse
+import uuid
 
 from buildbot import util
 from buildbot import version
@@ -30,6 +34,7 @@ from buildbot.process.properties import Properties
 from buildbot.status import build
 from buildbot.status import builder
 from buildbot.status import buildstep
+from buildbot.status.history import sourceStampSummary
 from buildbot.status.results import EXCEPTION
 from buildbot.status.results import FAILURE
 from buildbot.status.results import RETRY
@@ -169,6 +174,17 @@ def path_to_build(request, buildstatus):
             "/builds/%d" % buildstatus.getNumber())
 
 
+def fragment_key(request, buildstatus):
+    """The key under which the parts of the page for REQUEST that show
+    BUILDSTATUS can be kept (see L{FragmentCacheExtension}), or None while
+    the build can still change.  The page's path is part of the key, since
+    the links it contains are relative."""
+    if not buildstatus.isFinished():
+        return None
+    return (buildstatus.getBuilder().getName(), buildstatus.getNumber(),
+            request.path)
+
+
 def path_to_step(request, stepstatus):
     return (path_to_build(request, stepstatus.getBuild()) +
             "/steps/%s" % urllib.quote(stepstatus.getName(), safe=''))
@@ -263,8 +279,19 @@ class ContextMixin(AccessorMixin):
                     authz=self.getAuthz(request),
                     request=request,
                     alert_msg=request.args.get("alert_msg", [""])[0],
+                    events_url=self.getEventsURL(request),
                     )
 
+    def getEventsURL(self, request):
+        """The URL of the event stream (see L{events.EventsResource}) about
+        the builders shown on this page, which tells it when to refresh."""
+        args = [(k, request.args[k]) for k in ('builder', 'tag')
+                if k in request.args]
+        url = path_to_root(request) + 'events'
+        if args:
+            url += '?' + urllib.urlencode(args, doseq=True)
+        return url
+
 
 class ActionResource(resource.Resource, AccessorMixin):
 
@@ -508,56 +535,9 @@ class BuildLineMixin:
     LINE_TIME_FORMAT = "%b %d %H:%M"
 
     def get_rev_list(self, build):
-        ss_list = build.getSourceStamps()
-        all_got_revision = build.getAllGotRevisions() or {}
-
-        if not ss_list:
-            return [{
-                'repo': 'unknown, no information in build',
-                'codebase': '',
-                'rev': 'unknown'
-            }]
-
-        if len(ss_list) == 1:
-            return [{
-                'repo': ss_list[0].repository,
-                'codebase': ss_list[0].codebase,
-                'rev': all_got_revision.get(ss_list[0].codebase, "??")
-            }]
-
-        # multiple-codebase configuration
-        rev_list = []
-        for ss in ss_list:
-            # skip codebases with no sourcestamp spec
-            if not ss.branch and not ss.revision and not ss.patch and not ss.changes:
-                continue
-
-            rev = {
-                'repo': ss.repository,
-                'codebase': ss.codebase
-            }
-
-            # show the most descriptive thing we can
-            if ss.branch:
-                rev['rev'] = ss.branch
-            elif ss.codebase in all_got_revision:
-                rev['rev'] = all_got_revision[ss.codebase]
-            elif ss.revision:
-                rev['rev'] = ss.revision
-            else:
-                rev['rev'] = '??'
-
-            rev_list.append(rev)
-
-        # if all sourcestamps were empty, then this is a "most recent" kind of build
-        if not rev_list:
-            rev_list = [{
-                'repo': 'unknown, no information in build',
-                'codebase': '',
-                'rev': 'most recent'
-            }]
-
-        return rev_list
+        return rev_list([sourceStampSummary(ss)
+                         for ss in build.getSourceStamps()],
+                        build.getAllGotRevisions() or {})
 
     def get_line_values(self, req, build, include_builder=True):
         '''
@@ -584,6 +564,7 @@ class BuildLineMixin:
                   'include_builder': include_builder,
                   'reason': build.getReason(),
                   'interested_users': build.getInterestedUsers(),
+                  'fragment_key': fragment_key(req, build),
                   }
 
         (start, end) = build.getTimes()
@@ -598,6 +579,59 @@ class BuildLineMixin:
         return values
 
 
+def rev_list(sources, all_got_revision):
+    """Return what the build lines show of the revisions of a build, given
+    a L{sourceStampSummary} of each of its source stamps and the revisions
+    it got."""
+    if not sources:
+        return [{
+            'repo': 'unknown, no information in build',
+            'codebase': '',
+            'rev': 'unknown'
+        }]
+
+    if len(sources) == 1:
+        return [{
+            'repo': sources[0][0],
+            'codebase': sources[0][1],
+            'rev': all_got_revision.get(sources[0][1], "??")
+        }]
+
+    # multiple-codebase configuration
+    revs = []
+    for repository, codebase, branch, revision, specified in sources:
+        # skip codebases with no sourcestamp spec
+        if not specified:
+            continue
+
+        rev = {
+            'repo': repository,
+            'codebase': codebase
+        }
+
+        # show the most descriptive thing we can
+        if branch:
+            rev['rev'] = branch
+        elif codebase in all_got_revision:
+            rev['rev'] = all_got_revision[codebase]
+        elif revision:
+            rev['rev'] = revision
+        else:
+            rev['rev'] = '??'
+
+        revs.append(rev)
+
+    # if all sourcestamps were empty, then this is a "most recent" kind of build
+    if not revs:
+        revs = [{
+            'repo': 'unknown, no information in build',
+            'codebase': '',
+            'rev': 'most recent'
+        }]
+
+    return revs
+
+
 def map_branches(branches):
     # when the query args say "trunk", present that to things like
     # IBuilderStatus.generateFinishedBuilds as None, since that's the
@@ -613,7 +647,7 @@ def map_branches(branches):
 
 def createJinjaEnv(revlink=None, changecommentlink=None,
                    repositories=None, projects=None, jinja_loaders=None,
-                   basedir='.'):
+                   basedir='.', bytecode_cache=False, auto_reload=True):
     ''' Create a jinja environment changecommentlink is used to
         render HTML in the WebStatus and for mail changes
 
@@ -630,6 +664,15 @@ def createJinjaEnv(revlink=None, changecommentlink=None,
 
         @type projects: C{None} or dict (string -> url)
         @param projects: similar to repositories, but for projects.
+
+        @type bytecode_cache: boolean
+        @param bytecode_cache: keep compiled templates in
+             C{basedir/templates_cache}, so they are not compiled again
+             when the master restarts.
+
+        @type auto_reload: boolean
+        @param auto_reload: check whether templates have changed each time
+             they are used.
     '''
 
     # See http://buildbot.net/trac/ticket/658
@@ -641,10 +684,17 @@ def createJinjaEnv(revlink=None, changecommentlink=None,
     all_loaders.append(jinja2.PackageLoader('buildbot.status.web', 'templates'))
     loader = jinja2.ChoiceLoader(all_loaders)
 
+    cache = None
+    if bytecode_cache:
+        cache = BytecodeCache(os.path.join(basedir, 'templates_cache'))
+
     env = jinja2.Environment(loader=loader,
-                             extensions=['jinja2.ext.i18n'],
+                             extensions=['jinja2.ext.i18n',
+                                         FragmentCacheExtension],
                              trim_blocks=True,
-                             undefined=AlmostStrictUndefined)
+                             undefined=AlmostStrictUndefined,
+                             bytecode_cache=cache,
+                             auto_reload=auto_reload)
 
     env.install_null_translations()  # needed until we have a proper i18n backend
 
@@ -664,6 +714,67 @@ def createJinjaEnv(revlink=None, changecommentlink=None,
     return env
 
 
+class BytecodeCache(jinja2.FileSystemBytecodeCache):
+
+    """A bytecode cache in C{directory}, which is created when first
+    needed.  Failing to read or write it only costs a compilation."""
+
+    def load_bytecode(self, bucket):
+        try:
+            jinja2.FileSystemBytecodeCache.load_bytecode(self, bucket)
+        except Exception:
+            log.err(None, "while loading a compiled template")
+            bucket.reset()
+
+    def dump_bytecode(self, bucket):
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            jinja2.FileSystemBytecodeCache.dump_bytecode(self, bucket)
+        except Exception:
+            log.err(None, "while saving a compiled template")
+
+
+class FragmentCacheExtension(jinja2.ext.Extension):
+
+    """Adds a C{{% cache key, ... %}...{% endcache %}} tag, which renders
+    its body once for each key and then reuses it, from
+    C{environment.fragment_cache}.  The body must only depend on the key,
+    so the key of a build is given by the page only once it has finished
+    (see L{fragment_key}); if the first part of the key is
+    None, the body is rendered every time."""
+
+    tags = set(['cache'])
+    cacheSize = 1000
+
+    def __init__(self, environment):
+        jinja2.ext.Extension.__init__(self, environment)
+        environment.extend(fragment_cache=jinja2.utils.LRUCache(
+            self.cacheSize))
+
+    def parse(self, parser):
+        lineno = parser.stream.next().lineno
+        # a template that is changed and reloaded gets new fragments
+        args = [jinja2.nodes.Const(uuid.uuid4().hex),
+                parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return jinja2.nodes.CallBlock(
+            self.call_method('_cache', [jinja2.nodes.List(args)]),
+            [], [], body).set_lineno(lineno)
+
+    def _cache(self, key, caller):
+        if not key[1]:
+            return caller()
+        key = tuple(key)
+        cache = self.environment.fragment_cache
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = cache[key] = caller()
+        return fragment
+
+
 def emailfilter(value):
     ''' Escape & obfuscate e-mail addresses
 
@@ -32,7 +32,9 @@ from buildbot.status.web.buildstatus import BuildStatusStatusResource
 from buildbot.status.web.change_hook import ChangeHookResource
 from buildbot.status.web.changes import ChangesResource
 from buildbot.status.web.console import ConsoleStatusResource
+from buildbot.status.web.events import EventsResource
 from buildbot.status.web.feeds import Atom10StatusResource
+from buildbot.status.web.feeds import FeedCache
 from buildbot.status.web.feeds import Rss20StatusResource
 from buildbot.status.web.grid import GridStatusResource
 from buildbot.status.web.grid import TransposedGridStatusResource
@@ -168,7 +170,8 @@ class WebStatus(service.MultiService):
                  revlink=None, projects=None, repositories=None,
                  authz=None, logRotateLength=None, maxRotatedFiles=None,
                  change_hook_dialects={}, provide_feeds=None, jinja_loaders=None,
-                 change_hook_auth=None):
+                 change_hook_auth=None, jinja_bytecode_cache=True,
+                 jinja_auto_reload=True):
         """Run a web server that provides Buildbot status.
 
         @type  http_port: int or L{twisted.application.strports} string
@@ -290,6 +293,17 @@ class WebStatus(service.MultiService):
         @type  jinja_loaders: None or list
         @param jinja_loaders: If not empty, a list of additional Jinja2 loader
                               objects to search for templates.
+
+        @type  jinja_bytecode_cache: bool
+        @param jinja_bytecode_cache: If True, compiled templates are kept in
+                              the C{templates_cache} directory of the
+                              master, so that they are not compiled again
+                              after a restart.
+
+        @type  jinja_auto_reload: bool
+        @param jinja_auto_reload: If False, templates are not checked for
+                              changes once they have been loaded.  Changed
+                              templates are then only used after a restart.
         """
 
         service.MultiService.__init__(self)
@@ -382,6 +396,16 @@ class WebStatus(service.MultiService):
         # down. See ticket #102 for more details.
         self.channels = weakref.WeakKeyDictionary()
 
+        # the LogTailer of each running log that someone is tailing, shared
+        # by all of its viewers
+        self.logTailers = weakref.WeakKeyDictionary()
+
+        # rendered feeds, and the entries they are made of
+        self.feedCache = FeedCache()
+
+        # the /png resource, which follows the status to keep its results
+        self.pngStatus = None
+
         # do we want to allow change_hook
         self.change_hook_dialects = {}
         if change_hook_dialects:
@@ -399,6 +423,8 @@ class WebStatus(service.MultiService):
             self.provide_feeds = provide_feeds
 
         self.jinja_loaders = jinja_loaders
+        self.jinja_bytecode_cache = jinja_bytecode_cache
+        self.jinja_auto_reload = jinja_auto_reload
 
     def setupProtectedResource(self, resource_obj, checkers):
         class SimpleRealm(object):
@@ -438,6 +464,7 @@ class WebStatus(service.MultiService):
         self.putChild("authfail", AuthFailResource())
         self.putChild("authzfail", AuthzFailResource())
         self.putChild("users", UsersResource())
+        self.putChild("events", EventsResource())
         self.putChild("login", LoginResource())
         self.putChild("logout", LogoutResource())
 
@@ -458,7 +485,9 @@ class WebStatus(service.MultiService):
             revlink = self.master.config.revlink
         self.templates = createJinjaEnv(revlink, self.changecommentlink,
                                         self.repositories, self.projects,
-                                        self.jinja_loaders, self.master.basedir)
+                                        self.jinja_loaders, self.master.basedir,
+                                        bytecode_cache=self.jinja_bytecode_cache,
+                                        auto_reload=self.jinja_auto_reload)
 
     def setServiceParent(self, parent):
         # this class keeps a *separate* link to the buildmaster, rather than
@@ -554,7 +583,8 @@ class WebStatus(service.MultiService):
         if "json" in self.provide_feeds:
             root.putChild("json", JsonStatusResource(status))
 
-        root.putChild("png", PngStatusResource(status))
+        self.pngStatus = PngStatusResource(status)
+        root.putChild("png", self.pngStatus)
 
         self.site.resource = root
 
@@ -574,6 +604,9 @@ class WebStatus(service.MultiService):
                 log.msg("WebStatus.stopService: error while disconnecting"
                         " leftover clients")
                 log.err()
+        self.feedCache.stop()
+        if self.pngStatus is not None:
+            self.pngStatus.stop()
         yield service.MultiService.stopService(self)
 
         # having shut them down, now remove our child services so they don't
@@ -32,6 +32,7 @@ from buildbot.status.web.base import HtmlResource
 from buildbot.status.web.base import css_classes
 from buildbot.status.web.base import getAndCheckProperties
 from buildbot.status.web.base import getRequestCharset
+from buildbot.status.web.base import fragment_key
 from buildbot.status.web.base import path_to_authzfail
 from buildbot.status.web.base import path_to_build
 from buildbot.status.web.base import path_to_builder
@@ -174,6 +175,7 @@ class StatusResourceBuild(HtmlResource):
 
         cxt['b'] = b
         cxt['path_to_builder'] = path_to_builder(req, b.getBuilder())
+        cxt['fragment_key'] = fragment_key(req, b)
 
         if not b.isFinished():
             step = b.getCurrentStep()
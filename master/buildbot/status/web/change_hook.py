@@ -20,11 +20,96 @@
 
 import re
 
+from buildbot import util
+from buildbot.util.bbcollections import OrderedDict
 from twisted.internet import defer
 from twisted.python import log
 from twisted.python.reflect import namedModule
 from twisted.web import resource
-from twisted.web import server
+
+
+class ChangeHookQueue(object):
+
+    """I hold changes received by web hooks until they are added to the
+    master, so that hook requests can be answered right away.
+
+    Changes that arrive while a batch is being added are taken together as
+    the next batch.  Deliveries that were already received, and changes for
+    a revision that was already queued for the same repository and branch,
+    are dropped for C{dedupWindow} seconds.  If a change cannot be added,
+    its revision and delivery are forgotten, so that a retry is accepted.
+    """
+
+    dedupWindow = 600
+
+    def __init__(self):
+        self.pending = []
+        # dedup key -> time seen, oldest first
+        self.recent = OrderedDict()
+        self.draining = False
+
+    def _expire(self, now):
+        while self.recent:
+            key, seen = self.recent.iteritems().next()
+            if now - seen < self.dedupWindow:
+                break
+            del self.recent[key]
+
+    def isDuplicateDelivery(self, deliveryId):
+        self._expire(util.now())
+        return ('delivery', deliveryId) in self.recent
+
+    def submit(self, master, changes, src, deliveryId=None):
+        """Queue C{changes} for adding to C{master}.  Returns a Deferred that
+        fires with the number of changes queued, once they have been added.
+        """
+        now = util.now()
+        self._expire(now)
+        deliveryKey = None
+        if deliveryId is not None:
+            deliveryKey = ('delivery', deliveryId)
+            self.recent[deliveryKey] = now
+        queued = []
+        for chdict in changes:
+            key = None
+            if chdict.get('revision') is not None:
+                key = ('revision', chdict.get('repository'),
+                       chdict.get('branch'), chdict.get('project'),
+                       chdict.get('codebase'), chdict['revision'])
+                if key in self.recent:
+                    continue
+                self.recent[key] = now
+            queued.append((chdict, (key, deliveryKey)))
+
+        d = defer.Deferred()
+        self.pending.append((master, src, queued, d))
+        if not self.draining:
+            self._drain()
+        return d
+
+    @defer.inlineCallbacks
+    def _drain(self):
+        self.draining = True
+        try:
+            while self.pending:
+                batch, self.pending = self.pending, []
+                added = 0
+                for master, src, changes, d in batch:
+                    for chdict, keys in changes:
+                        try:
+                            yield master.addChange(src=src, **chdict)
+                            added += 1
+                        except Exception:
+                            log.err(None, "adding change from web hook")
+                            # let the sender's retry through
+                            for key in keys:
+                                self.recent.pop(key, None)
+                if added:
+                    log.msg("added %d changes from web hooks" % added)
+                for master, src, changes, d in batch:
+                    d.callback(len(changes))
+        finally:
+            self.draining = False
 
 
 class ChangeHookResource(resource.Resource):
@@ -32,6 +117,11 @@ class ChangeHookResource(resource.Resource):
     contentType = "text/html; charset=utf-8"
     children = {}
 
+    # headers carrying a unique id for each delivery of a hook, used to drop
+    # deliveries that are retried
+    deliveryHeaders = ['X-GitHub-Delivery', 'X-Gitlab-Event-UUID',
+                       'X-Request-UUID']
+
     def __init__(self, dialects=None):
         """
         The keys of 'dialects' select a modules to load under
@@ -44,6 +134,8 @@ class ChangeHookResource(resource.Resource):
 
         self.dialects = dialects
         self.request_dialect = None
+        self.dialectModules = {}
+        self.queue = ChangeHookQueue()
 
     def getChild(self, name, request):
         return self
@@ -65,6 +157,13 @@ class ChangeHookResource(resource.Resource):
                 the http request object
         """
 
+        deliveryId = self.getDeliveryId(request)
+        if deliveryId is not None and \
+                self.queue.isDuplicateDelivery(deliveryId):
+            log.msg("ignoring repeated web hook delivery %s" % deliveryId)
+            request.setResponseCode(202)
+            return "duplicate delivery"
+
         try:
             changes, src = self.getChanges(request)
         except ValueError, val_err:
@@ -76,25 +175,31 @@ class ChangeHookResource(resource.Resource):
             request.setResponseCode(500, msg)
             return msg
 
-        log.msg("Payload: " + str(request.args))
-
         if not changes:
             log.msg("No changes found")
             return "no changes found"
-        d = self.submitChanges(changes, request, src)
-
-        def ok(_):
-            request.setResponseCode(202)
-            request.finish()
-
-        def err(why):
-            log.err(why, "adding changes from web hook")
-            request.setResponseCode(500)
-            request.finish()
-
-        d.addCallbacks(ok, err)
-
-        return server.NOT_DONE_YET
+        log.msg("queueing %d changes from the %s web hook"
+                % (len(changes), self.request_dialect))
+        d = self.submitChanges(changes, request, src, deliveryId)
+        d.addErrback(log.err, "adding changes from web hook")
+
+        # the changes are added in the background
+        request.setResponseCode(202)
+        return ""
+
+    def getDeliveryId(self, request):
+        for header in self.deliveryHeaders:
+            deliveryId = request.getHeader(header)
+            if deliveryId:
+                return deliveryId
+        return None
+
+    def getDialectModule(self, dialect):
+        if dialect not in self.dialectModules:
+            log.msg("Attempting to load module buildbot.status.web.hooks." + dialect)
+            self.dialectModules[dialect] = namedModule(
+                'buildbot.status.web.hooks.' + dialect)
+        return self.dialectModules[dialect]
 
     def getChanges(self, request):
         """
@@ -125,10 +230,8 @@ class ChangeHookResource(resource.Resource):
             dialect = 'base'
 
         if dialect in self.dialects:
-            log.msg("Attempting to load module buildbot.status.web.hooks." + dialect)
-            tempModule = namedModule('buildbot.status.web.hooks.' + dialect)
+            tempModule = self.getDialectModule(dialect)
             changes, src = tempModule.getChanges(request, self.dialects[dialect])
-            log.msg("Got the following changes %s" % changes)
             self.request_dialect = dialect
         else:
             m = "The dialect specified, '%s', wasn't whitelisted in change_hook" % dialect
@@ -138,9 +241,6 @@ class ChangeHookResource(resource.Resource):
 
         return (changes, src)
 
-    @defer.inlineCallbacks
-    def submitChanges(self, changes, request, src):
+    def submitChanges(self, changes, request, src, deliveryId=None):
         master = request.site.buildbot_service.master
-        for chdict in changes:
-            change = yield master.addChange(src=src, **chdict)
-            log.msg("injected change %s" % change)
+        return self.queue.submit(master, changes, src, deliveryId)
@@ -0,0 +1,292 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from collections import deque
+
+from buildbot.status import base
+from buildbot.util import json
+from twisted.internet import reactor
+from twisted.internet import task
+from twisted.internet.interfaces import IPushProducer
+from twisted.python import log
+from twisted.web import resource
+from twisted.web import server
+from zope.interface import implements
+
+# sent to a client that missed events, which should then reload everything
+RESYNC = "event: resync\ndata: {}\n\n"
+KEEPALIVE = ":\n\n"
+
+
+def encodeEvent(eventid, event, data):
+    return "id: %d\nevent: %s\ndata: %s\n\n" % (
+        eventid, event, json.dumps(data, separators=(',', ':')))
+
+
+class EventStream(object):
+
+    """One client of the /events resource.
+
+    I am registered as a streaming producer on the client's request, so I
+    am paused while the client is not reading.  While paused, up to
+    C{maxBuffered} events are kept; if more arrive, they are all dropped and
+    the client is told to resync when it reads again, so a slow client
+    cannot make the master buffer without bound."""
+
+    implements(IPushProducer)
+
+    maxBuffered = 100
+
+    def __init__(self, request, builders=None, tags=None):
+        self.request = request
+        self.builders = builders and set(builders)
+        self.tags = tags and set(tags)
+        self.paused = False
+        self.overflowed = False
+        self.buffer = []
+        self.hub = None
+        # builder name -> whether I want its events, when filtering on tags
+        self._wanted = {}
+
+    def wants(self, buildername, builder_status=None):
+        """Do I want the events of C{buildername}?"""
+        if self.builders and buildername not in self.builders:
+            return False
+        if self.tags:
+            if builder_status is None:
+                # not announced (yet); don't remember the answer
+                return False
+            if buildername not in self._wanted:
+                self._wanted[buildername] = bool(
+                    builder_status.matchesAnyTag(self.tags))
+            return self._wanted[buildername]
+        return True
+
+    def write(self, message):
+        if not self.paused:
+            self.request.write(message)
+        elif self.overflowed:
+            pass
+        elif len(self.buffer) < self.maxBuffered:
+            self.buffer.append(message)
+        else:
+            self.overflowed = True
+            self.buffer = []
+
+    # IPushProducer
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        if self.overflowed:
+            self.overflowed = False
+            self.request.write(RESYNC)
+        else:
+            buffered, self.buffer = self.buffer, []
+            if buffered:
+                self.request.write(''.join(buffered))
+
+    def stopProducing(self):
+        if self.hub:
+            self.hub.removeStream(self)
+
+
+class EventHub(base.StatusReceiverBase):
+
+    """I subscribe to the status while anyone is listening to /events, and
+    hand each event, encoded once, to the L{EventStream}s that want it.
+
+    The last C{replaySize} events are kept so that a client that reconnects
+    with a C{Last-Event-ID} header gets those it missed, or a resync if too
+    many were missed.  While there are clients, each is sent a comment
+    every C{keepaliveInterval} seconds so that proxies keep the connection
+    open."""
+
+    replaySize = 100
+    keepaliveInterval = 15
+
+    def __init__(self, status):
+        self.status = status
+        self.streams = set()
+        self.builders = {}
+        self.recent = deque(maxlen=self.replaySize)  # (id, builder, message)
+        self.lastId = 0
+        self.subscribed = False
+        self._keepalive = None
+        # for tests
+        self._reactor = reactor
+
+    def addStream(self, stream, lastEventId=None):
+        stream.hub = self
+        if not self.subscribed:
+            self.subscribed = True
+            self.status.subscribe(self)
+            self._keepalive = task.LoopingCall(self._sendKeepalive)
+            self._keepalive.clock = self._reactor
+            self._keepalive.start(self.keepaliveInterval, now=False)
+        self.streams.add(stream)
+        if lastEventId is not None:
+            self._replay(stream, lastEventId)
+
+    def removeStream(self, stream):
+        self.streams.discard(stream)
+        stream.hub = None
+        if not self.streams and self.subscribed:
+            self.subscribed = False
+            self._keepalive.stop()
+            self._keepalive = None
+            for builder_status in self.builders.values():
+                builder_status.unsubscribe(self)
+            self.builders = {}
+            self.status.unsubscribe(self)
+
+    def stop(self):
+        for stream in list(self.streams):
+            self.removeStream(stream)
+
+    def _replay(self, stream, lastEventId):
+        try:
+            lastEventId = int(lastEventId)
+        except ValueError:
+            lastEventId = -1
+        if lastEventId >= self.lastId:
+            return
+        if not self.recent or lastEventId < self.recent[0][0] - 1:
+            stream.write(RESYNC)
+            return
+        for eventid, buildername, message in self.recent:
+            if eventid > lastEventId:
+                self._deliver(stream, buildername, message)
+
+    def _sendKeepalive(self):
+        for stream in self.streams:
+            if not stream.paused:
+                stream.write(KEEPALIVE)
+
+    def _deliver(self, stream, buildername, message):
+        if buildername is None or stream.wants(
+                buildername, self.builders.get(buildername)):
+            stream.write(message)
+
+    def publish(self, event, buildername, data):
+        """Send an event to the streams that want it; C{buildername} is None
+        for events that are not about a builder."""
+        if not self.streams:
+            return
+        self.lastId += 1
+        message = encodeEvent(self.lastId, event, data)
+        self.recent.append((self.lastId, buildername, message))
+        for stream in list(self.streams):
+            try:
+                self._deliver(stream, buildername, message)
+            except Exception:
+                log.err(None, "while sending an event to a client")
+                self.removeStream(stream)
+
+    # IStatusReceiver
+
+    def builderAdded(self, name, builder_status):
+        self.builders[name] = builder_status
+        return self
+
+    def builderRemoved(self, name):
+        self.builders.pop(name, None)
+
+    def builderChangedState(self, name, state):
+        self.publish('builderState', name, {'builder': name, 'state': state})
+
+    def buildStarted(self, name, build):
+        self.publish('buildStarted', name, {
+            'builder': name,
+            'number': build.getNumber(),
+            'slave': build.getSlavename(),
+            'start': build.getTimes()[0],
+        })
+        return self
+
+    def buildFinished(self, name, build, results):
+        self.publish('buildFinished', name, {
+            'builder': name,
+            'number': build.getNumber(),
+            'results': results,
+            'text': build.getText(),
+            'end': build.getTimes()[1],
+        })
+
+    def _stepEvent(self, event, build, step, **kwargs):
+        name = build.getBuilder().getName()
+        data = {
+            'builder': name,
+            'number': build.getNumber(),
+            'step': step.getName(),
+        }
+        data.update(kwargs)
+        self.publish(event, name, data)
+
+    def stepStarted(self, build, step):
+        self._stepEvent('stepStarted', build, step)
+
+    def stepTextChanged(self, build, step, text):
+        self._stepEvent('stepText', build, step, text=text)
+
+    def stepFinished(self, build, step, results):
+        self._stepEvent('stepFinished', build, step, results=results[0],
+                        text=step.getText())
+
+    def slaveConnected(self, name):
+        self.publish('slaveConnected', None, {'slave': name})
+
+    def slaveDisconnected(self, name):
+        self.publish('slaveDisconnected', None, {'slave': name})
+
+
+class EventsResource(resource.Resource):
+
+    """Server-sent events (text/event-stream) about builds, steps and
+    slaves, as they happen.  The C{builder} and C{tag} arguments, which can
+    be repeated, limit the events about builds to those builders."""
+
+    isLeaf = True
+
+    def __init__(self):
+        resource.Resource.__init__(self)
+        self.hub = None
+
+    def getHub(self, request):
+        if self.hub is None:
+            status = request.site.buildbot_service.getStatus()
+            self.hub = EventHub(status)
+        return self.hub
+
+    def render_GET(self, request):
+        request.setHeader("content-type", "text/event-stream")
+        request.setHeader("cache-control", "no-cache")
+        # tell the browser how long to wait before reconnecting
+        request.write("retry: 5000\n\n")
+
+        hub = self.getHub(request)
+        stream = EventStream(request,
+                             builders=request.args.get('builder'),
+                             tags=request.args.get('tag'))
+        request.registerProducer(stream, True)
+        hub.addStream(stream, request.getHeader('last-event-id'))
+
+        def lost(_):
+            if stream.hub:
+                stream.hub.removeStream(stream)
+        request.notifyFinish().addBoth(lost)
+        return server.NOT_DONE_YET
@@ -38,11 +38,17 @@
 # buildbot/status/web/feeds.py (you're reading it, ;-)) and
 # buildbot/status/web/baseweb.py.
 
+import calendar
+import hashlib
 import os
 import re
 import time
 
 from buildbot.status import results
+from buildbot.status.base import StatusReceiverBase
+from buildbot.util.bbcollections import OrderedDict
+from twisted.internet import reactor
+from twisted.web import http
 from twisted.web import resource
 
 
@@ -73,6 +79,111 @@ def rfc822_time(tstamp):
     return res
 
 
+class FeedDocument(object):
+
+    """A rendered feed, with the validators a client can send back to ask
+    whether it changed."""
+
+    def __init__(self, data, lastModified):
+        self.data = data
+        self.lastModified = lastModified
+        self.etag = '"%s"' % hashlib.md5(data).hexdigest()
+
+
+class FeedCache(StatusReceiverBase):
+
+    """I keep the rendered feeds of a L{WebStatus}, and the entries they are
+    made of, so that polling a feed does not load and render the same
+    builds again.
+
+    An entry describes a finished build, so it never changes; entries are
+    kept for the C{entryCacheSize} builds most recently shown.  Documents
+    are kept for the C{documentCacheSize} most recently asked for feeds
+    and arguments, until a build finishes or a builder is added or
+    removed.  Documents that only list failures are kept until a build
+    fails.  In case a notification is missed, no document is kept for
+    more than C{documentMaxAge} seconds."""
+
+    entryCacheSize = 200
+    documentCacheSize = 50
+    documentMaxAge = 60
+
+    def __init__(self):
+        self.status = None
+        self.builders = {}
+        self.entries = OrderedDict()    # (builder, number) -> entry
+        self.documents = OrderedDict()  # key -> (generation, time, doc)
+        self.generation = 0
+        self.failureGeneration = 0
+        # for tests
+        self._reactor = reactor
+
+    def subscribe(self, status):
+        if self.status is None:
+            self.status = status
+            status.subscribe(self)
+
+    def stop(self):
+        if self.status is not None:
+            for builder_status in self.builders.values():
+                builder_status.unsubscribe(self)
+            self.builders = {}
+            self.status.unsubscribe(self)
+            self.status = None
+        self.documents.clear()
+
+    def builderAdded(self, builderName, builder):
+        self.builders[builderName] = builder
+        self._invalidate(failures=True)
+        return self
+
+    def builderRemoved(self, builderName):
+        self.builders.pop(builderName, None)
+        self._invalidate(failures=True)
+
+    def buildFinished(self, builderName, build, result):
+        self._invalidate(failures=(result == results.FAILURE))
+
+    def _invalidate(self, failures):
+        self.generation += 1
+        if failures:
+            self.failureGeneration += 1
+
+    def getDocument(self, key, failuresOnly, render):
+        """Return the L{FeedDocument} for KEY, calling RENDER to make it
+        if it is not cached or is out of date."""
+        if failuresOnly:
+            generation = self.failureGeneration
+        else:
+            generation = self.generation
+        now = self._reactor.seconds()
+        cached = self.documents.pop(key, None)
+        if (cached is None or cached[0] != generation
+                or now - cached[1] > self.documentMaxAge):
+            cached = (generation, now, render())
+        self.documents[key] = cached
+        while len(self.documents) > self.documentCacheSize:
+            self.documents.popitem(last=False)
+        return cached[2]
+
+    def getEntry(self, build, render):
+        """Return the entry for BUILD, calling RENDER(build) to make it if
+        it is not cached."""
+        key = (build.getBuilder().getName(), build.getNumber())
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            entry = render(build)
+        self.entries[key] = entry
+        while len(self.entries) > self.entryCacheSize:
+            self.entries.popitem(last=False)
+        return entry
+
+
+def isFailuresOnly(request):
+    failures_only = request.args.get("failures_only", ["false"])
+    return failures_only[0] not in ('false', '0', 'no', 'off')
+
+
 class FeedResource(XmlResource):
     pageTitle = None
     link = 'http://dummylink'
@@ -128,8 +239,7 @@ class FeedResource(XmlResource):
         if showTags:
             builders = [b for b in builders if b.matchesAnyTag(tags=showTags)]
 
-        failures_only = request.args.get("failures_only", ["false"])
-        failures_only = failures_only[0] not in ('false', '0', 'no', 'off')
+        failures_only = isFailuresOnly(request)
 
         filterProjects = [p for p in request.args.get("project", []) if p]
 
@@ -140,120 +250,54 @@ class FeedResource(XmlResource):
 
         maxFeeds = 25
 
-        # Copy all failed builds in a new list.
-        # This could clearly be implemented much better if we had
-        # access to a global list of builds.
-        for b in builders:
-            if failures_only:
-                res = (results.FAILURE,)
-            else:
-                res = None
-            builds.extend(b.generateFinishedBuilds(results=res,
-                                                   max_search=maxFeeds,
-                                                   filter_fn=filter_project))
-
-        # Sort build list by date, youngest first.
-        # To keep compatibility with python < 2.4, use this for sorting instead:
-        # We apply Decorate-Sort-Undecorate
-        deco = sorted([(build.getTimes(), build) for build in builds])
-        deco.reverse()
-        builds = [build for (b1, build) in deco]
-
-        if builds:
-            builds = builds[:min(len(builds), maxFeeds)]
+        if failures_only:
+            res = (results.FAILURE,)
+        else:
+            res = None
+
+        # the master's history of finished builds gives them youngest first
+        if builders:
+            g = self.status.generateFinishedBuilds(
+                builders=[b.getName() for b in builders],
+                num_builds=maxFeeds, max_search=maxFeeds, results=res,
+                filter_fn=filter_project)
+            builds.extend(g)
         return builds
 
+    def render(self, request):
+        cache = request.site.buildbot_service.feedCache
+        cache.subscribe(self.status)
+        args = tuple(sorted((name, tuple(values))
+                            for name, values in request.args.items()))
+        document = cache.getDocument((self, args), isFailuresOnly(request),
+                                     lambda: self.renderDocument(request))
+
+        request.setHeader("content-type", self.contentType)
+        if request.setETag(document.etag) == http.CACHED:
+            return ''
+        if request.getHeader('if-none-match'):
+            # the entity tag decides; If-Modified-Since is ignored
+            request.setHeader('last-modified',
+                              http.datetimeToString(document.lastModified))
+        elif request.setLastModified(document.lastModified) == http.CACHED:
+            return ''
+        if request.method == "HEAD":
+            request.setHeader("content-length", len(document.data))
+            return ''
+        return document.data
+
     def content(self, request):
+        return self.renderDocument(request).data
+
+    def renderDocument(self, request):
         builds = self.getBuilds(request)
+        cache = request.site.buildbot_service.feedCache
 
         build_cxts = []
-
+        lastModified = calendar.timegm(self.pubdate)
         for build in builds:
-            start, finished = build.getTimes()
-            finishedTime = time.gmtime(int(finished))
-            link = re.sub(r'index.html', "", self.status.getURLForThing(build))
-
-            # title: trunk r22191 (plus patch) failed on
-            # 'i686-debian-sarge1 shared gcc-3.3.5'
-            ss_list = build.getSourceStamps()
-            all_got_revisions = build.getAllGotRevisions()
-            src_cxts = []
-            for ss in ss_list:
-                sc = {}
-                sc['codebase'] = ss.codebase
-                if (ss.branch is None and ss.revision is None and ss.patch is None
-                        and not ss.changes):
-                    sc['repository'] = None
-                    sc['branch'] = None
-                    sc['revision'] = "Latest revision"
-                else:
-                    sc['repository'] = ss.repository
-                    sc['branch'] = ss.branch
-                    got_revision = all_got_revisions.get(ss.codebase, None)
-                    if got_revision:
-                        sc['revision'] = got_revision
-                    else:
-                        sc['revision'] = str(ss.revision)
-                if ss.patch:
-                    sc['revision'] += " (plus patch)"
-                if ss.changes:
-                    pass
-                src_cxts.append(sc)
-            res = build.getResults()
-            pageTitle = ('Builder "%s": %s' %
-                         (build.getBuilder().getName(), results.Results[res]))
-
-            # Add information about the failing steps.
-            failed_steps = []
-            log_lines = []
-            for s in build.getSteps():
-                res = s.getResults()[0]
-                if res not in (results.SUCCESS, results.WARNINGS,
-                               results.SKIPPED):
-                    failed_steps.append(s.getName())
-
-                    # Add the last 30 lines of each log.
-                    for log in s.getLogs():
-                        log_lines.append('Last lines of build log "%s":' %
-                                         log.getName())
-                        log_lines.append([])
-                        try:
-                            logdata = log.getText()
-                        except IOError:
-                            # Probably the log file has been removed
-                            logdata = '** log file not available **'
-                        unilist = list()
-                        for line in logdata.split('\n')[-30:]:
-                            unilist.append(unicode(line, 'utf-8', 'replace'))
-                        log_lines.extend(unilist)
-
-            bc = {}
-            bc['sources'] = src_cxts
-            bc['date'] = rfc822_time(finishedTime)
-            bc['summary_link'] = ('%sbuilders/%s' %
-                                  (self.link,
-                                   build.getBuilder().getName()))
-            bc['name'] = build.getBuilder().getName()
-            bc['number'] = build.getNumber()
-            bc['responsible_users'] = build.getResponsibleUsers()
-            bc['failed_steps'] = failed_steps
-            bc['pageTitle'] = pageTitle
-            bc['link'] = link
-            bc['log_lines'] = log_lines
-
-            if finishedTime is not None:
-                bc['rfc822_pubdate'] = rfc822_time(finishedTime)
-                bc['rfc3339_pubdate'] = time.strftime("%Y-%m-%dT%H:%M:%SZ",
-                                                      finishedTime)
-
-                # Every RSS/Atom item must have a globally unique ID
-                guid = ('tag:%s@%s,%s:%s' %
-                        (self.user, self.hostname,
-                         time.strftime("%Y-%m-%d", finishedTime),
-                         time.strftime("%Y%m%d%H%M%S", finishedTime)))
-                bc['guid'] = guid
-
-            build_cxts.append(bc)
+            lastModified = max(lastModified, build.getTimes()[1])
+            build_cxts.append(cache.getEntry(build, self.renderEntry))
 
         pageTitle = self.pageTitle
         if not pageTitle:
@@ -272,7 +316,95 @@ class FeedResource(XmlResource):
 
         cxt['builds'] = build_cxts
         template = request.site.buildbot_service.templates.get_template(self.template_file)
-        return template.render(**cxt).encode('utf-8').strip()
+        data = template.render(**cxt).encode('utf-8').strip()
+        return FeedDocument(data, lastModified)
+
+    def renderEntry(self, build):
+        start, finished = build.getTimes()
+        finishedTime = time.gmtime(int(finished))
+        link = re.sub(r'index.html', "", self.status.getURLForThing(build))
+
+        # title: trunk r22191 (plus patch) failed on
+        # 'i686-debian-sarge1 shared gcc-3.3.5'
+        ss_list = build.getSourceStamps()
+        all_got_revisions = build.getAllGotRevisions()
+        src_cxts = []
+        for ss in ss_list:
+            sc = {}
+            sc['codebase'] = ss.codebase
+            if (ss.branch is None and ss.revision is None and ss.patch is None
+                    and not ss.changes):
+                sc['repository'] = None
+                sc['branch'] = None
+                sc['revision'] = "Latest revision"
+            else:
+                sc['repository'] = ss.repository
+                sc['branch'] = ss.branch
+                got_revision = all_got_revisions.get(ss.codebase, None)
+                if got_revision:
+                    sc['revision'] = got_revision
+                else:
+                    sc['revision'] = str(ss.revision)
+            if ss.patch:
+                sc['revision'] += " (plus patch)"
+            if ss.changes:
+                pass
+            src_cxts.append(sc)
+        res = build.getResults()
+        pageTitle = ('Builder "%s": %s' %
+                     (build.getBuilder().getName(), results.Results[res]))
+
+        # Add information about the failing steps.
+        failed_steps = []
+        log_lines = []
+        for s in build.getSteps():
+            res = s.getResults()[0]
+            if res not in (results.SUCCESS, results.WARNINGS,
+                           results.SKIPPED):
+                failed_steps.append(s.getName())
+
+                # Add the last 30 lines of each log.
+                for log in s.getLogs():
+                    log_lines.append('Last lines of build log "%s":' %
+                                     log.getName())
+                    log_lines.append([])
+                    try:
+                        logdata = log.getText()
+                    except IOError:
+                        # Probably the log file has been removed
+                        logdata = '** log file not available **'
+                    unilist = list()
+                    for line in logdata.split('\n')[-30:]:
+                        unilist.append(unicode(line, 'utf-8', 'replace'))
+                    log_lines.extend(unilist)
+
+        bc = {}
+        bc['sources'] = src_cxts
+        bc['date'] = rfc822_time(finishedTime)
+        bc['summary_link'] = ('%sbuilders/%s' %
+                              (self.link,
+                               build.getBuilder().getName()))
+        bc['name'] = build.getBuilder().getName()
+        bc['number'] = build.getNumber()
+        bc['responsible_users'] = build.getResponsibleUsers()
+        bc['failed_steps'] = failed_steps
+        bc['pageTitle'] = pageTitle
+        bc['link'] = link
+        bc['log_lines'] = log_lines
+
+        if finishedTime is not None:
+            bc['rfc822_pubdate'] = rfc822_time(finishedTime)
+            bc['rfc3339_pubdate'] = time.strftime("%Y-%m-%dT%H:%M:%SZ",
+                                                  finishedTime)
+
+            # Every RSS/Atom item must have a globally unique ID
+            guid = ('tag:%s@%s,%s:%s' %
+                    (self.user, self.hostname,
+                     time.strftime("%Y-%m-%d", finishedTime),
+                     time.strftime("%Y%m%d%H%M%S", finishedTime)))
+            bc['guid'] = guid
+
+        return bc
 
 
 class Rss20StatusResource(FeedResource):
@@ -14,6 +14,8 @@
 # Copyright Buildbot Team Members
 
 from buildbot.sourcestamp import SourceStamp
+from buildbot.status import history
+from buildbot.status.results import Results
 from buildbot.status.web.base import HtmlResource
 from buildbot.status.web.base import build_get_class
 from buildbot.status.web.base import path_to_build
@@ -69,6 +71,28 @@ class GridStatusMixin(object):
         cxt['class'] = build_get_class(build)
         return cxt
 
+    def cell_cxt(self, request, builder, cell):
+        """Like L{build_cxt}, for a L{history.GridCell} of C{builder}."""
+        if not cell:
+            return {}
+
+        if cell.results is not None:
+            text = cell.text
+            if not text:
+                text = ["(no information)"]
+            if text == ["build", "successful"]:
+                text = ["OK"]
+            css_class = Results[cell.results]
+        else:
+            text = ['building']
+            css_class = "running"
+
+        return {'name': builder.getName(),
+                'url': path_to_builder(request, builder) +
+                "/builds/%d" % cell.number,
+                'text': text,
+                'class': css_class}
+
     @defer.inlineCallbacks
     def builder_cxt(self, request, builder):
         state, builds = builder.getState()
@@ -102,8 +126,7 @@ class GridStatusMixin(object):
         This function returns an appropriate comparison key for that.
         """
         # TODO: Maybe order sourcestamps in key by codebases names?
-        return tuple([(ss.branch, ss.revision, ss.patch, ss.codebase,
-                       ss.project) for ss in sourcestamps])
+        return history.sourceStampKey(sourcestamps)
 
     def clearRecentBuildsCache(self):
         self.__recentBuildsCache__ = {}
@@ -171,6 +194,57 @@ class GridStatusMixin(object):
 
         return sourcestamps
 
+    def getGridRows(self, status, numBuilds, builderNames, branch):
+        """Return the last NUMBUILDS rows of the status' grid matrix with
+        a build on one of BUILDERNAMES, or None if it does not have that
+        many (for instance, just after an upgrade)."""
+        grid = getattr(status, 'gridMatrix', None)
+        if grid is None:
+            return None
+        branches = None if branch == ANYBRANCH else [branch]
+        rows = grid.getRows(numBuilds, builderNames, branches)
+        if len(rows) < numBuilds:
+            return None
+        return rows
+
+    def getGrid(self, request, status, numBuilds, tags, branch):
+        """Return the source stamps of each row of the grid, as lists of
+        dicts; the builders to show; and for each of those builders, the
+        context of its build in each row."""
+        builders = []
+        for bn in sorted(status.getBuilderNames()):
+            builder = status.getBuilder(bn)
+            if tags and not builder.matchesAnyTag(tags):
+                continue
+            builders.append(builder)
+
+        rows = self.getGridRows(status, numBuilds,
+                                [b.getName() for b in builders], branch)
+        if rows is not None:
+            cells = [[self.cell_cxt(request, b, row.cells.get(b.getName()))
+                      for row in rows]
+                     for b in builders]
+            return [row.sources for row in rows], builders, cells
+
+        # otherwise, look through the builders' recent builds
+        stamps = self.getRecentSourcestamps(status, numBuilds, tags, branch)
+        keys = [self.getSourceStampKey(sstamp) for sstamp in stamps]
+        cells = []
+        for builder in builders:
+            builds = [None] * len(stamps)
+            for build in self.getRecentBuilds(builder, numBuilds, branch):
+                # TODO: support multiple sourcestamps
+                ss = build.getSourceStamps(absolute=True)
+                key = self.getSourceStampKey(ss)
+
+                for i, stampKey in enumerate(keys):
+                    if key == stampKey and builds[i] is None:
+                        builds[i] = build
+            cells.append([self.build_cxt(request, build) for build in builds])
+        self.clearRecentBuildsCache()
+        return ([map(SourceStamp.asDict, sstamp) for sstamp in stamps],
+                builders, cells)
+
 
 class GridStatusResource(HtmlResource, GridStatusMixin):
     # TODO: docs
@@ -194,44 +268,24 @@ class GridStatusResource(HtmlResource, GridStatusMixin):
 
         # and the data we want to render
         status = self.getStatus(request)
-        stamps = self.getRecentSourcestamps(status, numBuilds, tags, branch)
+        stamps, builders, cells = self.getGrid(request, status, numBuilds,
+                                               tags, branch)
 
         cxt['refresh'] = self.get_reload_time(request)
 
         cxt.update({'tags': tags,
                     'branch': branch,
                     'ANYBRANCH': ANYBRANCH,
-                    'stamps': [map(SourceStamp.asDict, sstamp) for sstamp in stamps],
+                    'stamps': stamps,
                     })
 
-        sortedBuilderNames = sorted(status.getBuilderNames())
-
         cxt['builders'] = []
 
-        for bn in sortedBuilderNames:
-            builds = [None] * len(stamps)
-
-            builder = status.getBuilder(bn)
-            if tags and not builder.matchesAnyTag(tags):
-                continue
-
-            for build in self.getRecentBuilds(builder, numBuilds, branch):
-                ss = build.getSourceStamps(absolute=True)
-                key = self.getSourceStampKey(ss)
-
-                for i, sstamp in enumerate(stamps):
-                    if key == self.getSourceStampKey(sstamp) and builds[i] is None:
-                        builds[i] = build
-
+        for builder, builds in zip(builders, cells):
             b = yield self.builder_cxt(request, builder)
-
-            b['builds'] = []
-            for build in builds:
-                b['builds'].append(self.build_cxt(request, build))
-
+            b['builds'] = builds
             cxt['builders'].append(b)
 
-        self.clearRecentBuildsCache()
         template = request.site.buildbot_service.templates.get_template("grid.html")
         defer.returnValue(template.render(**cxt))
 
@@ -265,44 +319,27 @@ class TransposedGridStatusResource(HtmlResource, GridStatusMixin):
 
         # and the data we want to render
         status = self.getStatus(request)
-        stamps = self.getRecentSourcestamps(status, numBuilds, tags, branch)
+        stamps, builders_shown, cells = self.getGrid(request, status,
+                                                     numBuilds, tags, branch)
 
         cxt.update({'tags': tags,
                     'branch': branch,
                     'ANYBRANCH': ANYBRANCH,
-                    'stamps': [map(SourceStamp.asDict, sstamp) for sstamp in stamps],
+                    'stamps': stamps,
                     })
 
         sortedBuilderNames = sorted(status.getBuilderNames())
 
         cxt['sorted_builder_names'] = sortedBuilderNames
-        cxt['builder_builds'] = builder_builds = []
+        cxt['builder_builds'] = cells
         cxt['builders'] = builders = []
         cxt['range'] = range(len(stamps))
         if rev_order == "desc":
             cxt['range'].reverse()
 
-        for bn in sortedBuilderNames:
-            builds = [None] * len(stamps)
-
-            builder = status.getBuilder(bn)
-            if tags and not builder.matchesAnyTag(tags):
-                continue
-
-            for build in self.getRecentBuilds(builder, numBuilds, branch):
-                # TODO: support multiple sourcestamps
-                ss = build.getSourceStamps(absolute=True)
-                key = self.getSourceStampKey(ss)
-
-                for i, sstamp in enumerate(stamps):
-                    if key == self.getSourceStampKey(sstamp) and builds[i] is None:
-                        builds[i] = build
-
+        for builder in builders_shown:
             b = yield self.builder_cxt(request, builder)
             builders.append(b)
 
-            builder_builds.append(map(lambda b: self.build_cxt(request, b), builds))
-
-        self.clearRecentBuildsCache()
         template = request.site.buildbot_service.templates.get_template('grid_transposed.html')
         defer.returnValue(template.render(**cxt))
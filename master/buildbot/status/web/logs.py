@@ -13,7 +13,9 @@
 #
 # Copyright Buildbot Team Members
 
+from collections import deque
 
+from twisted.internet.interfaces import IPushProducer
 from twisted.python import components
 from twisted.spread import pb
 from twisted.web import server
@@ -74,6 +76,8 @@ class TextLog(Resource):
         if path == "text":
             self.asText = True
             return self
+        if path == "tail":
+            return TailLog(self.original)
         return Resource.getChild(self, path, req)
 
     def content(self, entries):
@@ -181,6 +185,246 @@ class HTMLLog(Resource):
 components.registerAdapter(HTMLLog, logfile.HTMLLogFile, IHTMLLog)
 
 
+class LogTailer:
+
+    """I watch one running log for everyone tailing it: a single
+    subscription to the L{LogFile}, whose text I hand to each
+    L{LogTailViewer}.
+
+    I keep the last C{tailSize} bytes of the log's text (stdout and stderr,
+    as in its /text view), read once when I am created and then kept up to
+    date, so new viewers asking for the last lines or a recent offset do not
+    read the log again."""
+
+    tailSize = 64 * 1024
+    channels = (logfile.STDOUT, logfile.STDERR)
+
+    def __init__(self, log, tailers=None):
+        self.log = log
+        self.tailers = tailers
+        self.viewers = set()
+        self.tail = deque()
+        self.tailLength = 0
+        self.length = 0  # bytes of text in the log
+        for text in log.getChunks(self.channels, onlyText=True):
+            self._append(text)
+
+    def watch(self):
+        # nothing can be added to the log between reading it and this
+        self.log.subscribe(self, False)
+        self.log.waitUntilFinished().addCallback(self.logfileFinished)
+
+    def _append(self, text):
+        self.tail.append(text)
+        self.tailLength += len(text)
+        self.length += len(text)
+        while self.tailLength - len(self.tail[0]) >= self.tailSize:
+            self.tailLength -= len(self.tail.popleft())
+
+    def getText(self, offset=None, lines=None):
+        """Return the offset of the text a new viewer should be sent first,
+        and that text, up to now: from C{offset}, or the last C{lines}
+        lines."""
+        start = self.length - self.tailLength
+        if offset is not None:
+            offset = min(max(offset, 0), self.length)
+            if offset >= start:
+                return offset, ''.join(self.tail)[offset - start:]
+            return offset, self._readFrom(offset)
+
+        # split like LogFile.iterLines does
+        parts = ''.join(self.tail).split('\n')
+        tailLines = [part + '\n' for part in parts[:-1]]
+        if parts[-1]:
+            tailLines.append(parts[-1])
+        # unless the buffer starts with the log, its first line is partial
+        if start == 0 or len(tailLines) > lines:
+            kept = ''.join(tailLines[-lines:]) if lines else ''
+            return self.length - len(kept), kept
+        kept = ''.join(self.log.getTail(lines, list(self.channels)))
+        return self.length - len(kept), kept
+
+    def _readFrom(self, offset):
+        pieces = []
+        for text in self.log.getChunks(self.channels, onlyText=True):
+            if offset >= len(text):
+                offset -= len(text)
+                continue
+            pieces.append(text[offset:])
+            offset = 0
+        return ''.join(pieces)
+
+    def addViewer(self, viewer):
+        self.viewers.add(viewer)
+        viewer.tailer = self
+
+    def removeViewer(self, viewer):
+        self.viewers.discard(viewer)
+        viewer.tailer = None
+        if not self.viewers:
+            self.log.unsubscribe(self)
+            self._forget()
+
+    def _forget(self):
+        if self.tailers.get(self.log) is self:
+            del self.tailers[self.log]
+
+    # log watcher interface
+
+    def logChunk(self, build, step, log, channel, text):
+        if channel not in self.channels:
+            return
+        self._append(text)
+        for viewer in list(self.viewers):
+            viewer.write(text)
+
+    def logfileFinished(self, log):
+        self._forget()
+        for viewer in list(self.viewers):
+            viewer.tailer = None
+            viewer.finish()
+        self.viewers = set()
+
+
+def getFinishedTail(log, lines, channels=LogTailer.channels):
+    """Return the offset of the last C{lines} lines of a finished log's
+    text, and those lines.  This is C{log.getTail} counting the bytes it
+    passes over, so the log is read once and only the lines kept are held
+    in memory."""
+    length = 0
+    kept = deque(maxlen=lines)
+    for line in log.iterLines(list(channels)):
+        length += len(line)
+        kept.append(line)
+    text = ''.join(kept)
+    return length - len(text), text
+
+
+def getLogTailer(req, log):
+    tailers = req.site.buildbot_service.logTailers
+    if log not in tailers:
+        tailers[log] = LogTailer(log, tailers)
+        tailers[log].watch()
+    return tailers[log]
+
+
+class LogTailViewer(object):
+
+    """One client tailing a log.  I am registered as a streaming producer on
+    its request; while the client is not reading, I keep at most the last
+    C{maxBuffered} bytes, and tell it how much it missed when it reads
+    again."""
+
+    implements(IPushProducer)
+
+    maxBuffered = 256 * 1024
+
+    def __init__(self, req):
+        self.req = req
+        self.tailer = None
+        self.paused = False
+        self.finishing = False
+        self.buffer = deque()
+        self.buffered = 0
+        self.skipped = 0
+
+    def write(self, text):
+        if not self.paused:
+            self.req.write(text)
+            return
+        self.buffer.append(text)
+        self.buffered += len(text)
+        while self.buffered > self.maxBuffered:
+            dropped = self.buffer.popleft()
+            self.buffered -= len(dropped)
+            self.skipped += len(dropped)
+
+    def finish(self):
+        if self.paused:
+            self.finishing = True
+        else:
+            self.req.unregisterProducer()
+            self.req.finish()
+
+    # IPushProducer
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        if self.skipped:
+            self.req.write("\n[... %d bytes skipped ...]\n" % self.skipped)
+            self.skipped = 0
+        if self.buffer:
+            self.req.write(''.join(self.buffer))
+            self.buffer.clear()
+            self.buffered = 0
+        if self.finishing:
+            self.finishing = False
+            self.finish()
+
+    def stopProducing(self):
+        if self.tailer:
+            self.tailer.removeViewer(self)
+
+# /builders/$builder/builds/$buildnum/steps/$stepname/logs/$logname/tail
+
+
+class TailLog(Resource):
+
+    """The text of a log, starting at the byte C{offset} of its text or
+    with its last C{lines} lines (50 by default), followed by the rest of
+    the log as it is written.  The offset of the first byte sent is given
+    in the X-Buildbot-Log-Offset header, so that a client can reconnect
+    where it left off."""
+
+    isLeaf = True
+    defaultLines = 50
+
+    def __init__(self, original):
+        Resource.__init__(self)
+        self.original = original
+
+    def render_GET(self, req):
+        offset = req.args.get('offset', [None])[0]
+        try:
+            if offset is not None:
+                offset = int(offset)
+            lines = max(int(req.args.get('lines', [self.defaultLines])[0]), 0)
+        except ValueError:
+            req.setResponseCode(400)
+            return "offset and lines must be numbers"
+
+        req.setHeader("content-type", "text/plain; charset=utf-8")
+        req.setHeader("cache-control", "no-cache")
+
+        if self.original.isFinished():
+            # nothing more will be written, so there is nothing to share;
+            # only an offset needs the log's chunks to be looked up
+            if offset is None:
+                start, text = getFinishedTail(self.original, lines)
+            else:
+                start, text = LogTailer(self.original).getText(offset, lines)
+            req.setHeader("x-buildbot-log-offset", str(start))
+            return text
+
+        tailer = getLogTailer(req, self.original)
+        start, text = tailer.getText(offset, lines)
+        req.setHeader("x-buildbot-log-offset", str(start))
+        viewer = LogTailViewer(req)
+        req.registerProducer(viewer, True)
+        if text:
+            req.write(text)
+        tailer.addViewer(viewer)
+
+        def lost(_):
+            if viewer.tailer:
+                viewer.tailer.removeViewer(viewer)
+        req.notifyFinish().addBoth(lost)
+        return server.NOT_DONE_YET
+
+
 class LogsResource(HtmlResource):
     addSlash = True
 
@@ -17,16 +17,43 @@
 """Simple PNG build status banner
 """
 
+import hashlib
 import os
 
+from twisted.web import http
 from twisted.web import resource
 
 from buildbot.status import results
+from buildbot.status.base import StatusReceiverBase
 
+# filename -> (contents, entity tag); the images never change
+_images = {}
 
-class PngStatusResource(resource.Resource):
+
+def getImage(filename):
+    """Return the contents and entity tag of the image FILENAME, which is
+    only read from disk the first time.
+    """
+    if filename not in _images:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'files', filename)
+        png = open(path, 'rb')
+        try:
+            image = png.read()
+        finally:
+            png.close()
+        _images[filename] = (image, '"%s"' % hashlib.md5(image).hexdigest())
+    return _images[filename]
+
+
+class PngStatusResource(StatusReceiverBase, resource.Resource):
 
     """Describe a single builder result as a PNG image
+
+    The results of the last build of each builder are kept once looked
+    up, until a build of that builder starts or finishes (which I learn
+    by subscribing to the status), so a badge is usually served without
+    loading a build.
     """
 
     isLeaf = True
@@ -35,6 +62,50 @@ class PngStatusResource(resource.Resource):
 
     def __init__(self, status):
         self.status = status
+        self.subscribed = False
+        self.builders = {}
+        self.lastResults = {}  # builder name -> results of its last build
+
+    def subscribe(self):
+        if not self.subscribed:
+            self.subscribed = True
+            self.status.subscribe(self)
+
+    def stop(self):
+        if self.subscribed:
+            self.subscribed = False
+            for builder_status in self.builders.values():
+                builder_status.unsubscribe(self)
+            self.builders = {}
+            self.status.unsubscribe(self)
+        self.lastResults = {}
+
+    def builderAdded(self, builderName, builder):
+        self.builders[builderName] = builder
+        self.lastResults.pop(builderName, None)
+        return self
+
+    def builderRemoved(self, builderName):
+        self.builders.pop(builderName, None)
+        self.lastResults.pop(builderName, None)
+
+    def buildStarted(self, builderName, build):
+        self.lastResults.pop(builderName, None)
+
+    def buildFinished(self, builderName, build, result):
+        self.lastResults.pop(builderName, None)
+
+    def getLastResults(self, builder):
+        """Return the results of the last build of BUILDER, or None if
+        it has no build or it is still running.
+        """
+        if builder not in self.lastResults:
+            build = self.status.getBuilder(builder).getBuild(-1)
+            if build is None:
+                self.lastResults[builder] = None
+            else:
+                self.lastResults[builder] = build.getResults()
+        return self.lastResults[builder]
 
     def getChild(self, name, request):
         """Just return itself
@@ -59,6 +130,8 @@ class PngStatusResource(resource.Resource):
         request.setHeader(
             'content-disposition', 'inline; filename="%s"' % (data['filename'])
         )
+        if request.setETag(data['etag']) == http.CACHED:
+            return ''
         return data['image']
 
     def content(self, request):
@@ -76,29 +149,21 @@ class PngStatusResource(resource.Resource):
         rev = request.args.get("revision", [None])[0]
 
         # default data
-        png_file = (
-            os.path.dirname(os.path.abspath(__file__)) +
-            '/files/unknown_' + size + '.png'
-        )
+        png_file = 'unknown_' + size + '.png'
         data = {'filename': 'unkwnown_' + size + '.png', 'image': None}
         builder = request.args.get('builder', [None])[0]
 
+        self.subscribe()
         if builder is not None and builder in self.status.getBuilderNames():
-            # get the last build result from this builder
-            build = self.status.getBuilder(builder).getBuild(b, rev)
-            if build is not None:
-                result = build.getResults()
-                if result is not None:
-                    data['filename'] = (
-                        results.Results[result] + '_' + size + '.png')
-
-                    # read the png file from the disc
-                    png_file = (os.path.dirname(os.path.abspath(__file__)) +
-                                '/files/' + data['filename'])
-
-        # load the png file from the file system
-        png = open(png_file, 'rb')
-        data['image'] = png.read()
-        png.close()
+            if b == -1 and rev is None:
+                result = self.getLastResults(builder)
+            else:
+                build = self.status.getBuilder(builder).getBuild(b, rev)
+                result = build.getResults() if build is not None else None
+            if result is not None:
+                data['filename'] = png_file = (
+                    results.Results[result] + '_' + size + '.png')
+
+        data['image'], data['etag'] = getImage(png_file)
 
         return data
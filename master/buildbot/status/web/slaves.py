@@ -27,8 +27,11 @@ from buildbot.status.web.base import ActionResource
 from buildbot.status.web.base import BuildLineMixin
 from buildbot.status.web.base import HtmlResource
 from buildbot.status.web.base import abbreviate_age
+from buildbot.status.web.base import css_classes
 from buildbot.status.web.base import path_to_authzfail
+from buildbot.status.web.base import path_to_root
 from buildbot.status.web.base import path_to_slave
+from buildbot.status.web.base import rev_list
 
 
 class ShutdownActionResource(ActionResource):
@@ -119,13 +122,21 @@ class OneBuildSlaveResource(HtmlResource, BuildLineMixin):
             max_builds = 10
 
         recent_builds = []
-        n = 0
-        for rb in s.generateFinishedBuilds(builders=[b.getName() for b in my_builders]):
-            if rb.getSlavename() == self.slavename:
-                n += 1
-                recent_builds.append(self.get_line_values(request, rb))
-                if n > max_builds:
-                    break
+        summaries = s.getSlaveBuildSummaries(self.slavename)
+        if (s.getSlaveBuildSummariesCompleteSince() is not None or
+                len(summaries) >= max_builds):
+            # the slave's own index has every build since it was started, so
+            # none is loaded and it is all there is to show; until then
+            # search the builders
+            for summary in summaries[:max_builds]:
+                recent_builds.append(
+                    self.get_summary_line_values(request, summary))
+        else:
+            for rb in s.generateFinishedBuilds(builders=[b.getName() for b in my_builders]):
+                if rb.getSlavename() == self.slavename:
+                    recent_builds.append(self.get_line_values(request, rb))
+                    if len(recent_builds) >= max_builds:
+                        break
 
         # connects over the last hour
         slave = s.getSlave(self.slavename)
@@ -155,6 +166,36 @@ class OneBuildSlaveResource(HtmlResource, BuildLineMixin):
         data = template.render(**ctx)
         return data
 
+    def get_summary_line_values(self, req, summary):
+        """Like L{get_line_values}, for a L{SlaveBuildSummary} of a finished
+        build."""
+        css_class = css_classes.get(summary.results, "")
+
+        revs = rev_list(summary.sources, summary.got_revisions)
+
+        builderurl = (path_to_root(req) + "builders/" +
+                      urllib.quote(summary.builder, safe=''))
+        return {'class': css_class,
+                'builder_name': summary.builder,
+                'buildnum': summary.number,
+                'buildworker': self.slavename,
+                'results': css_class,
+                'text': summary.text or '',
+                'buildurl': builderurl + "/builds/%d" % summary.number,
+                'builderurl': builderurl,
+                'rev_list': revs,
+                'multiple_revs': (len(revs) > 1),
+                'time': time.strftime(self.LINE_TIME_FORMAT,
+                                      time.localtime(summary.start)),
+                'include_builder': True,
+                'reason': summary.reason,
+                'interested_users': summary.interested_users,
+                'start': time.ctime(summary.start),
+                'end': time.ctime(summary.end),
+                'elapsed': util.formatInterval(summary.end - summary.start),
+                'fragment_key': (summary.builder, summary.number, req.path),
+                }
+
 # /buildslaves
 
 
@@ -66,7 +66,7 @@ class CurrentBox(components.Adapter):
     # this provides the "current activity" box, just above the builder name
     implements(ICurrentBox)
 
-    def formatETA(self, prefix, eta):
+    def formatETA(self, prefix, eta, worst=None):
         if eta is None:
             return []
         if eta < 60:
@@ -80,7 +80,12 @@ class CurrentBox(components.Adapter):
             eta_parts.append("%d mins" % (eta_secs / 60))
             eta_secs %= 60
         abstime = time.strftime("%H:%M", time.localtime(util.now() + eta))
-        return [prefix, " ".join(eta_parts), "at %s" % abstime]
+        text = [prefix, " ".join(eta_parts), "at %s" % abstime]
+        if worst is not None and worst >= eta + 60:
+            # a slow build (90th percentile) would finish at this time
+            worst = time.strftime("%H:%M", time.localtime(util.now() + worst))
+            text.append("(%s at worst)" % worst)
+        return text
 
     def getBox(self, status, brcounts):
         # getState() returns offline, idle, or building
@@ -104,7 +109,7 @@ class CurrentBox(components.Adapter):
             if builds:
                 for b in builds:
                     eta = b.getETA()
-                    text.extend(self.formatETA("ETA in", eta))
+                    text.extend(self.formatETA("ETA in", eta, b.getETA(90)))
         elif state == "offline":
             text = ["offline"]
         elif state == "idle":
@@ -0,0 +1,188 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from __future__ import with_statement
+
+import os
+import types
+
+from cPickle import dump
+
+from buildbot import util
+from buildbot.process import metrics
+from buildbot.util.bbcollections import OrderedDict
+from twisted.internet import defer
+from twisted.internet import threads
+from twisted.python import log
+from twisted.python import runtime
+
+
+def snapshot(obj):
+    """Return an object that pickles like C{obj} does now, even if C{obj}
+    changes later.
+
+    C{obj} must be an old-style instance with a C{__getstate__} method, like
+    the status objects.  Its state is taken right away, along with copies of
+    the lists and dicts in it, which is cheap; pickling the snapshot writes
+    the same class and state as pickling C{obj} would have, so the file
+    loads exactly as before.  Objects further down (steps, events) are
+    shared, so this is meant for objects that are done changing, or nearly
+    so."""
+    state = obj.__getstate__()
+    for k, v in state.items():
+        if isinstance(v, list):
+            state[k] = list(v)
+        elif isinstance(v, dict):
+            state[k] = dict(v)
+    return frozen(obj.__class__, state)
+
+
+def frozen(cls, state):
+    """Return an object that pickles as an instance of the old-style class
+    C{cls} with the given C{state}."""
+    obj = types.InstanceType(cls, {})
+    # pickle looks __getstate__ up on the instance, so this takes precedence
+    # over the class's method
+    obj.__dict__['__getstate__'] = lambda: state
+    return obj
+
+
+def writeAtomically(filename, write, fsync=True):
+    """Call C{write} with a file object to write the contents of
+    C{filename}, through a temporary file that replaces it only once it is
+    complete (and, if C{fsync}, on disk)."""
+    tmpfilename = filename + ".tmp"
+    with open(tmpfilename, "wb") as f:
+        write(f)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    if runtime.platformType == 'win32':
+        # windows cannot rename a file on top of an existing one, so
+        # fall back to delete-first. There are ways this can fail and
+        # lose the builder's history, so we avoid using it in the
+        # general (non-windows) case
+        if os.path.exists(filename):
+            os.unlink(filename)
+    os.rename(tmpfilename, filename)
+
+
+def writePickle(filename, obj, fsync=True):
+    """Pickle C{obj} to C{filename} (see L{writeAtomically})."""
+    writeAtomically(filename, lambda f: dump(obj, f, -1), fsync)
+
+
+class SaveQueue(object):
+
+    """I write status pickles to disk in a worker thread, so that pickling
+    a large build does not hold up the reactor.
+
+    L{save} snapshots the object (see L{snapshot}) and queues it; the queue
+    is written one file at a time, each with an fsync, in the order the
+    files were first queued.  A file queued again before it is written is
+    only written once, with the latest snapshot.  Until it is written, the
+    object can still be found with L{getPending}.
+
+    When I am not running, L{save} writes synchronously once the queue is
+    empty, so saves made while the master shuts down are not lost, and
+    L{stop} waits for the queue to be written.  The C{SaveQueue.depth} metric counts the queued
+    files and C{SaveQueue.latency} times each file from being queued to
+    being on disk.
+    """
+
+    def __init__(self):
+        # filename -> (obj, snapshot, time queued, description, write)
+        self.pending = OrderedDict()
+        self.writing = None  # (filename, obj) being written
+        self.running = False
+        self._drain = None
+
+    @property
+    def depth(self):
+        return len(self.pending)
+
+    def save(self, obj, filename, description=None, write=writePickle):
+        """Save C{obj} to C{filename}, logging failures as failures to save
+        C{description}.  C{write} is called as C{write(filename, obj)} with
+        a snapshot of C{obj}, like L{writePickle}, which is the default."""
+        if not self.running and self._drain is None:
+            self._write(write, filename, obj, description)
+            return
+        # while the queue is still being written (when stopping), keep
+        # queueing, so this save is not overwritten by an older one
+        queued = util.now()
+        if filename in self.pending:
+            queued = self.pending.pop(filename)[2]
+        self.pending[filename] = (obj, snapshot(obj), queued, description,
+                                  write)
+        metrics.MetricCountEvent.log("SaveQueue.depth", len(self.pending),
+                                     absolute=True)
+        if self._drain is None:
+            d = self._drain = self._writeAll()
+            d.addBoth(self._drained)
+
+    def getPending(self, filename):
+        """Return the object queued to be saved to C{filename}, or None."""
+        if filename in self.pending:
+            return self.pending[filename][0]
+        if self.writing and self.writing[0] == filename:
+            return self.writing[1]
+        return None
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        """Stop queueing; returns a Deferred that fires when everything
+        queued so far is on disk."""
+        self.running = False
+        return self.flush()
+
+    def flush(self):
+        """Return a Deferred that fires when the queue is empty."""
+        if self._drain is None:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self._drain.addBoth(lambda res: d.callback(None) or res)
+        return d
+
+    @defer.inlineCallbacks
+    def _writeAll(self):
+        while self.pending:
+            filename, (obj, snap, queued, description, write) = \
+                self.pending.popitem(last=False)
+            self.writing = (filename, obj)
+            try:
+                yield threads.deferToThread(self._write, write, filename,
+                                            snap, description)
+            finally:
+                self.writing = None
+            metrics.MetricTimeEvent.log("SaveQueue.latency",
+                                        util.now() - queued)
+            metrics.MetricCountEvent.log("SaveQueue.depth",
+                                         len(self.pending), absolute=True)
+
+    def _drained(self, res):
+        self._drain = None
+        return res
+
+    @staticmethod
+    def _write(write, filename, obj, description):
+        # runs in a worker thread when the queue is running
+        try:
+            write(filename, obj)
+        except Exception:
+            log.msg("unable to save %s" % (description or filename))
+            log.err()
@@ -223,6 +223,16 @@ class _TransferBuildStep(BuildStep):
             workdir = self.workdir
         return workdir
 
+    def _addWindowArgs(self, args):
+        # slaves from 2.17 on can keep several reads in flight, which hides
+        # the round-trip time on high-latency links
+        if not self.window or self.window <= 1:
+            return
+        if self.slaveVersionIsOlderThan("downloadFile", "2.17"):
+            return
+        args['window'] = self.window
+        args['maxblocksize'] = max(self.maxblocksize, self.blocksize)
+
     def runTransferCommand(self, cmd, writer=None):
         # Run a transfer step, add a callback to extract the command status,
         # add an error handler that cancels the writer.
@@ -546,6 +556,7 @@ class FileDownload(_TransferBuildStep):
 
     def __init__(self, mastersrc, slavedest,
                  workdir=None, maxsize=None, blocksize=16 * 1024, mode=None,
+                 window=8, maxblocksize=256 * 1024,
                  **buildstep_kwargs):
         _TransferBuildStep.__init__(self, workdir=workdir, **buildstep_kwargs)
 
@@ -553,6 +564,8 @@ class FileDownload(_TransferBuildStep):
         self.slavedest = slavedest
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
+        self.maxblocksize = maxblocksize
         if not isinstance(mode, (int, type(None))):
             config.error(
                 'mode must be an integer or None')
@@ -593,6 +606,7 @@ class FileDownload(_TransferBuildStep):
             'workdir': self._getWorkdir(),
             'mode': self.mode,
         }
+        self._addWindowArgs(args)
 
         cmd = makeStatusRemoteCommand(self, 'downloadFile', args)
         d = self.runTransferCommand(cmd)
@@ -607,6 +621,7 @@ class StringDownload(_TransferBuildStep):
 
     def __init__(self, s, slavedest,
                  workdir=None, maxsize=None, blocksize=16 * 1024, mode=None,
+                 window=8, maxblocksize=256 * 1024,
                  **buildstep_kwargs):
         _TransferBuildStep.__init__(self, workdir=workdir, **buildstep_kwargs)
 
@@ -614,6 +629,8 @@ class StringDownload(_TransferBuildStep):
         self.slavedest = slavedest
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
+        self.maxblocksize = maxblocksize
         if not isinstance(mode, (int, type(None))):
             config.error(
                 "StringDownload step's mode must be an integer or None,"
@@ -645,6 +662,7 @@ class StringDownload(_TransferBuildStep):
             'workdir': self._getWorkdir(),
             'mode': self.mode,
         }
+        self._addWindowArgs(args)
 
         cmd = makeStatusRemoteCommand(self, 'downloadFile', args)
         d = self.runTransferCommand(cmd)
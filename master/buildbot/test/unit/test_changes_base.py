@@ -19,13 +19,14 @@ from buildbot.test.util import compat
 from twisted.internet import defer
 from twisted.internet import reactor
 from twisted.internet import task
+from twisted.python import failure
 from twisted.trial import unittest
 
 
 class TestPollingChangeSource(changesource.ChangeSourceMixin, unittest.TestCase):
 
     class Subclass(base.PollingChangeSource):
-        pass
+        pollJitter = 0
 
     def setUp(self):
         # patch in a Clock so we can manipulate the reactor's time
@@ -108,3 +109,84 @@ class TestPollingChangeSource(changesource.ChangeSourceMixin, unittest.TestCase)
         d.addCallback(check)
         reactor.callWhenRunning(d.callback, None)
         return d
+
+    def test_pollJitter(self):
+        loops = []
+        self.changesource.poll = \
+            lambda: loops.append(self.clock.seconds())
+
+        self.changesource.pollInterval = 10
+        self.changesource.pollJitter = 0.5
+        self.patch(base.random, 'uniform', lambda a, b: b)
+        self.startChangeSource()
+
+        d = defer.Deferred()
+        d.addCallback(self.runClockFor, 26)
+
+        def check(_):
+            self.assertEqual(loops, [15.0, 25.0])
+        d.addCallback(check)
+        reactor.callWhenRunning(d.callback, None)
+        return d
+
+
+class TestPollCoordinator(unittest.TestCase):
+
+    def setUp(self):
+        self.coordinator = base.PollCoordinator(maxCommands=2)
+        self.started = []
+
+    def command(self, name):
+        d = defer.Deferred()
+        self.started.append((name, d))
+        return d
+
+    def test_run_limits_commands(self):
+        results = []
+        for name in 'abc':
+            self.coordinator.run(self.command, name).addCallback(results.append)
+        self.assertEqual([n for n, d in self.started], ['a', 'b'])
+        self.started[0][1].callback('A')
+        self.assertEqual([n for n, d in self.started], ['a', 'b', 'c'])
+        self.assertEqual(results, ['A'])
+
+    def test_setMaxCommands(self):
+        for name in 'abc':
+            self.coordinator.run(self.command, name)
+        self.coordinator.setMaxCommands(3)
+        self.assertEqual([n for n, d in self.started], ['a', 'b', 'c'])
+
+    def test_share(self):
+        calls = []
+
+        def fetch(items):
+            calls.append(items)
+            return self.command('fetch')
+        results = []
+        share = self.coordinator.share
+        share('repo', ['master'], fetch).addCallback(results.append)
+        # covered by the running call
+        share('repo', ['master'], fetch).addCallback(results.append)
+        # these are merged into the next call
+        share('repo', ['b1'], fetch).addCallback(results.append)
+        share('repo', ['b2', 'master'], fetch).addCallback(results.append)
+        # other keys are independent
+        share('other', ['master'], fetch)
+        self.assertEqual(calls, [['master'], ['master']])
+
+        self.started[0][1].callback(1)
+        self.assertEqual(results, [1, 1])
+        self.assertEqual(calls, [['master'], ['master'], ['b1', 'b2', 'master']])
+        self.started[2][1].callback(2)
+        self.assertEqual(results, [1, 1, 2, 2])
+        self.assertEqual(self.coordinator.running.keys(), ['other'])
+
+    def test_share_failure(self):
+        errors = []
+        d1 = self.coordinator.share('repo', [], lambda _: self.command('x'))
+        d2 = self.coordinator.share('repo', [], lambda _: self.command('y'))
+        for d in d1, d2:
+            d.addErrback(errors.append)
+        self.started[0][1].errback(failure.Failure(RuntimeError()))
+        self.assertEqual([f.type for f in errors], [RuntimeError] * 2)
+        self.assertEqual(self.coordinator.running, {})
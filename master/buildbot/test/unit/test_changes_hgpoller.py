@@ -70,6 +70,18 @@ class TestHgPoller(gpo.GetProcessOutputMixin,
                 given_args[:len(expected_args)]) == expected_args
         return matchesSubcommand
 
+    def logExpect(self, revrange):
+        template = '\x1f'.join(['{rev}', '{node}', '{date|hgdate}',
+                                '{author}', "{files % '{file}\x1d'}",
+                                '{desc|strip}']) + '\x1e'
+        return gpo.Expect('hg', 'log', '-b', 'default', '-r', revrange,
+                          '--template=' + template).path('/some/dir')
+
+    def logRecord(self, rev, node, date, author, files, desc):
+        return '\x1f'.join([str(rev), node, date, author,
+                            ''.join(f + '\x1d' for f in files),
+                            desc]) + '\x1e'
+
     def test_describe(self):
         self.assertSubstring("HgPoller", self.poller.describe())
 
@@ -89,17 +101,13 @@ class TestHgPoller(gpo.GetProcessOutputMixin,
             .path('/some/dir'),
             gpo.Expect('hg', 'heads', 'default', '--template={rev}' + os.linesep)
             .path('/some/dir').stdout("73591"),
-            gpo.Expect('hg', 'log', '-b', 'default', '-r', '73591:73591',  # only fetches that head
-                       '--template={rev}:{node}\\n')
-            .path('/some/dir').stdout(os.linesep.join(['73591:4423cdb'])),
-            gpo.Expect('hg', 'log', '-r', '4423cdb',
-                       '--template={date|hgdate}' + os.linesep + '{author}' + os.linesep + "{files % '{file}" + os.pathsep + "'}" + os.linesep + '{desc|strip}')
-            .path('/some/dir').stdout(os.linesep.join([
-                '1273258100.0 -7200',
+            # only fetches that head
+            self.logExpect('73591:73591').stdout(self.logRecord(
+                73591, '4423cdb', '1273258100.0 -7200',
                 'Bob Test <bobtest@example.org>',
-                'file1 with spaces' + os.pathsep + os.path.join('dir with spaces', 'file2') + os.pathsep,
-                'This is rev 73591',
-                ''])),
+                ['file1 with spaces',
+                 os.path.join('dir with spaces', 'file2')],
+                'This is rev 73591')),
         )
 
         # do the poll
@@ -158,17 +166,10 @@ class TestHgPoller(gpo.GetProcessOutputMixin,
             .path('/some/dir'),
             gpo.Expect('hg', 'heads', 'default', '--template={rev}' + os.linesep)
             .path('/some/dir').stdout('5' + os.linesep),
-            gpo.Expect('hg', 'log', '-b', 'default', '-r', '5:5',
-                       '--template={rev}:{node}\\n')
-            .path('/some/dir').stdout('5:784bd' + os.linesep),
-            gpo.Expect('hg', 'log', '-r', '784bd',
-                       '--template={date|hgdate}' + os.linesep + '{author}' + os.linesep + "{files % '{file}" + os.pathsep + "'}" + os.linesep + '{desc|strip}')
-            .path('/some/dir').stdout(os.linesep.join([
-                '1273258009.0 -7200',
-                'Joe Test <joetest@example.org>',
-                'file1 file2',
-                'Comment for rev 5',
-                ''])),
+            self.logExpect('5:5').stdout(self.logRecord(
+                5, '784bd', '1273258009.0 -7200',
+                'Joe Test <joetest@example.org>', ['file1 file2'],
+                'Comment for rev 5')),
         )
 
         yield self.poller._setCurrentRev(4)
@@ -182,3 +183,80 @@ class TestHgPoller(gpo.GetProcessOutputMixin,
             self.assertEqual(change['revision'], '784bd')
             self.assertEqual(change['comments'], 'Comment for rev 5')
         d.addCallback(check_changes)
+
+    def expectPollTo(self, head, revrange, records):
+        self.expectCommands(
+            gpo.Expect('hg', 'pull', '-b', 'default',
+                       'ssh://example.com/foo/baz')
+            .path('/some/dir'),
+            gpo.Expect('hg', 'heads', 'default', '--template={rev}' + os.linesep)
+            .path('/some/dir').stdout(str(head) + os.linesep),
+            self.logExpect(revrange).stdout(''.join(records)),
+        )
+
+    @defer.inlineCallbacks
+    def test_poll_several_revisions(self):
+        # all new revisions are described by a single hg log
+        self.expectPollTo(7, '5:7', [
+            self.logRecord(5, 'aaa', '1273258009.0 -7200', 'Joe', ['a'],
+                           'first line\n\nsecond paragraph'),
+            self.logRecord(6, 'bbb', '1273258010.0 -7200', 'Joe', [], 'merge'),
+            self.logRecord(7, 'ccc', '1273258011.0 -7200', 'Bob', ['b', 'c'],
+                           'rev 7'),
+        ])
+        yield self.poller._setCurrentRev(4)
+
+        yield self.poller.poll()
+
+        self.assertAllCommandsRan()
+        self.assertEqual([(c['revision'], c['files'], c['comments'])
+                          for c in self.changes_added],
+                         [('aaa', ['a'], 'first line\n\nsecond paragraph'),
+                          ('bbb', [], 'merge'),
+                          ('ccc', ['b', 'c'], 'rev 7')])
+        yield self.check_current_rev(7)(None)
+
+    @defer.inlineCallbacks
+    def test_poll_records_each_revision(self):
+        # each revision is recorded as soon as its change is added
+        self.expectPollTo(6, '5:6', [
+            self.logRecord(5, 'aaa', '1273258009.0 -7200', 'Joe', ['a'], 'a'),
+            self.logRecord(6, 'bbb', '1273258010.0 -7200', 'Joe', ['b'], 'b'),
+        ])
+        addChange = self.master.addChange
+        seen = []
+
+        @defer.inlineCallbacks
+        def recordCurrent(**kwargs):
+            oid, current = yield self.poller._getCurrentRev()
+            seen.append(current)
+            yield addChange(**kwargs)
+        self.master.addChange = recordCurrent
+        yield self.poller._setCurrentRev(4)
+
+        yield self.poller.poll()
+
+        self.assertEqual(seen, [4, 5])
+        yield self.check_current_rev(6)(None)
+
+    @defer.inlineCallbacks
+    def test_poll_addChange_failure(self):
+        # the revisions added before a failure are recorded as seen
+        self.expectPollTo(6, '5:6', [
+            self.logRecord(5, 'aaa', '1273258009.0 -7200', 'Joe', ['a'], 'a'),
+            self.logRecord(6, 'bbb', '1273258010.0 -7200', 'Joe', ['b'], 'b'),
+        ])
+        addChange = self.master.addChange
+
+        def failOnSecond(**kwargs):
+            if kwargs['revision'] == 'bbb':
+                return defer.fail(RuntimeError('oops'))
+            return addChange(**kwargs)
+        self.master.addChange = failOnSecond
+        yield self.poller._setCurrentRev(4)
+
+        yield self.poller.poll()
+
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+        self.assertEqual([c['revision'] for c in self.changes_added], ['aaa'])
+        yield self.check_current_rev(5)(None)
@@ -30,6 +30,7 @@ class TestChangeManager(unittest.TestCase):
         self.master = mock.Mock()
         self.cm = manager.ChangeManager(self.master)
         self.new_config = mock.Mock()
+        self.new_config.maxPollerCommands = 8
 
     def make_sources(self, n):
         for i in range(n):
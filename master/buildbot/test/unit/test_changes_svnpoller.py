@@ -16,7 +16,6 @@
 from __future__ import with_statement
 
 import os
-import xml.dom.minidom
 
 from buildbot.changes import svnpoller
 from buildbot.test.util import changesource
@@ -228,20 +227,22 @@ changes_output_template = """\
 """
 
 
-def make_changes_output(maxrevision):
+def make_changes_output(maxrevision, since=None):
     # return what 'svn log' would have just after the given revision was
-    # committed
-    logs = sample_logentries[0:maxrevision]
-    assert len(logs) == maxrevision
-    logs.reverse()
+    # committed; with since, what 'svn log -r since:HEAD' would have
+    if since is None:
+        logs = sample_logentries[0:maxrevision]
+        assert len(logs) == maxrevision
+        logs.reverse()
+    else:
+        logs = sample_logentries[since - 1:maxrevision]
     output = changes_output_template % ("".join(logs))
     return output
 
 
 def make_logentry_elements(maxrevision):
-    "return the corresponding logentry elements for the given revisions"
-    doc = xml.dom.minidom.parseString(make_changes_output(maxrevision))
-    return doc.getElementsByTagName("logentry")
+    "return the corresponding logentries for the given revisions"
+    return svnpoller.parse_logentries(make_changes_output(maxrevision))
 
 
 def split_file(path):
@@ -316,8 +317,21 @@ class TestSVNPoller(gpo.GetProcessOutputMixin,
         s = self.attachSVNPoller('file:///foo')
         output = make_changes_output(4)
         entries = s.parse_logs(output)
-        # no need for elaborate assertions here; this is minidom's logic
-        self.assertEqual(len(entries), 4)
+        self.assertEqual([e['revision'] for e in entries], [4, 3, 2, 1])
+        self.assertEqual(entries[0]['author'], u'warner')
+        self.assertEqual(entries[0]['msg'], u'revised_to_2')
+        self.assertEqual(entries[0]['paths'],
+                         [(u'', u'M', u'/sample/trunk/version.c')])
+
+    def test_log_parsing_no_paths(self):
+        output = changes_output_template % (
+            '<logentry revision="7"><author>me</author><msg></msg></logentry>')
+        self.assertEqual(svnpoller.parse_logentries(output),
+                         [dict(revision=7, author=u'me', msg=u'', paths=None)])
+
+    def test_log_parsing_error(self):
+        self.assertRaises(SyntaxError, svnpoller.parse_logentries,
+                          '<log><logentry')
 
     def test_get_new_logentries(self):
         s = self.attachSVNPoller('file:///foo')
@@ -344,6 +358,22 @@ class TestSVNPoller(gpo.GetProcessOutputMixin,
         self.assertEqual(s.last_change, 4)
         self.assertEqual(len(new), 0)
 
+    def test_get_new_logentries_incremental(self):
+        s = self.attachSVNPoller('file:///foo')
+        # 'svn log -r 2:HEAD' lists the revisions oldest first, starting with
+        # the one already seen
+        entries = svnpoller.parse_logentries(make_changes_output(4, since=2))
+
+        s.last_change = 2
+        new = s.get_new_logentries(entries)
+        self.assertEqual([e['revision'] for e in new], [3, 4])
+        self.assertEqual(s.last_change, 4)
+
+        s.last_change = 4
+        new = s.get_new_logentries(entries[-1:])
+        self.assertEqual(new, [])
+        self.assertEqual(s.last_change, 4)
+
     def test_create_changes(self):
         base = ("file:///home/warner/stuff/Projects/BuildBot/trees/" +
                 "svnpoller/_trial_temp/test_vc/repositories/SVN-Repository/sample")
@@ -388,12 +418,16 @@ class TestSVNPoller(gpo.GetProcessOutputMixin,
             args.append('--password=' + password)
         return gpo.Expect(*args)
 
-    def makeLogExpect(self, password='bbrocks'):
+    def makeLogExpect(self, password='bbrocks', since=None):
         args = ['svn', 'log', '--xml', '--verbose', '--non-interactive',
                 '--username=dustin']
         if password is not None:
             args.append('--password=' + password)
-        args.extend(['--limit=100', sample_base])
+        if since is None:
+            args.append('--limit=1')
+        else:
+            args.extend(['--revision=%d:HEAD' % since, '--limit=100'])
+        args.append(sample_base)
         return gpo.Expect(*args)
 
     def test_create_changes_overriden_project(self):
@@ -437,9 +471,9 @@ class TestSVNPoller(gpo.GetProcessOutputMixin,
         self.expectCommands(
             self.makeInfoExpect().stdout(sample_info_output),
             self.makeLogExpect().stdout(make_changes_output(1)),
-            self.makeLogExpect().stdout(make_changes_output(1)),
-            self.makeLogExpect().stdout(make_changes_output(2)),
-            self.makeLogExpect().stdout(make_changes_output(4)),
+            self.makeLogExpect(since=1).stdout(make_changes_output(1, 1)),
+            self.makeLogExpect(since=1).stdout(make_changes_output(2, 1)),
+            self.makeLogExpect(since=2).stdout(make_changes_output(4, 2)),
         )
         # fire it the first time; it should do nothing
         d.addCallback(lambda _: s.poll())
@@ -505,11 +539,8 @@ class TestSVNPoller(gpo.GetProcessOutputMixin,
         self.expectCommands(
             self.makeInfoExpect(password="").stdout(sample_info_output),
             self.makeLogExpect(password="").stdout(make_changes_output(1)),
-            self.makeLogExpect(password="").stdout(make_changes_output(1)),
-            self.makeLogExpect(password="").stdout(make_changes_output(2)),
-            self.makeLogExpect(password="").stdout(make_changes_output(4)),
         )
-        s.poll()
+        return s.poll()
 
     def test_poll_no_password(self):
         s = self.attachSVNPoller(sample_base, split_file=split_file,
@@ -518,11 +549,8 @@ class TestSVNPoller(gpo.GetProcessOutputMixin,
         self.expectCommands(
             self.makeInfoExpect(password=None).stdout(sample_info_output),
             self.makeLogExpect(password=None).stdout(make_changes_output(1)),
-            self.makeLogExpect(password=None).stdout(make_changes_output(1)),
-            self.makeLogExpect(password=None).stdout(make_changes_output(2)),
-            self.makeLogExpect(password=None).stdout(make_changes_output(4)),
         )
-        s.poll()
+        return s.poll()
 
     @compat.usesFlushLoggedErrors
     def test_poll_get_prefix_exception(self):
@@ -51,6 +51,7 @@ global_defaults = dict(
     logCompressionMethod='bz2',
     logMaxTailSize=None,
     logMaxSize=None,
+    maxPollerCommands=8,
     properties=properties.Properties(),
     mergeRequests=None,
     prioritizeBuilders=None,
@@ -445,6 +446,15 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
     def test_load_global_logMaxSize(self):
         self.do_test_load_global(dict(logMaxSize=123), logMaxSize=123)
 
+    def test_load_global_maxPollerCommands(self):
+        self.do_test_load_global(dict(maxPollerCommands=2),
+                                 maxPollerCommands=2)
+
+    def test_load_global_maxPollerCommands_invalid(self):
+        self.cfg.load_global(self.filename, dict(maxPollerCommands=0))
+        self.assertConfigError(self.errors,
+                               "c['maxPollerCommands'] must be at least 1")
+
     def test_load_global_logMaxTailSize(self):
         self.do_test_load_global(dict(logMaxTailSize=123), logMaxTailSize=123)
 
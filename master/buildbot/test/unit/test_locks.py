@@ -0,0 +1,132 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from buildbot import locks
+from buildbot.util.eventual import flushEventualQueue
+from twisted.internet import defer
+from twisted.trial import unittest
+
+
+class Requester(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+class TestBaseLock(unittest.TestCase):
+
+    def setUp(self):
+        self.lockid = locks.MasterLock('lock', maxCount=2)
+        self.lock = locks.BaseLock('lock', maxCount=2)
+        self.counting = locks.LockAccess(self.lockid, 'counting')
+        self.exclusive = locks.LockAccess(self.lockid, 'exclusive')
+
+    def test_counting(self):
+        a, b, c = Requester('a'), Requester('b'), Requester('c')
+        self.lock.claim(a, self.counting)
+        self.assertTrue(self.lock.isAvailable(b, self.counting))
+        self.lock.claim(b, self.counting)
+        self.assertFalse(self.lock.isAvailable(c, self.counting))
+        self.assertFalse(self.lock.isAvailable(c, self.exclusive))
+        self.lock.release(a, self.counting)
+        self.assertTrue(self.lock.isAvailable(c, self.counting))
+        self.assertEqual(self.lock._getOwnersCount(), (0, 1))
+
+    def test_exclusive(self):
+        a, b = Requester('a'), Requester('b')
+        self.lock.claim(a, self.exclusive)
+        self.assertFalse(self.lock.isAvailable(b, self.counting))
+        self.assertFalse(self.lock.isAvailable(b, self.exclusive))
+        self.lock.release(a, self.exclusive)
+        self.assertTrue(self.lock.isAvailable(b, self.exclusive))
+        self.assertEqual(self.lock._getOwnersCount(), (0, 0))
+
+    def test_release_twice(self):
+        a = Requester('a')
+        self.lock.claim(a, self.counting)
+        self.lock.release(a, self.counting)
+        self.lock.release(a, self.counting)
+        self.assertEqual(self.lock._getOwnersCount(), (0, 0))
+
+    @defer.inlineCallbacks
+    def test_exclusive_waiter_not_starved(self):
+        a, excl, late = Requester('a'), Requester('excl'), Requester('late')
+        self.lock.claim(a, self.counting)
+        d = self.lock.waitUntilMaybeAvailable(excl, self.exclusive)
+        # there is room for another counting owner, but the exclusive
+        # waiter is ahead of it
+        self.assertFalse(self.lock.isAvailable(late, self.counting))
+        d_late = self.lock.waitUntilMaybeAvailable(late, self.counting)
+
+        self.lock.release(a, self.counting)
+        yield flushEventualQueue()
+        self.assertTrue(d.called)
+        self.assertFalse(d_late.called)
+        # the woken waiter keeps its place until it claims the lock
+        self.assertFalse(self.lock.isAvailable(late, self.counting))
+        self.lock.claim(excl, self.exclusive)
+        self.assertEqual(self.lock.waiting.keys(), [late])
+
+        self.lock.release(excl, self.exclusive)
+        yield flushEventualQueue()
+        self.assertTrue(d_late.called)
+        self.assertTrue(self.lock.isAvailable(late, self.counting))
+
+    @defer.inlineCallbacks
+    def test_release_wakes_counting_waiters(self):
+        owner = Requester('owner')
+        waiters = [Requester('w%d' % i) for i in range(3)]
+        self.lock.claim(owner, self.exclusive)
+        ds = [self.lock.waitUntilMaybeAvailable(w, self.counting)
+              for w in waiters]
+        # only the first two fit within maxCount
+        self.assertFalse(self.lock.isAvailable(waiters[1], self.counting))
+        self.lock.release(owner, self.exclusive)
+        yield flushEventualQueue()
+        self.assertEqual([d.called for d in ds], [True, True, False])
+        self.assertTrue(self.lock.isAvailable(waiters[0], self.counting))
+        self.assertTrue(self.lock.isAvailable(waiters[1], self.counting))
+        self.assertFalse(self.lock.isAvailable(waiters[2], self.counting))
+
+    def test_waitUntilMaybeAvailable_keeps_place(self):
+        a, b, c = Requester('a'), Requester('b'), Requester('c')
+        self.lock.claim(a, self.exclusive)
+        self.lock.waitUntilMaybeAvailable(b, self.exclusive)
+        self.lock.waitUntilMaybeAvailable(c, self.exclusive)
+        d = self.lock.waitUntilMaybeAvailable(b, self.exclusive)
+        self.assertEqual(self.lock.waiting.keys(), [b, c])
+        self.assertIdentical(self.lock.waiting[b][1], d)
+
+    def test_stopWaitingUntilAvailable(self):
+        a, b, c = Requester('a'), Requester('b'), Requester('c')
+        self.lock.claim(a, self.exclusive)
+        d = self.lock.waitUntilMaybeAvailable(b, self.exclusive)
+        self.lock.waitUntilMaybeAvailable(c, self.exclusive)
+        self.lock.stopWaitingUntilAvailable(b, self.exclusive, d)
+        self.lock.release(a, self.exclusive)
+        self.assertTrue(self.lock.isAvailable(c, self.exclusive))
+
+    def test_not_queued_counts_all_waiters(self):
+        lock = locks.BaseLock('lock', maxCount=3)
+        a, b, c = Requester('a'), Requester('b'), Requester('c')
+        lock.claim(a, self.counting)
+        lock.waiting[b] = (self.counting, None)
+        self.assertTrue(lock.isAvailable(c, self.counting))
+        lock.waiting[Requester('d')] = (self.counting, None)
+        self.assertFalse(lock.isAvailable(c, self.counting))
+        self.assertTrue(lock.isAvailable(b, self.counting))
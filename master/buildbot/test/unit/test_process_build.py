@@ -16,12 +16,15 @@
 from buildbot import config
 from buildbot import interfaces
 from buildbot.locks import SlaveLock
+from buildbot.process.build import BuildFailed
 from buildbot.process.build import Build
+from buildbot.process.build import ParallelStepsScheduler
 from buildbot.process.buildstep import LoggingBuildStep
 from buildbot.process.properties import Properties
 from buildbot.status.results import EXCEPTION
 from buildbot.status.results import FAILURE
 from buildbot.status.results import RETRY
+from buildbot.status.results import SKIPPED
 from buildbot.status.results import SUCCESS
 from buildbot.status.results import WARNINGS
 from buildbot.test.fake import slave
@@ -647,6 +650,201 @@ class TestBuild(unittest.TestCase):
         self.assertEqual(b.result, RETRY)
 
 
+class FakeParallelStep(FakeBuildStep):
+
+    """A step whose completion is driven by the test through C{finish}."""
+
+    slaveResources = None
+
+    def __init__(self, name, log=None):
+        FakeBuildStep.__init__(self)
+        self.name = name
+        self.log = log
+        self._dependsOnStep = []
+        self._completionResult = None
+        self._step_status = Mock()
+        self.d = None
+
+    def dependsOnStep(self, step):
+        self._dependsOnStep.append(step)
+
+    def startStep(self, remote):
+        if self.log is not None:
+            self.log.append(self.name)
+        self.d = defer.Deferred()
+        return self.d
+
+    def onCompletion(self, result):
+        pass
+
+    def finish(self, result=SUCCESS):
+        self.d.callback(result)
+
+
+class TestParallelStepsScheduler(unittest.TestCase):
+
+    def drain(self, sched):
+        started = []
+        while True:
+            step = sched.nextStep()
+            if step is None:
+                return started
+            started.append(step.name)
+
+    def test_dependencies(self):
+        a, b, c = [FakeParallelStep(n) for n in 'abc']
+        c.dependsOnStep(a)
+        c.dependsOnStep(b)
+        sched = ParallelStepsScheduler([a, b, c], maxCount=5)
+        self.assertEqual(sorted(self.drain(sched)), ['a', 'b'])
+        sched.stepFinished(a)
+        self.assertEqual(self.drain(sched), [])
+        sched.stepFinished(b)
+        self.assertEqual(self.drain(sched), ['c'])
+
+    def test_maxCount(self):
+        steps = [FakeParallelStep(n) for n in 'abcd']
+        sched = ParallelStepsScheduler(steps, maxCount=2)
+        self.assertEqual(len(self.drain(sched)), 2)
+        sched.stepFinished(steps[0])
+        self.assertEqual(len(self.drain(sched)), 1)
+
+    def test_critical_path_first(self):
+        short, head, tail = [FakeParallelStep(n)
+                             for n in ('short', 'head', 'tail')]
+        tail.dependsOnStep(head)
+        times = {'short': 50, 'head': 10, 'tail': 60}
+        sched = ParallelStepsScheduler([short, head, tail],
+                                       expectedTime=times.get, maxCount=1)
+        # head+tail (70s) is longer than short (50s)
+        self.assertEqual(self.drain(sched), ['head'])
+
+    def test_unknown_durations_use_mean(self):
+        a, b, c = [FakeParallelStep(n) for n in 'abc']
+        b.dependsOnStep(c)
+        times = {'a': 30}
+        sched = ParallelStepsScheduler([a, b, c],
+                                       expectedTime=times.get, maxCount=1)
+        # b and c default to 30s each, so the b<-c chain (60s) wins
+        self.assertEqual(self.drain(sched), ['c'])
+
+    def test_resources(self):
+        big, small1, small2 = [FakeParallelStep(n)
+                               for n in ('big', 'small1', 'small2')]
+        big.slaveResources = {'cpu': 4}
+        small1.slaveResources = small2.slaveResources = {'cpu': 1}
+        times = {'big': 100, 'small1': 1, 'small2': 1}
+        sched = ParallelStepsScheduler([big, small1, small2],
+                                       expectedTime=times.get, maxCount=10,
+                                       resourceLimits={'cpu': 4})
+        self.assertEqual(self.drain(sched), ['big'])
+        sched.stepFinished(big)
+        self.assertEqual(sorted(self.drain(sched)), ['small1', 'small2'])
+
+    def test_oversized_claim_runs_alone(self):
+        huge = FakeParallelStep('huge')
+        huge.slaveResources = {'cpu': 64}
+        sched = ParallelStepsScheduler([huge], maxCount=10,
+                                       resourceLimits={'cpu': 4})
+        self.assertEqual(self.drain(sched), ['huge'])
+
+    def test_unrunnable(self):
+        outside, a, b, c = [FakeParallelStep(n) for n in 'oabc']
+        a.dependsOnStep(outside)
+        b.dependsOnStep(c)
+        c.dependsOnStep(b)
+        sched = ParallelStepsScheduler([a, b, c], maxCount=10)
+        self.assertEqual(self.drain(sched), [])
+        self.assertEqual(sorted(s.name for s in sched.unrunnable),
+                         ['a', 'b', 'c'])
+
+    def test_unrunnable_is_transitive(self):
+        outside, a, b, c = [FakeParallelStep(n) for n in 'oabc']
+        a.dependsOnStep(outside)
+        b.dependsOnStep(a)
+        c.dependsOnStep(b)
+        sched = ParallelStepsScheduler([a, b, c], maxCount=10)
+        self.assertEqual(self.drain(sched), [])
+        self.assertEqual([s.name for s in sched.unrunnable], ['a', 'b', 'c'])
+
+    def test_completed_dependency(self):
+        done, a = FakeParallelStep('done'), FakeParallelStep('a')
+        done._completionResult = SUCCESS
+        a.dependsOnStep(done)
+        sched = ParallelStepsScheduler([a], maxCount=10)
+        self.assertEqual(self.drain(sched), ['a'])
+
+
+class TestProcessStepsInParallel(unittest.TestCase):
+
+    def setUp(self):
+        r = FakeRequest()
+        self.build = Build([r])
+        self.build.builder = Mock()
+        self.build.progress = None
+        self.build.remote = Mock()
+        self.build.steps = []
+        self.build.results = []
+        self.build.result = SUCCESS
+        self.build.text = []
+        self.started = []
+
+    def makeSteps(self, names):
+        return [FakeParallelStep(n, self.started) for n in names]
+
+    def test_runs_in_dependency_order(self):
+        a, b, c = steps = self.makeSteps('abc')
+        c.dependsOnStep(a)
+        d = self.build.processStepsInParallel(steps, maxCount=3)
+        self.assertEqual(self.started, ['a', 'b'])
+        a.finish()
+        self.assertEqual(self.started, ['a', 'b', 'c'])
+        c.finish()
+        self.assertFalse(d.called)
+        b.finish()
+        self.assertTrue(d.called)
+        self.assertEqual(self.build.steps, [])
+        self.assertEqual(self.build.currentSteps, [])
+        return d
+
+    def test_halt_waits_for_running_steps(self):
+        a, b, c = steps = self.makeSteps('abc')
+        a.haltOnFailure = True
+        d = self.build.processStepsInParallel(steps, maxCount=2)
+        a.finish(FAILURE)
+        # no new step is started after the failure...
+        self.assertEqual(self.started, ['a', 'b'])
+        self.assertFalse(d.called)
+        # ...but the running one is waited for
+        b.finish()
+        self.assertEqual(self.build.steps, [c])
+        return self.assertFailure(d, BuildFailed)
+
+    def test_unrunnable_steps_skipped(self):
+        outside = FakeParallelStep('outside')
+        a, b, c = steps = self.makeSteps('abc')
+        b.dependsOnStep(outside)
+        c.dependsOnStep(b)
+        self.build.steps = [outside]
+        d = self.build.processStepsInParallel(steps, maxCount=2)
+        self.assertEqual(self.started, ['a'])
+        a.finish()
+        # b can never run after its dependency, and c waits for b, so both
+        # are skipped here
+        self.assertEqual(self.started, ['a', 'b'])
+        self.assertFalse(b.doStepIf)
+        b.finish(SKIPPED)
+        self.assertEqual(self.started, ['a', 'b', 'c'])
+        self.assertFalse(c.doStepIf)
+        c.finish(SKIPPED)
+        self.assertTrue(d.called)
+        self.assertEqual(b._completionResult, SKIPPED)
+        self.assertEqual(c._completionResult, SKIPPED)
+        self.assertEqual(self.build.steps, [outside])
+        self.assertEqual(self.build.result, SUCCESS)
+        return d
+
+
 class TestMultipleSourceStamps(unittest.TestCase):
 
     def setUp(self):
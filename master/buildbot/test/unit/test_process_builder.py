@@ -19,10 +19,14 @@ import random
 from buildbot import config
 from buildbot.process import builder
 from buildbot.process import factory
+from buildbot.process.slavebuilder import BUILDING
+from buildbot.process.slavebuilder import IDLE
+from buildbot.status import slave
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
 from buildbot.util import epoch2datetime
 from twisted.internet import defer
+from twisted.internet import task
 from twisted.trial import unittest
 
 
@@ -348,6 +352,127 @@ class TestGetOldestRequestTime(BuilderMixin, unittest.TestCase):
         return d
 
 
+class TestWarmestSlaveFirst(BuilderMixin, unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        yield self.makeBuilder(name='bldr')
+        yield self.db.insertTestData([
+            fakedb.SourceStampSet(id=21),
+            fakedb.SourceStamp(id=21, sourcestampsetid=21, codebase='cb',
+                               branch='feature'),
+            fakedb.Buildset(id=11, reason='because', sourcestampsetid=21),
+            fakedb.BuildRequest(id=111, submitted_at=1000,
+                                buildername='bldr', buildsetid=11),
+        ])
+        self.clock = task.Clock()
+        self.nextSlave = builder.WarmestSlaveFirst(maxWait=300)
+        self.nextSlave._reactor = self.clock
+        self.patch(random, "choice",
+                   lambda lst: sorted(lst, key=lambda sb: sb.name)[0])
+        self.patch(builder.util, 'now', lambda _reactor=None: 1100)
+
+    def makeSlaveBuilder(self, name, branch=None, when=0, state=IDLE):
+        sb = mock.Mock(name=name)
+        sb.name = name
+        sb.state = state
+        sb.slave.slave_status = slave.SlaveStatus(name)
+        if branch:
+            ss = mock.Mock(codebase='cb', branch=branch, revision='rev')
+            sb.slave.slave_status.recordWorkspace('bldr', [ss], when=when)
+        self.bldr.slaves.append(sb)
+        return sb
+
+    @defer.inlineCallbacks
+    def test_prefers_same_branch(self):
+        cold = self.makeSlaveBuilder('a')
+        other = self.makeSlaveBuilder('b', branch='master', when=20)
+        warm = self.makeSlaveBuilder('c', branch='feature', when=10)
+        chosen = yield self.nextSlave(self.bldr, [cold, other, warm])
+        self.assertIdentical(chosen, warm)
+
+    @defer.inlineCallbacks
+    def test_prefers_recent(self):
+        old = self.makeSlaveBuilder('a', branch='feature', when=10)
+        recent = self.makeSlaveBuilder('b', branch='feature', when=20)
+        chosen = yield self.nextSlave(self.bldr, [old, recent])
+        self.assertIdentical(chosen, recent)
+
+    @defer.inlineCallbacks
+    def test_all_cold(self):
+        a = self.makeSlaveBuilder('a')
+        b = self.makeSlaveBuilder('b')
+        chosen = yield self.nextSlave(self.bldr, [b, a])
+        self.assertIdentical(chosen, a)
+
+    @defer.inlineCallbacks
+    def test_scores_given_request(self):
+        feature = self.makeSlaveBuilder('a', branch='feature', when=20)
+        master = self.makeSlaveBuilder('b', branch='master', when=10)
+        breq = mock.Mock(submittedAt=1000)
+        breq.sources = {'cb': mock.Mock(branch='master')}
+        chosen = yield self.nextSlave(self.bldr, [feature, master], breq)
+        self.assertIdentical(chosen, master)
+
+    @defer.inlineCallbacks
+    def test_waits_for_busy_warm_slave(self):
+        cold = self.makeSlaveBuilder('a')
+        self.makeSlaveBuilder('b', branch='feature', state=BUILDING)
+        self.bldr.botmaster.maybeStartBuildsForBuilder = mock.Mock()
+        chosen = yield self.nextSlave(self.bldr, [cold])
+        self.assertIdentical(chosen, None)
+
+        # the request has waited 100s, so try again in 200s
+        self.clock.advance(199)
+        self.assertFalse(self.bldr.botmaster.maybeStartBuildsForBuilder.called)
+        self.clock.advance(1)
+        self.bldr.botmaster.maybeStartBuildsForBuilder.assert_called_with(
+            'bldr')
+
+    @defer.inlineCallbacks
+    def test_no_wait_for_idle_slave_not_offered(self):
+        # an idle slave left out of the pool (say, it cannot take the
+        # builder's locks) will not become available by finishing a build
+        cold = self.makeSlaveBuilder('a')
+        self.makeSlaveBuilder('b', branch='feature')
+        chosen = yield self.nextSlave(self.bldr, [cold])
+        self.assertIdentical(chosen, cold)
+
+    @defer.inlineCallbacks
+    def test_wait_bounded(self):
+        cold = self.makeSlaveBuilder('a')
+        self.makeSlaveBuilder('b', branch='feature', state=BUILDING)
+        self.patch(builder.util, 'now', lambda _reactor=None: 1300)
+        chosen = yield self.nextSlave(self.bldr, [cold])
+        self.assertIdentical(chosen, cold)
+
+    @defer.inlineCallbacks
+    def test_no_wait(self):
+        self.nextSlave.maxWait = 0
+        cold = self.makeSlaveBuilder('a')
+        self.makeSlaveBuilder('b', branch='feature', state=BUILDING)
+        chosen = yield self.nextSlave(self.bldr, [cold])
+        self.assertIdentical(chosen, cold)
+
+    def test_buildFinished_records_workspace(self):
+        sb = self.makeSlaveBuilder('a')
+        build = mock.Mock()
+        build.requests = []
+        build.build_status.getResults.return_value = builder.EXCEPTION
+        self.bldr.building.append(build)
+        self.bldr.buildFinished(build, sb, [])
+        self.assertEqual(sb.slave.slave_status.getWorkspace('bldr'), None)
+
+        ss = mock.Mock(codebase='cb', branch='feature', revision='abc')
+        build.build_status.getResults.return_value = 0
+        build.build_status.getSourceStamps.return_value = [ss]
+        self.bldr.building.append(build)
+        self.bldr.buildFinished(build, sb, [])
+        workspace = sb.slave.slave_status.getWorkspace('bldr')
+        self.assertEqual(workspace['sources'],
+                         {'cb': {'branch': 'feature', 'revision': 'abc'}})
+
+
 class TestRebuild(BuilderMixin, unittest.TestCase):
 
     def makeBuilder(self, name, sourcestamps):
@@ -846,6 +846,12 @@ class TestMaybeStartBuilds(unittest.TestCase):
             return defer.succeed(lst[1])
         return self.do_test_nextSlave(nextSlave, exp_choice=1)
 
+    def test_nextSlave_with_request(self):
+        def nextSlave(bldr, lst, breq):
+            self.assertEqual(breq.id, 11)
+            return lst[1]
+        return self.do_test_nextSlave(nextSlave, exp_choice=1)
+
     def test_nextSlave_exception(self):
         def nextSlave(bldr, lst):
             raise RuntimeError("")
@@ -1058,3 +1064,60 @@ class TestMaybeStartBuilds(unittest.TestCase):
         ]
         yield self.do_test_maybeStartBuildsOnBuilder(rows=rows,
                                                      exp_claims=[], exp_builds=[])
+
+
+class TestShortestJobFirst(unittest.TestCase):
+
+    def makeBuilder(self, name, oldest, duration):
+        bldr = mock.Mock(name=name)
+        bldr.name = name
+        if oldest is not None:
+            oldest = epoch2datetime(oldest)
+        bldr.getOldestRequestTime = lambda: defer.succeed(oldest)
+        bldr.builder_status.getExpectedDuration.return_value = duration
+        return bldr
+
+    @defer.inlineCallbacks
+    def do_test(self, builders, expected, **kwargs):
+        self.patch(buildrequestdistributor.util, 'now',
+                   lambda _reactor=None: 10000)
+        builders = [self.makeBuilder(*b) for b in builders]
+        sorter = buildrequestdistributor.ShortestJobFirst(**kwargs)
+        result = yield sorter(mock.Mock(name='master'), builders)
+        self.assertEqual([b.name for b in result], expected)
+
+    def test_short_overtakes_long(self):
+        # 'full' has waited longest, but 'quick' has waited longer relative
+        # to its expected duration
+        return self.do_test([('full', 8000, 7200), ('quick', 9800, 100)],
+                            ['quick', 'full'])
+
+    def test_long_ages(self):
+        # after waiting for several times its duration, a long build wins
+        return self.do_test([('full', 10000 - 7200 * 5, 7200),
+                             ('quick', 9700, 100)],
+                            ['full', 'quick'])
+
+    def test_aging_zero(self):
+        # pure shortest-job-first
+        return self.do_test([('full', 0, 7200), ('quick', 9999, 100)],
+                            ['quick', 'full'], aging=0)
+
+    def test_aging_large(self):
+        # approaches oldest-request-first
+        return self.do_test([('full', 9000, 7200), ('quick', 9999, 100)],
+                            ['full', 'quick'], aging=100)
+
+    def test_unknown_duration_uses_mean(self):
+        # 'new' is treated as taking (100 + 900) / 2 = 500s
+        return self.do_test([('a', 9700, 100), ('b', 9000, 900),
+                             ('new', 9000, None)],
+                            ['a', 'new', 'b'])
+
+    def test_default_duration(self):
+        return self.do_test([('a', 9800, 100), ('new', 9000, None)],
+                            ['new', 'a'], defaultDuration=10)
+
+    def test_no_requests_last(self):
+        return self.do_test([('idle', None, 1), ('busy', 9000, 7200)],
+                            ['busy', 'idle'])
@@ -68,6 +68,10 @@ class TestUpgradeMaster(dirs.DirsMixin, misc.StdoutAssertionsMixin,
             self.calls.append('upgradeDatabase')
         self.patch(upgrade_master, 'upgradeDatabase', upgradeDatabase)
 
+        def upgradeBuildRecords(config, master_cfg):
+            self.calls.append('upgradeBuildRecords')
+        self.patch(upgrade_master, 'upgradeBuildRecords', upgradeBuildRecords)
+
     # tests
 
     def test_upgradeMaster_success(self):
@@ -77,6 +81,9 @@ class TestUpgradeMaster(dirs.DirsMixin, misc.StdoutAssertionsMixin,
         @d.addCallback
         def check(rv):
             self.assertEqual(rv, 0)
+            self.assertEqual(self.calls, ['checkBasedir', 'loadConfig',
+                                          'upgradeFiles', 'upgradeDatabase',
+                                          'upgradeBuildRecords'])
             self.assertInStdout('upgrade complete')
         return d
 
@@ -283,3 +290,19 @@ class TestUpgradeMasterFunctions(dirs.DirsMixin, misc.StdoutAssertionsMixin,
         setup.asset_called_with(check_version=False, verbose=False)
         upgrade.assert_called_with()
         self.assertWasQuiet()
+
+    def test_upgradeBuildRecords(self):
+        master_cfg = config_module.MasterConfig()
+        master_cfg.builders = [mock.Mock(builddir='one'),
+                               mock.Mock(builddir='missing')]
+        master_cfg.builders[0].name = 'one'
+        os.mkdir(os.path.join('test', 'one'))
+        upgradeDirectory = mock.Mock(return_value=(2, ['test/one/7']))
+        self.patch(upgrade_master.buildrecord, 'upgradeDirectory',
+                   upgradeDirectory)
+
+        upgrade_master.upgradeBuildRecords(mkconfig(), master_cfg)
+
+        upgradeDirectory.assert_called_once_with(os.path.join('test', 'one'))
+        self.assertInStdout('converted 2 builds of builder one')
+        self.assertInStdout('Could not convert build pickle test/one/7')
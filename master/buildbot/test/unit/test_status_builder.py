@@ -15,6 +15,9 @@
 """
 Tests for buildbot.status.builder module.
 """
+import mock
+import os
+
 from buildbot.status import builder
 from buildbot.test.fake import fakemaster
 from twisted.trial import unittest
@@ -65,3 +68,123 @@ class TestBuilderStatus(unittest.TestCase):
 
         self.assertTrue(sut.matchesAnyTag(set(('two',))))
         self.assertTrue(sut.matchesAnyTag(set(('two', 'one'))))
+
+    def makeBuilderStatusInDir(self):
+        """
+        Return a new BuilderStatus with a fresh basedir.
+        """
+        sut = self.makeBuilderStatus()
+        sut.basedir = os.path.abspath(self.mktemp())
+        os.makedirs(sut.basedir)
+        return sut
+
+    def test_determineNextBuildNumber_scans(self):
+        """
+        Without a counter file, the highest build pickle is used.
+        """
+        sut = self.makeBuilderStatusInDir()
+        for name in ('3', '12', '12-log-stdio', 'builder'):
+            open(os.path.join(sut.basedir, name), 'w').close()
+
+        sut.determineNextBuildNumber()
+
+        self.assertEqual(sut.nextBuildNumber, 13)
+
+    def test_newBuild_saves_counter(self):
+        """
+        newBuild keeps the counter file up to date, and it is used in
+        preference to scanning the directory.
+        """
+        sut = self.makeBuilderStatusInDir()
+        sut.determineNextBuildNumber()
+        sut.newBuild()
+        sut.newBuild()
+
+        other = self.makeBuilderStatus()
+        other.basedir = sut.basedir
+        self.patch(os, 'listdir', lambda path: self.fail('listdir called'))
+        other.determineNextBuildNumber()
+
+        self.assertEqual(other.nextBuildNumber, 2)
+
+    def test_determineNextBuildNumber_stale_counter(self):
+        """
+        A counter behind the saved builds is ignored.
+        """
+        sut = self.makeBuilderStatusInDir()
+        with open(os.path.join(sut.basedir, 'nextbuild'), 'w') as f:
+            f.write('5\n')
+        for name in ('5', '6'):
+            open(os.path.join(sut.basedir, name), 'w').close()
+
+        sut.determineNextBuildNumber()
+
+        self.assertEqual(sut.nextBuildNumber, 7)
+
+    def test_events_loaded_lazily(self):
+        """
+        Events saved in a builder pickle are only read when first used.
+        """
+        saved = self.makeBuilderStatusInDir()
+        saved.addPointEvent(['builder', 'created'])
+        # must be set before pickling
+        saved.currentBigState = 'idle'
+        saved.status = None
+        saved.determineNextBuildNumber()
+        saved.saveYourself()
+        filename = os.path.join(saved.basedir, 'builder')
+
+        sut = self.makeBuilderStatus()
+        sut.basedir = saved.basedir
+        sut.loadEventsFrom(filename)
+        self.assertNotIn('events', sut.__dict__)
+
+        self.assertEqual([e.text for e in sut.events],
+                         [['builder', 'created']])
+
+    def test_events_missing_pickle(self):
+        """
+        A missing builder pickle leaves no events.
+        """
+        sut = self.makeBuilderStatusInDir()
+        sut.loadEventsFrom(os.path.join(sut.basedir, 'builder'))
+
+        sut.addPointEvent(['connect'])
+
+        self.assertEqual([e.text for e in sut.events], [['connect']])
+
+    def test_buildFinished_schedules_prune(self):
+        """
+        A finished build has its builder pruned by the status's janitor.
+        """
+        sut = self.makeBuilderStatusInDir()
+        sut.status = mock.Mock()
+        sut.determineNextBuildNumber()
+        sut.prune = mock.Mock()
+        build = sut.newBuild()
+        sut.currentBuilds.append(build)
+
+        sut._buildFinished(build)
+
+        sut.status.janitor.schedule.assert_called_with(sut, build)
+        self.assertFalse(sut.prune.called)
+
+    def test_generateFinishedBuilds_max_buildnum(self):
+        """
+        Builds above max_buildnum are neither loaded nor counted against
+        max_search.
+        """
+        sut = self.makeBuilderStatus()
+        sut.nextBuildNumber = 10
+        builds = {}
+        for n in range(10):
+            builds[n] = mock.Mock(name='build%d' % n)
+            builds[n].getNumber.return_value = n
+            builds[n].isFinished.return_value = True
+        sut.getBuildByNumber = mock.Mock(side_effect=builds.__getitem__)
+
+        got = list(sut.generateFinishedBuilds(max_buildnum=5, max_search=3))
+
+        self.assertEqual([b.getNumber() for b in got], [5, 4, 3])
+        self.assertEqual([c[0][0] for c in
+                          sut.getBuildByNumber.call_args_list], [5, 4, 3])
@@ -0,0 +1,161 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from __future__ import with_statement
+
+import cPickle
+import os
+
+from buildbot.status import builder
+from buildbot.status import buildrecord
+from buildbot.status.results import FAILURE
+from buildbot.test.fake import fakemaster
+from buildbot.test.util import compat
+from twisted.trial import unittest
+
+
+class TestBuildRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.builder_status = self.makeBuilderStatus()
+        self.builder_status.basedir = os.path.abspath(self.mktemp())
+        os.makedirs(self.builder_status.basedir)
+        self.builder_status.determineNextBuildNumber()
+
+    def makeBuilderStatus(self):
+        bs = builder.BuilderStatus(buildername='bldr', tags=None,
+                                   master=fakemaster.make_master(),
+                                   description=None)
+        bs.status = None
+        return bs
+
+    def makeBuild(self):
+        build = self.builder_status.newBuild()
+        build.setSourceStamps([])
+        build.setReason('because')
+        build.addStepWithName('compile')
+        build.addStepWithName('test')
+        build.setText(['failed', 'test'])
+        build.setResults(FAILURE)
+        build.started = 10
+        build.finished = 20
+        return build
+
+    def filename(self, build):
+        return self.builder_status.makeBuildFilename(build.getNumber())
+
+    def freshBuilderStatus(self):
+        # a builder status with nothing in its cache
+        bs = self.makeBuilderStatus()
+        bs.basedir = self.builder_status.basedir
+        return bs
+
+    def assertSameBuild(self, loaded, build):
+        self.assertEqual(loaded.getNumber(), build.getNumber())
+        self.assertEqual(loaded.getReason(), 'because')
+        self.assertEqual(loaded.getResults(), FAILURE)
+        self.assertEqual(loaded.getText(), ['failed', 'test'])
+        self.assertEqual(loaded.getTimes(), (10, 20))
+        self.assertEqual([s.getName() for s in loaded.getSteps()],
+                         ['compile', 'test'])
+        for step in loaded.getSteps():
+            self.assertIdentical(step.getBuild(), loaded)
+
+    def test_header_only(self):
+        build = self.makeBuild()
+        build.saveYourself()
+        with open(self.filename(build), 'rb') as f:
+            self.assertTrue(buildrecord.isBuildRecord(f))
+
+        loaded = self.freshBuilderStatus().loadBuildFromFile(0)
+        self.assertNotIn('steps', loaded.__dict__)
+        self.assertEqual(loaded.getResults(), FAILURE)
+        self.assertSameBuild(loaded, build)
+        self.assertIn('steps', loaded.__dict__)
+
+    def test_withSteps(self):
+        build = self.makeBuild()
+        build.saveYourself()
+        loaded = self.freshBuilderStatus().loadBuildFromFile(0,
+                                                             withSteps=True)
+        self.assertIn('steps', loaded.__dict__)
+        self.assertSameBuild(loaded, build)
+
+    def test_resave_unread_steps(self):
+        build = self.makeBuild()
+        build.saveYourself()
+        loaded = self.freshBuilderStatus().loadBuildFromFile(0)
+        loaded.saveYourself()
+        self.assertSameBuild(
+            self.freshBuilderStatus().loadBuildFromFile(0), build)
+
+    @compat.usesFlushLoggedErrors
+    def test_steps_gone(self):
+        build = self.makeBuild()
+        build.saveYourself()
+        loaded = self.freshBuilderStatus().loadBuildFromFile(0)
+        os.unlink(self.filename(build))
+        self.assertEqual(loaded.getSteps(), [])
+        self.assertEqual(len(self.flushLoggedErrors(IOError)), 1)
+
+    def writeOldPickle(self, build):
+        with open(self.filename(build), 'wb') as f:
+            cPickle.dump(build, f, -1)
+
+    def test_old_pickle(self):
+        build = self.makeBuild()
+        self.writeOldPickle(build)
+        loaded = self.freshBuilderStatus().loadBuildFromFile(0)
+        self.assertSameBuild(loaded, build)
+
+    def test_upgradeDirectory(self):
+        old = self.makeBuild()
+        self.writeOldPickle(old)
+        new = self.makeBuild()
+        new.saveYourself()
+        for name in ('builder', '0-log-compile-stdio'):
+            with open(os.path.join(self.builder_status.basedir, name),
+                      'w') as f:
+                f.write('not a build')
+
+        self.assertEqual(
+            buildrecord.upgradeDirectory(self.builder_status.basedir),
+            (1, []))
+        with open(self.filename(old), 'rb') as f:
+            self.assertTrue(buildrecord.isBuildRecord(f))
+        self.assertSameBuild(
+            self.freshBuilderStatus().loadBuildFromFile(0), old)
+        # nothing left to do
+        self.assertEqual(
+            buildrecord.upgradeDirectory(self.builder_status.basedir),
+            (0, []))
+
+    @compat.usesFlushLoggedErrors
+    def test_upgradeDirectory_bad_pickle(self):
+        with open(os.path.join(self.builder_status.basedir, '3'), 'w') as f:
+            f.write('garbage')
+        converted, failed = buildrecord.upgradeDirectory(
+            self.builder_status.basedir)
+        self.assertEqual(converted, 0)
+        self.assertEqual(failed, [os.path.join(self.builder_status.basedir,
+                                               '3')])
+        self.assertEqual(len(self.flushLoggedErrors()), 1)
+
+    def test_unknown_version(self):
+        build = self.makeBuild()
+        with open(self.filename(build), 'wb') as f:
+            f.write('BBREC 99\n')
+        self.assertRaises(IndexError,
+                          self.freshBuilderStatus().loadBuildFromFile, 0)
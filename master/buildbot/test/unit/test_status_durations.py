@@ -0,0 +1,230 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+import os
+
+from buildbot.status import builder
+from buildbot.status import durations
+from buildbot.status.results import FAILURE
+from buildbot.status.results import SKIPPED
+from buildbot.status.results import SUCCESS
+from buildbot.test.fake import fakemaster
+from twisted.internet import defer
+from twisted.trial import unittest
+
+
+class FakeStep(object):
+
+    def __init__(self, name, start, end=None, result=SUCCESS, hidden=False):
+        self.name = name
+        self.times = (start, end)
+        self.result = result
+        self.hidden = hidden
+
+    def getName(self):
+        return self.name
+
+    def getTimes(self):
+        return self.times
+
+    def isFinished(self):
+        return self.times[1] is not None
+
+    def isHidden(self):
+        return self.hidden
+
+    def getResults(self):
+        return (self.result, [])
+
+
+class FakeBuild(object):
+
+    def __init__(self, start, end, steps, result=SUCCESS):
+        self.times = (start, end)
+        self.steps = steps
+        self.result = result
+
+    def getTimes(self):
+        return self.times
+
+    def getResults(self):
+        return self.result
+
+    def getSteps(self):
+        return self.steps
+
+
+class TestDurationSketch(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(durations.DurationSketch().percentile(50), None)
+
+    def test_percentiles(self):
+        s = durations.DurationSketch([40, 10, 30, 20, 50])
+        self.assertEqual(s.percentile(0), 10)
+        self.assertEqual(s.percentile(50), 30)
+        self.assertEqual(s.percentile(90), 46)
+        self.assertEqual(s.percentile(100), 50)
+
+    def test_bounded(self):
+        s = durations.DurationSketch(size=3)
+        for d in [1000, 1, 2, 3]:
+            s.add(d)
+        self.assertEqual(len(s), 3)
+        self.assertEqual(s.percentile(100), 3)
+
+
+class TestDurationHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.history = durations.DurationHistory()
+        self.patch(self.history, 'saveSoon', lambda: None)
+
+    def addBuild(self, compile=100, test=50, result=SUCCESS):
+        steps = [FakeStep('compile', 0, compile),
+                 FakeStep('test', compile, compile + test)]
+        self.history.addBuild('b', FakeBuild(0, compile + test, steps,
+                                             result=result))
+
+    def test_addBuild(self):
+        self.addBuild(100, 50)
+        self.addBuild(200, 70)
+        self.assertEqual(self.history.getBuildDuration('b'), 210)
+        self.assertEqual(self.history.getStepDuration('b', 'compile'), 150)
+        self.assertEqual(self.history.getStepDuration('b', 'test', 100), 70)
+        self.assertEqual(self.history.getStepDuration('b', 'other'), None)
+        self.assertEqual(self.history.getBuildDuration('other'), None)
+
+    def test_addBuild_failed(self):
+        self.addBuild(10, 5, result=FAILURE)
+        self.assertEqual(self.history.getBuildDuration('b'), None)
+        self.assertFalse(self.history.dirty)
+
+    def test_addBuild_failed_step(self):
+        steps = [FakeStep('compile', 0, 100),
+                 FakeStep('test', 100, 101, result=FAILURE)]
+        self.history.addBuild('b', FakeBuild(0, 101, steps))
+        self.assertEqual(self.history.getStepDuration('b', 'compile'), 100)
+        self.assertEqual(self.history.getStepDuration('b', 'test'), None)
+
+    def test_getRemainingTime_steps(self):
+        self.addBuild(100, 50)
+        self.patch(durations.util, 'now', lambda: 1030)
+        build = FakeBuild(1000, None, [FakeStep('compile', 1000),
+                                       FakeStep('test', None)])
+        # 70s left of compile, then 50s of test
+        self.assertEqual(self.history.getRemainingTime('b', build), 120)
+
+    def test_getRemainingTime_overrun(self):
+        self.addBuild(100, 50)
+        self.patch(durations.util, 'now', lambda: 1200)
+        build = FakeBuild(1000, None, [FakeStep('compile', 1000, 1150),
+                                       FakeStep('test', 1150)])
+        self.assertEqual(self.history.getRemainingTime('b', build), 0)
+
+    def test_getRemainingTime_skips_hidden_skipped(self):
+        self.addBuild(100, 50)
+        self.patch(durations.util, 'now', lambda: 1000)
+        build = FakeBuild(1000, None, [
+            FakeStep('compile', None), FakeStep('test', None),
+            FakeStep('upload', None, result=SKIPPED, hidden=True)])
+        self.assertEqual(self.history.getRemainingTime('b', build), 150)
+
+    def test_getRemainingTime_unknown_step(self):
+        self.addBuild(100, 50)
+        self.patch(durations.util, 'now', lambda: 1010)
+        build = FakeBuild(1000, None, [FakeStep('compile', 1000),
+                                       FakeStep('new-step', None)])
+        # falls back to the whole-build duration
+        self.assertEqual(self.history.getRemainingTime('b', build), 140)
+
+    def test_getRemainingTime_no_history(self):
+        build = FakeBuild(1000, None, [FakeStep('compile', 1000)])
+        self.assertEqual(self.history.getRemainingTime('b', build), None)
+
+    def test_save_load(self):
+        filename = os.path.abspath(self.mktemp())
+        self.history.filename = filename
+        self.addBuild(100, 50)
+        self.history.save()
+        self.assertFalse(self.history.dirty)
+
+        loaded = durations.DurationHistory(filename)
+        loaded.load()
+        self.assertEqual(loaded.asDict(), self.history.asDict())
+        self.assertEqual(loaded.getStepDuration('b', 'test'), 50)
+
+    def test_save_clean(self):
+        self.history.filename = os.path.abspath(self.mktemp())
+        self.history.save()
+        self.assertFalse(os.path.exists(self.history.filename))
+
+    @defer.inlineCallbacks
+    def test_saved_when_stopped(self):
+        filename = os.path.abspath(self.mktemp())
+        history = durations.DurationHistory(filename)
+        history.start()
+        steps = [FakeStep('compile', 0, 100)]
+        history.addBuild('b', FakeBuild(0, 100, steps))
+        yield history.stop()
+
+        loaded = durations.DurationHistory(filename)
+        loaded.load()
+        self.assertEqual(loaded.getBuildDuration('b'), 100)
+
+    def test_load_corrupt(self):
+        filename = os.path.abspath(self.mktemp())
+        with open(filename, 'w') as f:
+            f.write('{not json')
+        history = durations.DurationHistory(filename)
+        history.load()
+        self.assertEqual(history.builds, {})
+        self.assertEqual(len(self.flushLoggedErrors(ValueError)), 1)
+
+
+class TestBuilderStatusDurations(unittest.TestCase):
+
+    def setUp(self):
+        self.master = fakemaster.make_master()
+        b = self.builder_status = builder.BuilderStatus('b', None,
+                                                        self.master, None)
+        b.basedir = os.path.abspath(self.mktemp())
+        os.mkdir(b.basedir)
+        b.determineNextBuildNumber()
+        b.status = mock.Mock()
+        b.status.durations = self.history = durations.DurationHistory()
+        self.patch(self.history, 'saveSoon', lambda: None)
+        steps = [FakeStep('compile', 0, 100), FakeStep('test', 100, 150)]
+        self.history.addBuild('b', FakeBuild(0, 150, steps))
+
+    def test_getExpectedDuration(self):
+        self.assertEqual(self.builder_status.getExpectedDuration(), 150)
+        self.assertEqual(
+            self.builder_status.getExpectedDuration('test'), 50)
+
+    def test_getExpectedDuration_no_status(self):
+        self.builder_status.status = None
+        self.assertEqual(self.builder_status.getExpectedDuration(), None)
+
+    def test_getETA(self):
+        self.patch(durations.util, 'now', lambda: 1030)
+        bs = self.builder_status.newBuild()
+        bs.started = 1000
+        compile = bs.addStepWithName('compile')
+        bs.addStepWithName('test')
+        compile.started = 1000
+        self.assertEqual(bs.getETA(), 120)
+        self.assertEqual(compile.getETA(), 70)
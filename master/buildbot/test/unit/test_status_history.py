@@ -0,0 +1,497 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+import os
+
+from buildbot.status import history
+from buildbot.status import master
+from buildbot.status.results import FAILURE
+from buildbot.status.results import SUCCESS
+from buildbot.status.web import slaves
+from buildbot.test.fake.web import FakeRequest
+from buildbot.test.util import compat
+from twisted.internet import defer
+from twisted.trial import unittest
+
+
+class FakeBuild(object):
+
+    def __init__(self, builder, number, start, end, result=SUCCESS,
+                 branches=(None,), slavename='sl', revision=None):
+        self.builder = builder
+        self.number = number
+        self.times = (start, end)
+        self.result = result
+        self.branches = branches
+        self.slavename = slavename
+        self.revision = revision
+        self.got_revision = None
+
+    def getBuilder(self):
+        return self.builder
+
+    def getNumber(self):
+        return self.number
+
+    def getTimes(self):
+        return self.times
+
+    def getResults(self):
+        return self.result
+
+    def getSourceStamps(self, absolute=False):
+        revision = self.revision
+        if absolute and self.got_revision:
+            revision = self.got_revision
+        return [mock.Mock(branch=b, repository='r', codebase='',
+                          revision=revision, patch=None, changes=[],
+                          project='p')
+                for b in self.branches]
+
+    def getSlavename(self):
+        return self.slavename
+
+    def getReason(self):
+        return 'because'
+
+    def getText(self):
+        return ['build', 'successful']
+
+    def getAllGotRevisions(self):
+        return {'': 'abcd'}
+
+    def getInterestedUsers(self):
+        return ['bob']
+
+    def isFinished(self):
+        return self.times[1] is not None
+
+    def __repr__(self):
+        return '%s#%d' % (self.builder.name, self.number)
+
+
+class FakeBuilder(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.builds = []
+        self.loaded = []
+
+    def getName(self):
+        return self.name
+
+    def addBuild(self, start, end, **kwargs):
+        b = FakeBuild(self, len(self.builds), start, end, **kwargs)
+        self.builds.append(b)
+        return b
+
+    def getBuild(self, number):
+        self.loaded.append(number)
+        try:
+            return self.builds[number]
+        except IndexError:
+            return None
+
+    def generateFinishedBuilds(self, branches=[], finished_before=None,
+                               max_buildnum=None, max_search=200,
+                               results=None, filter_fn=None):
+        builds = self.builds
+        if max_buildnum is not None:
+            builds = builds[:max_buildnum + 1]
+        for b in reversed(builds[-max_search:]):
+            self.loaded.append(b.number)
+            if finished_before is not None and b.times[1] >= finished_before:
+                continue
+            if branches and not set(branches) & set(b.branches):
+                continue
+            if results is not None and b.result not in results:
+                continue
+            if filter_fn is not None and not filter_fn(b):
+                continue
+            yield b
+
+
+class TestRecentBuilds(unittest.TestCase):
+
+    def setUp(self):
+        self.recent = history.RecentBuilds(size=3)
+
+    def test_ring(self):
+        bldr = FakeBuilder('b')
+        for i in range(5):
+            self.recent.addBuild('b', bldr.addBuild(i, i + 10))
+        self.assertEqual(len(self.recent), 3)
+        self.assertEqual([s.number for s in self.recent], [4, 3, 2])
+        self.assertEqual(self.recent.oldestEnd(), 12)
+
+    def test_summary(self):
+        bldr = FakeBuilder('b')
+        self.recent.addBuild('b', bldr.addBuild(5, 15, result=FAILURE,
+                                                branches=('y', 'x', 'x')))
+        s = list(self.recent)[0]
+        self.assertEqual(s.asList(), ['b', 0, 5, 15, FAILURE, ['x', 'y']])
+
+    def test_oldestEnd_empty(self):
+        self.assertEqual(self.recent.oldestEnd(), None)
+
+    @defer.inlineCallbacks
+    def test_persistence(self):
+        filename = os.path.abspath(self.mktemp())
+        recent = history.RecentBuilds(filename, size=3)
+        recent.start()
+        bldr = FakeBuilder('b')
+        for i in range(4):
+            recent.addBuild('b', bldr.addBuild(i, i + 10))
+        yield recent.stop()
+
+        loaded = history.RecentBuilds(filename, size=3)
+        loaded.load()
+        self.assertEqual([s.asList() for s in loaded],
+                         [s.asList() for s in recent])
+
+    def test_no_save_until_started(self):
+        filename = os.path.abspath(self.mktemp())
+        recent = history.RecentBuilds(filename)
+        recent.addBuild('b', FakeBuilder('b').addBuild(0, 1))
+        self.assertFalse(os.path.exists(filename))
+        self.assertEqual(recent.saveSoon.phase, 0)
+
+    @compat.usesFlushLoggedErrors
+    def test_load_corrupt(self):
+        filename = os.path.abspath(self.mktemp())
+        with open(filename, 'w') as f:
+            f.write('{not json')
+        recent = history.RecentBuilds(filename)
+        recent.load()
+        self.assertEqual(len(recent), 0)
+        self.assertEqual(len(self.flushLoggedErrors(ValueError)), 1)
+
+
+class TestSlaveBuilds(unittest.TestCase):
+
+    def setUp(self):
+        self.slaveBuilds = history.SlaveBuilds(size=3)
+        self.bldr = FakeBuilder('b')
+
+    def run_build(self, start, end, slavename='sl'):
+        build = self.bldr.addBuild(start, None, slavename=slavename)
+        self.slaveBuilds.buildStarted('b', build)
+        build.times = (start, end)
+        self.slaveBuilds.buildFinished('b', build)
+        return build
+
+    def test_started_and_finished(self):
+        build = self.bldr.addBuild(10, None)
+        self.slaveBuilds.buildStarted('b', build)
+        self.assertEqual(self.slaveBuilds.getFinishedBuilds('sl'), [])
+
+        build.times = (10, 20)
+        self.slaveBuilds.buildFinished('b', build)
+        summaries = self.slaveBuilds.getFinishedBuilds('sl')
+        self.assertEqual([s.asList() for s in summaries],
+                         [['b', 0, 10, 20, SUCCESS, 'build successful',
+                           'because', [['r', '', None, None, False]],
+                           {'': 'abcd'}, ['bob']]])
+
+    def test_summary_line_matches_build_line(self):
+        for i, branches in enumerate([(None,), ('b1', None), (None, None),
+                                      ()]):
+            build = self.bldr.addBuild(10, 20 + i, branches=branches)
+            self.slaveBuilds.buildFinished('b', build)
+            summary = self.slaveBuilds.getFinishedBuilds('sl')[0]
+            page = slaves.OneBuildSlaveResource('sl')
+            req = FakeRequest()
+            values = page.get_summary_line_values(req, summary)
+            self.assertEqual(values['rev_list'], page.get_rev_list(build))
+            self.assertEqual(values['interested_users'], ['bob'])
+
+    def test_per_slave_and_bounded(self):
+        for i in range(5):
+            self.run_build(i, i + 10)
+        self.run_build(0, 100, slavename='other')
+        self.assertEqual([s.number for s
+                          in self.slaveBuilds.getFinishedBuilds('sl')],
+                         [4, 3, 2])
+        self.assertEqual([s.number for s
+                          in self.slaveBuilds.getFinishedBuilds('other')],
+                         [5])
+        self.assertEqual(self.slaveBuilds.getFinishedBuilds('none'), [])
+
+    def test_ordered_by_finish(self):
+        first = self.bldr.addBuild(0, None)
+        self.slaveBuilds.buildStarted('b', first)
+        self.run_build(1, 5)
+        first.times = (0, 10)
+        self.slaveBuilds.buildFinished('b', first)
+        self.assertEqual([s.number for s
+                          in self.slaveBuilds.getFinishedBuilds('sl')],
+                         [0, 1])
+
+    @defer.inlineCallbacks
+    def test_persistence(self):
+        filename = os.path.abspath(self.mktemp())
+        slaveBuilds = history.SlaveBuilds(filename, size=3)
+        self.assertEqual(slaveBuilds.completeSince, None)
+        slaveBuilds.start()
+        # nothing was loaded, so every build from now on is recorded
+        self.assertNotEqual(slaveBuilds.completeSince, None)
+        self.slaveBuilds = slaveBuilds
+        self.run_build(0, 10)
+        self.run_build(5, 15, slavename='other')
+        # still running when the master stops
+        slaveBuilds.buildStarted('b', self.bldr.addBuild(20, None))
+        yield slaveBuilds.stop()
+
+        loaded = history.SlaveBuilds(filename, size=3)
+        loaded.load()
+        self.assertEqual(sorted(loaded.slaves), ['other', 'sl'])
+        self.assertEqual([s.number for s in loaded.slaves['sl']], [0])
+        self.assertEqual(
+            [s.asList() for s in loaded.getFinishedBuilds('other')],
+            [s.asList() for s in slaveBuilds.getFinishedBuilds('other')])
+        # the index stays complete since it was first started
+        self.assertEqual(loaded.completeSince, slaveBuilds.completeSince)
+
+
+class TestGridMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = history.GridMatrix(size=3)
+        self.builders = dict((name, FakeBuilder(name))
+                             for name in ('a', 'b'))
+
+    def start_build(self, builder, start, revision, **kwargs):
+        build = self.builders[builder].addBuild(start, None,
+                                                revision=revision, **kwargs)
+        self.grid.buildStarted(builder, build)
+        return build
+
+    def finish_build(self, builder, build, result=SUCCESS):
+        build.times = (build.times[0], build.times[0] + 5)
+        build.result = result
+        self.grid.buildFinished(builder, build)
+
+    def run_build(self, builder, start, revision, result=SUCCESS, **kwargs):
+        build = self.start_build(builder, start, revision, **kwargs)
+        self.finish_build(builder, build, result)
+        return build
+
+    def revisions(self, rows):
+        return [row.sources[0]['revision'] for row in rows]
+
+    def test_cells(self):
+        self.run_build('a', 10, 'r1')
+        running = self.start_build('b', 12, 'r1')
+        self.run_build('a', 20, 'r2', result=FAILURE)
+
+        rows = self.grid.getRows(5, ['a', 'b'])
+        self.assertEqual(self.revisions(rows), ['r1', 'r2'])
+        self.assertEqual(rows[0].start, 10)
+        self.assertEqual(rows[0].sources,
+                         [dict(project='p', codebase='', repository='r',
+                               branch=None, revision='r1', hasPatch=False)])
+        self.assertEqual(rows[0].cells['a'].asList(),
+                         [0, SUCCESS, ['build', 'successful']])
+        self.assertEqual(rows[0].cells['b'].asList(), [0, None, None])
+        self.assertEqual(rows[1].cells['a'].results, FAILURE)
+
+        self.finish_build('b', running)
+        self.assertEqual(rows[0].cells['b'].results, SUCCESS)
+
+    def test_latest_build_wins(self):
+        self.run_build('a', 10, 'r1', result=FAILURE)
+        self.run_build('a', 20, 'r1')
+        [row] = self.grid.getRows(5, ['a'])
+        self.assertEqual(row.start, 10)
+        self.assertEqual(row.cells['a'].number, 1)
+        self.assertEqual(row.cells['a'].results, SUCCESS)
+
+    def test_filter_builders_and_branches(self):
+        self.run_build('a', 10, 'r1')
+        self.run_build('b', 20, 'r2', branches=('dev',))
+        self.run_build('a', 30, 'r3', branches=('dev',))
+        self.assertEqual(self.revisions(self.grid.getRows(5, ['b'])), ['r2'])
+        self.assertEqual(self.revisions(self.grid.getRows(5, ['a', 'b'],
+                                                          ['dev'])),
+                         ['r2', 'r3'])
+        self.assertEqual(self.revisions(self.grid.getRows(5, ['a'], [None])),
+                         ['r1'])
+        self.assertEqual(self.revisions(self.grid.getRows(2, ['a', 'b'])),
+                         ['r2', 'r3'])
+
+    def test_bounded_per_branch(self):
+        for i in range(5):
+            self.run_build('a', i, 'r%d' % i)
+        self.run_build('a', 1, 'd', branches=('dev',))
+        self.assertEqual(self.revisions(self.grid.getRows(10, ['a'], [None])),
+                         ['r2', 'r3', 'r4'])
+        self.assertEqual(self.revisions(self.grid.getRows(10, ['a'])),
+                         ['d', 'r2', 'r3', 'r4'])
+
+    def test_latest_revision_moves_to_its_row(self):
+        build = self.start_build('a', 10, None)
+        self.assertEqual(self.revisions(self.grid.getRows(5, ['a'])), [None])
+        build.got_revision = 'r1'
+        self.finish_build('a', build)
+        [row] = self.grid.getRows(5, ['a'])
+        self.assertEqual(row.sources[0]['revision'], 'r1')
+        self.assertEqual(row.start, 10)
+
+    @defer.inlineCallbacks
+    def test_persistence(self):
+        filename = os.path.abspath(self.mktemp())
+        self.grid = history.GridMatrix(filename, size=3)
+        self.grid.start()
+        self.run_build('a', 10, 'r1')
+        self.run_build('b', 20, 'r2', branches=('dev',))
+        # still running when the master stops
+        self.start_build('b', 30, 'r1')
+        yield self.grid.stop()
+
+        loaded = history.GridMatrix(filename, size=3)
+        loaded.load()
+        rows = loaded.getRows(5, ['a', 'b'])
+        self.assertEqual(self.revisions(rows), ['r1', 'r2'])
+        self.assertEqual(rows[0].key, ((None, 'r1', None, '', 'p'),))
+        self.assertEqual(sorted(rows[0].cells), ['a'])
+        self.assertEqual(rows[1].cells['b'].asList(),
+                         [0, SUCCESS, ['build', 'successful']])
+
+
+class TestMergeFinishedBuilds(unittest.TestCase):
+
+    def test_merge(self):
+        a, b, c = FakeBuilder('a'), FakeBuilder('b'), FakeBuilder('c')
+        for end in (1, 4, 9):
+            a.addBuild(0, end)
+        for end in (2, 3, 10):
+            b.addBuild(0, end)
+        merged = history.mergeFinishedBuilds(
+            [a.generateFinishedBuilds(), b.generateFinishedBuilds(),
+             c.generateFinishedBuilds()])
+        self.assertEqual([build.getTimes()[1] for build in merged],
+                         [10, 9, 4, 3, 2, 1])
+
+    def test_lazy(self):
+        a, b = FakeBuilder('a'), FakeBuilder('b')
+        for end in range(100):
+            a.addBuild(0, end)
+            b.addBuild(0, end)
+        merged = history.mergeFinishedBuilds(
+            [a.generateFinishedBuilds(), b.generateFinishedBuilds()])
+        self.assertEqual([build.getTimes()[1] for build in
+                          [merged.next() for _ in range(3)]], [99, 99, 98])
+        # only a couple of builds of each builder were looked at
+        self.assertTrue(len(a.loaded) <= 3 and len(b.loaded) <= 3)
+
+
+class TestStatusGenerateFinishedBuilds(unittest.TestCase):
+
+    def setUp(self):
+        m = mock.Mock(name='master')
+        m.basedir = os.path.abspath(self.mktemp())
+        m.config.caches = {'Builds': 15}
+        self.status = master.Status(m)
+        self.builders = {}
+        self.status.getBuilderNames = lambda: sorted(self.builders)
+        self.status.getBuilder = lambda name: self.builders[name]
+
+    def addBuilder(self, name):
+        bldr = self.builders[name] = FakeBuilder(name)
+        return bldr
+
+    def finish(self, bldr, start, end, **kwargs):
+        build = bldr.addBuild(start, end, **kwargs)
+        self.status.recentBuilds.addBuild(bldr.name, build)
+        return build
+
+    def test_from_recent(self):
+        a, b = self.addBuilder('a'), self.addBuilder('b')
+        self.finish(a, 0, 10)
+        self.finish(b, 0, 11)
+        self.finish(a, 5, 12, branches=('br',))
+
+        builds = list(self.status.generateFinishedBuilds(num_builds=2))
+        self.assertEqual(builds, [a.builds[1], b.builds[0]])
+        # the builders' histories were never walked
+        self.assertEqual(a.loaded, [1])
+        self.assertEqual(b.loaded, [0])
+
+        self.assertEqual(
+            list(self.status.generateFinishedBuilds(builders=['a'])),
+            [a.builds[1], a.builds[0]])
+        self.assertEqual(
+            list(self.status.generateFinishedBuilds(branches=['br'])),
+            [a.builds[1]])
+        self.assertEqual(
+            list(self.status.generateFinishedBuilds(finished_before=11)),
+            [a.builds[0]])
+
+    def test_deeper_than_recent(self):
+        a, b = self.addBuilder('a'), self.addBuilder('b')
+        # builds from before the ring buffer existed
+        a.addBuild(0, 1)
+        b.addBuild(0, 2)
+        a.addBuild(0, 3)
+        # and builds the ring buffer knows about
+        self.finish(b, 0, 3)
+        self.finish(a, 0, 4)
+
+        builds = list(self.status.generateFinishedBuilds())
+        self.assertEqual(builds, [a.builds[2], b.builds[1], a.builds[1],
+                                  b.builds[0], a.builds[0]])
+
+    def test_deeper_than_max_search(self):
+        a = self.addBuilder('a')
+        for i in range(20):
+            a.addBuild(0, i)
+        # more builds in the ring buffer than max_search
+        for i in range(20):
+            self.finish(a, 0, 100 + i)
+
+        builds = list(self.status.generateFinishedBuilds(num_builds=25))
+        self.assertEqual([b.number for b in builds], range(39, 14, -1))
+        # the builds the ring buffer covers were not loaded a second time
+        self.assertEqual(sorted(n for n in a.loaded if n >= 20),
+                         range(20, 40))
+
+    def test_removed_builder(self):
+        a = self.addBuilder('a')
+        self.finish(a, 0, 1)
+        gone = FakeBuilder('gone')
+        self.finish(gone, 0, 2)
+        self.assertEqual(list(self.status.generateFinishedBuilds()),
+                         [a.builds[0]])
+
+    def test_results_and_filter_fn(self):
+        a, b = self.addBuilder('a'), self.addBuilder('b')
+        a.addBuild(0, 1, result=FAILURE)
+        self.finish(b, 0, 2, result=FAILURE)
+        self.finish(a, 0, 3)
+        self.finish(b, 0, 4, result=FAILURE)
+
+        builds = list(self.status.generateFinishedBuilds(results=[FAILURE],
+                                                         num_builds=2))
+        self.assertEqual(builds, [b.builds[1], b.builds[0]])
+        # the summary was enough to skip a#1
+        self.assertEqual(a.loaded, [])
+
+        builds = list(self.status.generateFinishedBuilds(results=[FAILURE]))
+        self.assertEqual(builds, [b.builds[1], b.builds[0], a.builds[0]])
+
+        builds = list(self.status.generateFinishedBuilds(
+            filter_fn=lambda build: build.getNumber() == 0))
+        self.assertEqual(builds, [b.builds[0], a.builds[0]])
@@ -0,0 +1,179 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+import os
+
+from buildbot.status import janitor
+from buildbot.test.util import compat
+from twisted.internet import defer
+from twisted.internet import task
+from twisted.trial import unittest
+
+
+class TestBuildFileIndex(unittest.TestCase):
+
+    def test_fromListing(self):
+        index = janitor.BuildFileIndex.fromListing(
+            ['12', '3', 'builder', '3-log-stdio', '12-log-a.bz2',
+             '12-log-b', 'nextbuild'])
+        self.assertEqual(index.builds, [3, 12])
+        self.assertEqual(index.lognums, [3, 12])
+        self.assertEqual(index.logfiles[12], set(['12-log-a.bz2', '12-log-b']))
+        self.assertEqual(len(index), 4)
+
+    def test_addBuild(self):
+        index = janitor.BuildFileIndex.fromListing(['5', '7'])
+        index.addBuild(8, ['8-log-stdio'])
+        index.addBuild(6, [])
+        index.addBuild(8, ['8-log-stdio.gz'])
+        self.assertEqual(index.builds, [5, 6, 7, 8])
+        self.assertEqual(index.lognums, [8])
+        self.assertEqual(index.logfiles[8],
+                         set(['8-log-stdio', '8-log-stdio.gz']))
+
+    def test_expire(self):
+        index = janitor.BuildFileIndex()
+        for number in range(10):
+            index.addBuild(number, ['%d-log' % number])
+
+        expired = index.expire(3, 6, keep=set([1, 4]))
+
+        self.assertEqual(expired, ['0', '2', '0-log', '2-log', '3-log',
+                                   '5-log'])
+        self.assertEqual(index.builds, [1] + range(3, 10))
+        self.assertEqual(index.lognums, [1, 4] + range(6, 10))
+        # nothing more to do until the horizons move
+        self.assertEqual(index.expire(3, 6, keep=set([1, 4])), [])
+
+
+class TestHorizonJanitor(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.janitor = janitor.HorizonJanitor(interval=10)
+        self.janitor._reactor = self.clock
+        # run the worker thread functions synchronously
+        self.patch(janitor.threads, 'deferToThread',
+                   lambda f, *args: defer.maybeDeferred(f, *args))
+
+    def makeBuilder(self, name, horizons=(0, 0), files=()):
+        basedir = os.path.abspath(self.mktemp())
+        os.makedirs(basedir)
+        for filename in files:
+            with open(os.path.join(basedir, filename), 'w') as f:
+                f.write('x' * 10)
+        b = mock.Mock(name=name, basedir=basedir)
+        b.getName.return_value = name
+        b.getPruneHorizons.return_value = horizons
+        b.buildCache.cache = {}
+        return b
+
+    def listdir(self, b):
+        return sorted(os.listdir(b.basedir))
+
+    def test_not_running(self):
+        b = self.makeBuilder('a', (2, 2), ['0', '1', '2'])
+        self.janitor.schedule(b)
+        self.clock.advance(100)
+        self.assertEqual(self.listdir(b), ['0', '1', '2'])
+        self.assertEqual(self.janitor.queue, [b])
+
+    def test_prune(self):
+        b = self.makeBuilder('a', (2, 3),
+                             ['0', '0-log-stdio', '1', '2', '2-log-stdio.bz2',
+                              '3', '3-log-stdio', 'builder'])
+        self.janitor.start()
+        self.janitor.schedule(b)
+        self.janitor.schedule(b)  # already queued
+        self.assertEqual(self.janitor.queue, [b])
+
+        self.clock.advance(10)
+
+        self.assertEqual(self.listdir(b),
+                         ['2', '3', '3-log-stdio', 'builder'])
+        self.assertEqual(self.janitor.bytesReclaimed, 40)
+        self.assertEqual(self.janitor.backlog, 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_cached_builds_kept(self):
+        b = self.makeBuilder('a', (2, 2), ['0', '1'])
+        b.buildCache.cache = {0: 'build'}
+        self.janitor.start()
+        self.janitor.schedule(b)
+        self.clock.advance(10)
+        self.assertEqual(self.listdir(b), ['0'])
+
+    def test_rate_limited(self):
+        self.janitor.batchSize = 2
+        a = self.makeBuilder('a', (3, 3), ['0', '1', '2'])
+        b = self.makeBuilder('b', (1, 1), ['0', '1'])
+        self.janitor.start()
+        self.janitor.schedule(a)
+        self.janitor.schedule(b)
+
+        self.clock.advance(10)
+        self.assertEqual(self.janitor.backlog, 1)
+        self.assertEqual(len(self.listdir(a)) + len(self.listdir(b)), 3)
+
+        self.clock.advance(10)
+        self.assertEqual(self.janitor.backlog, 0)
+        self.assertEqual(self.listdir(a), [])
+        self.assertEqual(self.listdir(b), ['1'])
+        self.assertEqual(self.janitor.bytesReclaimed, 40)
+
+    def test_index_updated_by_finished_builds(self):
+        b = self.makeBuilder('a', (1, 1), ['0', '0-log-stdio', '1'])
+        self.janitor.start()
+        self.janitor.schedule(b)
+        self.clock.advance(10)
+        self.assertEqual(self.listdir(b), ['1'])
+
+        # a new build finishes; its files must be found without listdir
+        with open(os.path.join(b.basedir, '1-log-stdio.gz'), 'w') as f:
+            f.write('x')
+        build = mock.Mock()
+        build.getNumber.return_value = 1
+        build.getLogs.return_value = [mock.Mock(filename='1-log-stdio')]
+        b.getPruneHorizons.return_value = (2, 2)
+        listdir = mock.Mock(side_effect=os.listdir)
+        self.patch(os, 'listdir', listdir)
+        self.janitor.schedule(b, build)
+        self.clock.advance(10)
+
+        self.assertFalse(listdir.called)
+        self.assertEqual(self.listdir(b), [])
+
+    @defer.inlineCallbacks
+    def test_stop(self):
+        b = self.makeBuilder('a', (1, 1), ['0'])
+        self.janitor.start()
+        self.janitor.schedule(b)
+        yield self.janitor.stop()
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.clock.advance(10)
+        self.assertEqual(self.listdir(b), ['0'])
+
+    @compat.usesFlushLoggedErrors
+    def test_prune_error(self):
+        a = self.makeBuilder('a', (1, 1), ['0'])
+        a.getPruneHorizons.side_effect = RuntimeError('oops')
+        b = self.makeBuilder('b', (1, 1), ['0'])
+        self.janitor.start()
+        self.janitor.schedule(a)
+        self.janitor.schedule(b)
+        self.clock.pump([10, 10])
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+        self.assertEqual(self.listdir(b), [])
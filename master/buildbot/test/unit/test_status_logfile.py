@@ -315,6 +315,31 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         self.logfile.addHeader('hed')
         addEntry.assert_called_with(2, 'hed')
 
+    def addLines(self):
+        # small chunks, so that lines span chunk boundaries
+        self.logfile.chunkSize = 4
+        self.logfile.BUFFERSIZE = 7
+        for i in range(10):
+            self.logfile.addStdout('line %d\n' % i)
+            self.logfile.addHeader('header\n')
+        self.logfile.addStderr('no newline')
+        self.logfile.finish()
+
+    def test_iterLines(self):
+        self.addLines()
+        self.assertEqual(list(self.logfile.iterLines()),
+                         ['line %d\n' % i for i in range(10)] + ['no newline'])
+
+    def test_getHead(self):
+        self.addLines()
+        self.assertEqual(self.logfile.getHead(2), ['line 0\n', 'line 1\n'])
+
+    def test_getTail(self):
+        self.addLines()
+        self.assertEqual(self.logfile.getTail(2), ['line 9\n', 'no newline'])
+        self.assertEqual(self.logfile.getTail(1, channels=[0]),
+                         ['line 9\n'])
+
     def do_test_compressLog(self, ext, expect_comp=True):
         self.logfile.openfile.write('xyz' * 1000)
         self.logfile.finish()
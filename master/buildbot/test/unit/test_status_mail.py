@@ -16,6 +16,9 @@
 import re
 import sys
 
+from StringIO import StringIO
+from gzip import GzipFile
+
 from buildbot import config
 from buildbot.config import ConfigErrors
 from buildbot.process import properties
@@ -39,11 +42,12 @@ py_27 = sys.version_info[0] > 2 or (sys.version_info[0] == 2
 
 class FakeLog(object):
 
-    def __init__(self, text):
+    def __init__(self, text, name='log-name'):
         self.text = text
+        self.name = name
 
     def getName(self):
-        return 'log-name'
+        return self.name
 
     def getStep(self):
         class FakeStep(object):
@@ -55,6 +59,13 @@ class FakeLog(object):
     def getText(self):
         return self.text
 
+    def getChunks(self, channels=[], onlyText=False):
+        for i in range(0, len(self.text), 10):
+            yield self.text[i:i + 10]
+
+    def isFinished(self):
+        return True
+
 
 class FakeSource:
 
@@ -180,6 +191,44 @@ class TestMailNotifier(ConfigErrorsMixin, unittest.TestCase):
             self.assertIn('application/octet-stream', txt)
         return d
 
+    def getLogAttachments(self, m):
+        return [(part.get_filename(), part.get_payload(decode=True))
+                for part in m.get_payload()[1:]]
+
+    def test_createEmail_maxLogsSize(self):
+        builds = [FakeBuildStatus(name="build")]
+        logs = [FakeLog('a' * 20 + 'tail', 'first'),
+                FakeLog('b' * 30, 'second'),
+                FakeLog('c' * 5, 'third')]
+        mn = MailNotifier('from@example.org', addLogs=True, maxLogsSize=34)
+        d = mn.createEmail(create_msgdict(), u'builder', u'pr', SUCCESS,
+                           builds, None, logs)
+
+        @d.addCallback
+        def check(m):
+            self.assertEqual(self.getLogAttachments(m), [
+                ('step-name.first', 'a' * 20 + 'tail'),
+                ('step-name.second', '[... 20 bytes omitted ...]\n' +
+                 'b' * 10),
+            ])
+        return d
+
+    def test_createEmail_compressLogs(self):
+        builds = [FakeBuildStatus(name="build")]
+        msg = u'Unicode log with non-ascii (\u00E5\u00E4\u00F6).\n' * 10
+        logs = [FakeLog(msg.encode('utf-8'))]
+        mn = MailNotifier('from@example.org', addLogs=True, compressLogs=True)
+        d = mn.createEmail(create_msgdict(), u'builder', u'pr', SUCCESS,
+                           builds, None, logs)
+
+        @d.addCallback
+        def check(m):
+            [(filename, data)] = self.getLogAttachments(m)
+            self.assertEqual(filename, 'step-name.log-name.gz')
+            f = GzipFile(fileobj=StringIO(data))
+            self.assertEqual(f.read(), msg.encode('utf-8'))
+        return d
+
     def test_init_enforces_tags_and_builders_are_mutually_exclusive(self):
         self.assertRaises(config.ConfigErrors,
                           MailNotifier, 'from@example.org',
@@ -484,6 +533,37 @@ class TestMailNotifier(ConfigErrorsMixin, unittest.TestCase):
         self.assertTrue(isinstance(self.passedAttrs['revision'], str))
         self.assertEqual(self.passedAttrs['revision'], '111222')
 
+    def test_getCustomMesgData_logs_are_lists(self):
+        mn = MailNotifier('from@example.org')
+        build = FakeBuildStatus()
+        log = Mock()
+        log.getName.return_value = 'stdio'
+        log.getStep.return_value.getName.return_value = 'compile'
+        log.getStep.return_value.getResults.return_value = (FAILURE, [])
+        log.iterLines.side_effect = lambda: iter(['line 1\n', 'line 2\n'])
+        log.getTail.return_value = ['line 2\n']
+        build.getLogs.return_value = [log]
+        build.getSourceStamps.return_value = []
+        master_status = Mock()
+        master_status.getURLForThing.return_value = 'http://bb/build'
+
+        attrs = mn.getCustomMesgData('all', 'Builder', build, FAILURE,
+                                     master_status)
+        # nothing is read until the lines are used
+        self.assertFalse(log.iterLines.called)
+        self.assertFalse(log.getText.called)
+        lines = attrs['logs'][0][2]
+        self.assertEqual(lines[-1:], ['line 2'])
+        log.getTail.assert_called_with(1)
+        self.assertEqual(list(lines), ['line 1', 'line 2'])
+        self.assertEqual(attrs['logs'], [
+            ('compile.stdio', 'http://bb/build/steps/compile/logs/stdio',
+             ['line 1', 'line 2'], FAILURE)])
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1], 'line 2')
+        self.assertEqual(list(lines), list(lines))
+        self.assertFalse(log.getText.called)
+
     def test_buildFinished_ignores_unspecified_tags(self):
         mn = MailNotifier('from@example.org', tags=['fast'])
 
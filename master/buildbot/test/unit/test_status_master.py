@@ -14,10 +14,13 @@
 # Copyright Buildbot Team Members
 
 import mock
+import os
 
 from buildbot.status import base
 from buildbot.status import master
+from buildbot.status.results import SUCCESS
 from buildbot.test.fake import fakedb
+from buildbot.test.util import compat
 from twisted.internet import defer
 from twisted.trial import unittest
 
@@ -26,6 +29,40 @@ class FakeStatusReceiver(base.StatusReceiver):
     pass
 
 
+def makeStatusWithBuilders(testcase, names, tags={}):
+    """Make a real L{master.Status}, in a temporary directory, with a
+    builder status for each of NAMES, tagged as given in TAGS."""
+    m = mock.Mock(name='master')
+    m.db = fakedb.FakeDBConnector(testcase)
+    m.basedir = os.path.abspath(testcase.mktemp())
+    m.config.eventHorizon = 50
+    m.config.buildCacheSize = 15
+    s = master.Status(m)
+    s.basedir = m.basedir
+    m.botmaster.builderNames = list(names)
+    m.botmaster.builders = {}
+    for name in names:
+        m.botmaster.builders[name] = mock.Mock(name=name)
+        m.botmaster.builders[name].builder_status = \
+            s.builderAdded(name, name, tags=tags.get(name))
+    s.startService()
+    testcase.addCleanup(s.stopService)
+    return s
+
+
+def startBuild(builder_status):
+    build = builder_status.newBuild()
+    build.setSourceStamps([])
+    build.setSlavename('sl')
+    build.buildStarted(mock.Mock(name='build'))
+    return build
+
+
+def finishBuild(build, results):
+    build.setResults(results)
+    build.buildFinished()
+
+
 class TestStatus(unittest.TestCase):
 
     def makeStatus(self):
@@ -56,6 +93,7 @@ class TestStatus(unittest.TestCase):
     @defer.inlineCallbacks
     def test_reconfigService(self):
         m = mock.Mock(name='master')
+        m.basedir = r'C:\BASEDIR'
         status = master.Status(m)
         status.startService()
 
@@ -98,3 +136,52 @@ class TestStatus(unittest.TestCase):
         self.assertIdentical(sr0.master, None)
         self.assertIdentical(sr1.master, None)
         self.assertIdentical(sr2.master, None)
+
+    def test_builderAdded_new(self):
+        s = self.makeStatus()
+        s.master.basedir = os.path.abspath(self.mktemp())
+        s.basedir = s.master.basedir
+        s.master.config.eventHorizon = 50
+
+        bs = s.builderAdded('bldr', 'bldr', tags=['a'])
+
+        self.assertEqual(bs.getTags(), ['a'])
+        self.assertTrue(os.path.isdir(os.path.join(s.basedir, 'bldr')))
+        self.assertEqual(bs.nextBuildNumber, 0)
+        self.assertEqual([e.text for e in bs.events], [['builder', 'created']])
+
+    @defer.inlineCallbacks
+    def test_subscribe(self):
+        s = makeStatusWithBuilders(self, ['bldr'])
+        bs = s.getBuilder('bldr')
+
+        receiver = mock.Mock(name='receiver')
+        receiver.builderAdded.return_value = receiver
+        receiver.buildStarted.return_value = None
+        yield s.subscribe(receiver)
+
+        self.assertEqual(s.watchers, [receiver])
+        receiver.builderAdded.assert_called_with('bldr', bs)
+        build = startBuild(bs)
+        receiver.buildStarted.assert_called_with('bldr', build)
+        finishBuild(build, SUCCESS)
+        receiver.buildFinished.assert_called_with('bldr', build, SUCCESS)
+
+    @compat.usesFlushLoggedErrors
+    def test_builderAdded_existing_pickle_loaded_lazily(self):
+        s = self.makeStatus()
+        s.master.basedir = os.path.abspath(self.mktemp())
+        s.basedir = s.master.basedir
+        s.master.config.eventHorizon = 50
+        builder_dir = os.path.join(s.basedir, 'bldr')
+        os.makedirs(builder_dir)
+        with open(os.path.join(builder_dir, 'builder'), 'w') as f:
+            f.write('not even a pickle')
+
+        bs = s.builderAdded('bldr', 'bldr')
+
+        # nothing was read yet
+        self.assertNotIn('events', bs.__dict__)
+        # and an unreadable pickle just means no past events
+        self.assertEqual(bs.events, [])
+        self.assertEqual(len(self.flushLoggedErrors()), 1)
@@ -23,6 +23,7 @@ from buildbot.status.persistent_queue import DiskQueue
 from buildbot.status.persistent_queue import IQueue
 from buildbot.status.persistent_queue import MemoryQueue
 from buildbot.status.persistent_queue import PersistentQueue
+from buildbot.status.persistent_queue import SegmentedDiskQueue
 from buildbot.status.persistent_queue import WriteFile
 
 
@@ -149,4 +150,67 @@ class test_Queues(dirs.DirsMixin, unittest.TestCase):
         self._test_helper(PersistentQueue(MemoryQueue(3),
                                           DiskQueue('fake_dir', 5)))
 
+    def testSegmentedDiskQueue(self):
+        self._test_helper(SegmentedDiskQueue('fake_dir', maxItems=8))
+
+    def testSegmentedDiskQueueSmallSegments(self):
+        self._test_helper(SegmentedDiskQueue('fake_dir', maxItems=8,
+                                             segmentSize=20, syncEvery=1))
+
+    def testPersistentSegmentedDiskQueue(self):
+        self._test_helper(PersistentQueue(MemoryQueue(3),
+                                          SegmentedDiskQueue('fake_dir', 5)))
+
+    def segments(self):
+        return sorted(n for n in os.listdir('fake_dir') if n.endswith('.seg'))
+
+    def testSegmentedReload(self):
+        q = SegmentedDiskQueue('fake_dir', segmentSize=20, pickleFn=str,
+                               unpickleFn=str)
+        for i in range(10):
+            q.pushItem('item%d' % i)
+        self.assertEqual(['0.seg', '1.seg', '2.seg', '3.seg'],
+                         self.segments())
+        self.assertEqual(['item0', 'item1', 'item2', 'item3'], q.popChunk(4))
+        # the first segment has been read entirely, and is gone
+        self.assertEqual(['1.seg', '2.seg', '3.seg'], self.segments())
+        q.insertBackChunk(['back'])
+        q.save()
+
+        q = SegmentedDiskQueue('fake_dir', segmentSize=20, pickleFn=str,
+                               unpickleFn=str)
+        self.assertEqual(7, q.nbItems())
+        self.assertEqual(['back'] + ['item%d' % i for i in range(4, 10)],
+                         q.items())
+        self.assertEqual(['back'] + ['item%d' % i for i in range(4, 10)],
+                         q.popChunk())
+
+    def testSegmentedCrashRedelivers(self):
+        q = SegmentedDiskQueue('fake_dir', pickleFn=str, unpickleFn=str)
+        for i in range(4):
+            q.pushItem(str(i))
+        q.save()
+        self.assertEqual(['0', '1'], q.popChunk(2))
+        # no save(): the pops are not checkpointed yet
+        q = SegmentedDiskQueue('fake_dir', pickleFn=str, unpickleFn=str)
+        self.assertEqual(['0', '1', '2', '3'], q.popChunk())
+
+    def testSegmentedTornRecord(self):
+        q = SegmentedDiskQueue('fake_dir', pickleFn=str, unpickleFn=str)
+        q.pushItem('complete')
+        q.save()
+        with open(os.path.join('fake_dir', '0.seg'), 'ab') as f:
+            f.write('\x00\x00\x00\x10part')
+        q = SegmentedDiskQueue('fake_dir', pickleFn=str, unpickleFn=str)
+        self.assertEqual(1, q.nbItems())
+        q.pushItem('next')
+        self.assertEqual(['complete', 'next'], q.popChunk())
+
+    def testSegmentedImportsDiskQueue(self):
+        WriteFile(os.path.join('fake_dir', '3'), 'foo3')
+        WriteFile(os.path.join('fake_dir', '5'), 'foo5')
+        q = SegmentedDiskQueue('fake_dir', pickleFn=str, unpickleFn=str)
+        self.assertEqual(['0.seg', 'checkpoint'], sorted(os.listdir('fake_dir')))
+        self.assertEqual(['foo3', 'foo5'], q.popChunk())
+
 # vim: set ts=4 sts=4 sw=4 et:
@@ -13,6 +13,8 @@
 #
 # Copyright Buildbot Team Members
 
+import mock
+
 from buildbot.status import slave
 from buildbot.util import eventual
 from twisted.trial import unittest
@@ -331,4 +333,15 @@ class TestSlaveStatus(unittest.TestCase):
                 'admin': 'TheAdmin',
                 'key': 'value'
             },
+            'workspaces': {},
+        })
+
+    def test_recordWorkspace(self):
+        s = self.makeStatus()
+        ss = mock.Mock(codebase='cb', branch='master', revision='abcd')
+        s.recordWorkspace('bldr', [ss], when=1234)
+        self.assertEqual(s.getWorkspace('bldr'), {
+            'time': 1234,
+            'sources': {'cb': {'branch': 'master', 'revision': 'abcd'}},
         })
+        self.assertEqual(s.getWorkspace('other'), None)
@@ -0,0 +1,144 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import copy
+import mock
+import os
+
+from buildbot.status import builder
+from buildbot.status import status_push
+from buildbot.status.results import SUCCESS
+from buildbot.test.fake import fakemaster
+from buildbot.util import json
+from twisted.internet import defer
+from twisted.trial import unittest
+
+
+class TestDiffSnapshot(unittest.TestCase):
+
+    def check(self, old, new):
+        changes = status_push.diffSnapshot(old, new)
+        # changes must survive a trip through json, as sent to a receiver
+        changes = json.loads(json.dumps(changes))
+        self.assertEqual(status_push.applyDelta(copy.deepcopy(old), changes),
+                         new)
+        return changes
+
+    def test_unchanged(self):
+        self.assertEqual(self.check({'a': [1, {'b': 2}]},
+                                    {'a': [1, {'b': 2}]}), [])
+
+    def test_nested(self):
+        changes = self.check({'a': 1, 'steps': [{'text': ['x']}, {'eta': 5}]},
+                             {'a': 1, 'steps': [{'text': ['x']}, {'eta': 4}]})
+        self.assertEqual(changes, [[['steps', 1, 'eta'], 4]])
+
+    def test_added_removed(self):
+        changes = self.check({'a': 1, 'b': 2}, {'a': 1, 'c': 3})
+        self.assertEqual(sorted(changes), [[['b']], [['c'], 3]])
+
+    def test_list_grows(self):
+        changes = self.check({'logs': [['stdio', 'u1']]},
+                             {'logs': [['stdio', 'u1'], ['err', 'u2']]})
+        self.assertEqual(changes, [[['logs', 1], ['err', 'u2']]])
+
+    def test_list_shrinks(self):
+        changes = self.check({'l': [1, 2, 3]}, {'l': [1]})
+        self.assertEqual(changes, [[['l'], [1]]])
+
+    def test_root_replaced(self):
+        self.assertEqual(self.check([1, 2], None), [[[], None]])
+
+
+class TestStatusPushDeltas(unittest.TestCase):
+
+    def setUp(self):
+        self.master = fakemaster.make_master()
+        b = builder.BuilderStatus('bldr', None, self.master, None)
+        b.basedir = os.path.abspath(self.mktemp())
+        os.mkdir(b.basedir)
+        b.determineNextBuildNumber()
+        self.build = b.newBuild()
+        self.build.started = 1000
+        self.build.setSourceStamps([])
+        self.steps = [self.build.addStepWithName('compile'),
+                      self.build.addStepWithName('test')]
+
+        self.sp = status_push.StatusPush(serverPushCb=lambda sp: None,
+                                         deltas=True, keyframeInterval=3)
+        self.sp.status = mock.Mock()
+        self.sp.status.getTitle.return_value = 'proj'
+        self.sp.queueNextServerPush = lambda: defer.succeed(None)
+
+    def popPackets(self):
+        return self.sp.queue.popChunk(100)
+
+    def test_build_deltas(self):
+        self.sp.buildStarted('bldr', self.build)
+        self.steps[0].started = 1000
+        self.sp.buildETAUpdate(self.build, 30)
+
+        full, delta = self.popPackets()
+        self.assertEqual(full['ids'], {'build': ['bldr', 0, 'build']})
+        self.assertNotIn('deltas', full)
+        self.assertEqual(full['payload']['build']['builderName'], 'bldr')
+        self.assertEqual(delta['ids'], {'build': ['bldr', 0, 'build']})
+        self.assertEqual(delta['deltas'], ['build'])
+        self.assertEqual(delta['payload']['ETA'], 30)
+
+        snapshot = status_push.applyDelta(full['payload']['build'],
+                                          delta['payload']['build'])
+        self.assertEqual(snapshot, status_push.FilterOut(self.build.asDict()))
+
+    def test_step_events(self):
+        self.build.setProperty('prop', 'value', 'test')
+        self.sp.stepStarted(self.build, self.steps[1])
+        self.sp.stepTextChanged(self.build, self.steps[1], ['testing'])
+
+        first, second = self.popPackets()
+        self.assertEqual(first['ids'], {'step': ['bldr', 0, 'step', 1],
+                                        'properties': ['bldr', 0,
+                                                       'properties']})
+        self.assertEqual(first['payload']['properties'],
+                         [['prop', 'value', 'test']])
+        self.assertEqual(sorted(second['deltas']), ['properties', 'step'])
+        self.assertEqual(second['payload']['properties'], [])
+        self.assertEqual(second['payload']['text'], ['testing'])
+
+    def test_keyframes(self):
+        for i in range(7):
+            self.sp.buildETAUpdate(self.build, i)
+        packets = self.popPackets()
+        self.assertEqual(['deltas' in p for p in packets],
+                         [False, True, True, False, True, True, False])
+
+    def test_buildFinished(self):
+        self.sp.buildStarted('bldr', self.build)
+        self.build.finished = 1100
+        self.build.results = SUCCESS
+        self.sp.buildFinished('bldr', self.build, SUCCESS)
+        started, finished = self.popPackets()
+        self.assertNotIn('deltas', finished)
+        self.assertEqual(finished['payload']['build']['times'], [1000, 1100])
+        self.assertEqual(self.sp.snapshots, {})
+
+    def test_no_deltas(self):
+        self.sp.deltas = False
+        self.sp.buildStarted('bldr', self.build)
+        self.sp.buildETAUpdate(self.build, 30)
+        for packet in self.popPackets():
+            self.assertNotIn('ids', packet)
+            self.assertEqual(packet['payload']['build']['builderName'],
+                             'bldr')
@@ -14,8 +14,10 @@
 # Copyright Buildbot Team Members
 
 import mock
+import os
 
 from buildbot.status.web import base
+from buildbot.test.util import dirs
 from twisted.internet import defer
 from twisted.trial import unittest
 
@@ -158,3 +160,59 @@ class Functions(unittest.TestCase):
     def test_path_to_root_from_two_level(self):
         self.assertEqual(base.path_to_root(self.fakeRequest(['a', 'b'])),
                          '../')
+
+
+class JinjaEnv(unittest.TestCase, dirs.DirsMixin):
+
+    def setUp(self):
+        self.basedir = os.path.abspath('basedir')
+        return self.setUpDirs(self.basedir)
+
+    def tearDown(self):
+        return self.tearDownDirs()
+
+    def test_fragment_cache(self):
+        env = base.createJinjaEnv()
+        calls = []
+        template = env.from_string(
+            "{% cache key, 'x' %}{{ f() }}{% endcache %}")
+        f = lambda: calls.append(None) or len(calls)
+        self.assertEqual(template.render(key=('a', 1), f=f), '1')
+        self.assertEqual(template.render(key=('a', 1), f=f), '1')
+        self.assertEqual(template.render(key=('a', 2), f=f), '2')
+        self.assertEqual(template.render(key=None, f=f), '3')
+        self.assertEqual(template.render(key=None, f=f), '4')
+
+    def test_fragment_cache_new_template(self):
+        env = base.createJinjaEnv()
+        source = "{% cache key %}{{ v }}{% endcache %}"
+        self.assertEqual(env.from_string(source).render(key=1, v='a'), 'a')
+        # another (or a reloaded) template does not see this fragment
+        self.assertEqual(env.from_string(source).render(key=1, v='b'), 'b')
+
+    def test_fragment_key(self):
+        build = mock.Mock()
+        build.getBuilder().getName.return_value = 'bldr'
+        build.getNumber.return_value = 7
+        build.isFinished.return_value = False
+        req = FakeRequest()
+        req.path = '/builders/bldr/builds/7'
+        self.assertEqual(base.fragment_key(req, build), None)
+        build.isFinished.return_value = True
+        self.assertEqual(base.fragment_key(req, build),
+                         ('bldr', 7, '/builders/bldr/builds/7'))
+
+    def test_bytecode_cache(self):
+        env = base.createJinjaEnv(basedir=self.basedir, bytecode_cache=True)
+        cachedir = os.path.join(self.basedir, 'templates_cache')
+        self.assertFalse(os.path.exists(cachedir))
+        env.get_template('layout.html')
+        self.assertNotEqual(os.listdir(cachedir), [])
+        # a fresh environment loads the compiled template
+        env = base.createJinjaEnv(basedir=self.basedir, bytecode_cache=True)
+        self.patch(env, 'compile', mock.Mock(side_effect=AssertionError))
+        env.get_template('layout.html')
+
+    def test_auto_reload(self):
+        self.assertTrue(base.createJinjaEnv().auto_reload)
+        self.assertFalse(base.createJinjaEnv(auto_reload=False).auto_reload)
@@ -0,0 +1,248 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+
+from buildbot.status.results import FAILURE
+from buildbot.status.results import SUCCESS
+from buildbot.status.web import events
+from buildbot.test.fake.web import FakeRequest
+from buildbot.test.unit import test_status_master
+from buildbot.util import json
+from twisted.internet import defer
+from twisted.internet import task
+from twisted.trial import unittest
+
+
+class FakeStatus(object):
+
+    def __init__(self):
+        self.watchers = []
+
+    def subscribe(self, target):
+        self.watchers.append(target)
+
+    def unsubscribe(self, target):
+        self.watchers.remove(target)
+
+
+class FakeBuilderStatus(object):
+
+    def __init__(self, tags):
+        self.tags = tags
+        self.watchers = []
+
+    def matchesAnyTag(self, tags):
+        return bool(set(self.tags) & set(tags))
+
+    def unsubscribe(self, target):
+        self.watchers.remove(target)
+
+
+class FakeBuild(object):
+
+    def __init__(self, buildername, number):
+        self.buildername = buildername
+        self.number = number
+
+    def getBuilder(self):
+        return mock.Mock(getName=lambda: self.buildername)
+
+    def getNumber(self):
+        return self.number
+
+    def getSlavename(self):
+        return 'slave1'
+
+    def getTimes(self):
+        return (10, 20)
+
+    def getText(self):
+        return ['build', 'successful']
+
+
+def parseEvents(written):
+    """Parse the written stream into a list of (event, data), skipping
+    comments and retry lines."""
+    result = []
+    for block in written.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n')
+                      if ': ' in line and not line.startswith(':'))
+        if 'event' in fields:
+            result.append((fields['event'], json.loads(fields['data'])))
+    return result
+
+
+class TestEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.status = FakeStatus()
+        self.resource = events.EventsResource()
+        self.hub = self.resource.hub = events.EventHub(self.status)
+        self.clock = self.hub._reactor = task.Clock()
+        self.builders = {
+            'linux': FakeBuilderStatus(['unix']),
+            'win': FakeBuilderStatus(['windows']),
+        }
+        for name, builder_status in self.builders.items():
+            # as Status.announceNewBuilder would
+            builder_status.watchers.append(
+                self.hub.builderAdded(name, builder_status))
+
+    def connect(self, lastEventId=None, **args):
+        request = FakeRequest(args=args)
+        if lastEventId is not None:
+            request.received_headers['last-event-id'] = lastEventId
+        request.finished_d = defer.Deferred()
+        request.notifyFinish = lambda: request.finished_d
+        request.test_render(self.resource)
+        stream = request.registerProducer.call_args[0][0]
+        return request, stream
+
+    def test_headers_and_subscription(self):
+        request, stream = self.connect()
+        request.setHeader.assert_any_call('content-type', 'text/event-stream')
+        self.assertEqual(self.status.watchers, [self.hub])
+
+        self.hub.slaveConnected('slave1')
+        self.assertEqual(parseEvents(request.written),
+                         [('slaveConnected', {'slave': 'slave1'})])
+
+    def test_build_and_step_events(self):
+        request, stream = self.connect()
+        build = FakeBuild('linux', 3)
+        self.assertIdentical(self.hub.buildStarted('linux', build), self.hub)
+        step = mock.Mock()
+        step.getName.return_value = 'compile'
+        step.getText.return_value = ['compile']
+        self.hub.stepTextChanged(build, step, ['compiling'])
+        self.hub.stepFinished(build, step, (0, []))
+        self.hub.buildFinished('linux', build, 0)
+        self.assertEqual(parseEvents(request.written), [
+            ('buildStarted', {'builder': 'linux', 'number': 3,
+                              'slave': 'slave1', 'start': 10}),
+            ('stepText', {'builder': 'linux', 'number': 3,
+                          'step': 'compile', 'text': ['compiling']}),
+            ('stepFinished', {'builder': 'linux', 'number': 3,
+                              'step': 'compile', 'results': 0,
+                              'text': ['compile']}),
+            ('buildFinished', {'builder': 'linux', 'number': 3,
+                               'results': 0, 'text': ['build', 'successful'],
+                               'end': 20}),
+        ])
+
+    def test_filter_builder_and_tag(self):
+        byBuilder, _ = self.connect(builder=['win'])
+        byTag, _ = self.connect(tag=['unix'])
+        for name in ('linux', 'win'):
+            self.hub.builderChangedState(name, 'idle')
+        self.hub.slaveConnected('slave1')
+        self.assertEqual([e for e, d in parseEvents(byBuilder.written)],
+                         ['builderState', 'slaveConnected'])
+        self.assertEqual(parseEvents(byBuilder.written)[0][1]['builder'],
+                         'win')
+        self.assertEqual(parseEvents(byTag.written)[0][1]['builder'],
+                         'linux')
+        self.assertEqual(len(parseEvents(byTag.written)), 2)
+
+    def test_encoded_once(self):
+        self.connect()
+        self.connect()
+        with mock.patch.object(events, 'encodeEvent',
+                               wraps=events.encodeEvent) as encode:
+            self.hub.slaveConnected('slave1')
+        self.assertEqual(encode.call_count, 1)
+
+    def test_paused_buffers_then_resyncs(self):
+        request, stream = self.connect()
+        stream.pauseProducing()
+        self.hub.slaveConnected('slave1')
+        self.assertEqual(parseEvents(request.written), [])
+        stream.resumeProducing()
+        self.assertEqual(len(parseEvents(request.written)), 1)
+
+        stream.pauseProducing()
+        for i in range(stream.maxBuffered + 1):
+            self.hub.slaveConnected('slave%d' % i)
+        self.assertEqual(stream.buffer, [])
+        stream.resumeProducing()
+        self.assertEqual(parseEvents(request.written)[-1], ('resync', {}))
+        self.assertEqual(len(parseEvents(request.written)), 2)
+
+    def test_replay(self):
+        request, stream = self.connect()
+        self.hub.slaveConnected('a')
+        self.hub.slaveConnected('b')
+        again, _ = self.connect(lastEventId='1')
+        self.assertEqual(parseEvents(again.written),
+                         [('slaveConnected', {'slave': 'b'})])
+
+        self.hub.recent.clear()
+        self.hub.slaveConnected('c')
+        late, _ = self.connect(lastEventId='1')
+        self.assertEqual(parseEvents(late.written), [('resync', {})])
+
+    def test_disconnect_unsubscribes(self):
+        first, _ = self.connect()
+        second, _ = self.connect()
+        first.finished_d.callback(None)
+        self.assertEqual(self.status.watchers, [self.hub])
+        second.finished_d.errback(Exception('connection lost'))
+        self.assertEqual(self.status.watchers, [])
+        self.assertEqual(self.hub.builders, {})
+        self.assertEqual(self.builders['linux'].watchers, [])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_keepalive(self):
+        request, _ = self.connect()
+        written = request.written
+        self.clock.advance(self.hub.keepaliveInterval)
+        self.assertEqual(request.written, written + events.KEEPALIVE)
+
+
+class TestEventsWithStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.status = test_status_master.makeStatusWithBuilders(
+            self, ['linux', 'win'], tags={'linux': ['unix']})
+        self.resource = events.EventsResource()
+        self.resource.hub = events.EventHub(self.status)
+        self.resource.hub._reactor = task.Clock()
+
+    def connect(self, **args):
+        request = FakeRequest(args=args)
+        request.finished_d = defer.Deferred()
+        request.notifyFinish = lambda: request.finished_d
+        request.test_render(self.resource)
+        self.addCleanup(request.finished_d.callback, None)
+        return request
+
+    def test_build_events(self):
+        everything = self.connect()
+        byTag = self.connect(tag=['unix'])
+        for name, results in ('linux', SUCCESS), ('win', FAILURE):
+            build = test_status_master.startBuild(
+                self.status.getBuilder(name))
+            test_status_master.finishBuild(build, results)
+
+        self.assertEqual(
+            [(e, d['builder']) for e, d in parseEvents(everything.written)
+             if e != 'builderState'],
+            [('buildStarted', 'linux'), ('buildFinished', 'linux'),
+             ('buildStarted', 'win'), ('buildFinished', 'win')])
+        self.assertEqual(
+            [(e, d['builder']) for e, d in parseEvents(byTag.written)
+             if e != 'builderState'],
+            [('buildStarted', 'linux'), ('buildFinished', 'linux')])
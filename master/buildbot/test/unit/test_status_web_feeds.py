@@ -0,0 +1,168 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+import time
+import types
+
+from buildbot.status.results import FAILURE
+from buildbot.status.results import SUCCESS
+from buildbot.status.web import feeds
+from buildbot.test.fake.web import FakeRequest
+from buildbot.test.unit import test_status_master
+from twisted.internet import task
+from twisted.trial import unittest
+from twisted.web import http
+
+
+class FeedResource(unittest.TestCase):
+
+    def setUp(self):
+        self.builds = []
+        self.status = mock.Mock()
+        self.status.getTitle.return_value = 'Project'
+        self.status.getBuildbotURL.return_value = 'http://bb/'
+        self.status.getURLForThing.return_value = 'http://bb/builders/a/'
+        self.status.getBuilderNames.return_value = ['a']
+        self.status.getBuilder.return_value.getName.return_value = 'a'
+        self.status.generateFinishedBuilds = \
+            lambda **kw: list(reversed(self.builds))
+        self.resource = feeds.Rss20StatusResource(self.status)
+        self.resource.pubdate = time.gmtime(0)
+        self.cache = None
+        self.clock = task.Clock()
+
+    def addBuild(self, result=SUCCESS, finished=1000000000):
+        build = mock.Mock()
+        build.getBuilder.return_value.getName.return_value = 'a'
+        build.getNumber.return_value = len(self.builds)
+        build.getTimes.return_value = (finished - 10, finished)
+        build.getResults.return_value = result
+        build.getSourceStamps.return_value = []
+        build.getAllGotRevisions.return_value = {}
+        build.getResponsibleUsers.return_value = []
+        build.getSteps.return_value = []
+        self.builds.append(build)
+        return build
+
+    def request(self, headers={}, **args):
+        req = FakeRequest(args=dict((k, [v]) for k, v in args.items()))
+        if self.cache is None:
+            self.cache = req.site.buildbot_service.feedCache
+            self.cache._reactor = self.clock
+        req.site.buildbot_service.feedCache = self.cache
+        req.received_headers = headers
+        req.headers = {}
+        req.setHeader = req.headers.__setitem__
+        req.etag = req.lastModified = None
+        for name in 'setETag', 'setLastModified':
+            setattr(req, name, types.MethodType(
+                getattr(http.Request, name).im_func, req))
+        req.test_render(self.resource)
+        return req
+
+    def test_cached(self):
+        build = self.addBuild()
+        first = self.request()
+        self.assertIn('<rss', first.written)
+        self.assertEqual(build.getSourceStamps.call_count, 1)
+        second = self.request()
+        self.assertEqual(second.written, first.written)
+        self.assertEqual(build.getSourceStamps.call_count, 1)
+        self.assertEqual(first.lastModified, 1000000000)
+
+    def test_conditional_get(self):
+        self.addBuild()
+        etag = self.request().etag
+        req = self.request(headers={'if-none-match': etag})
+        req.setResponseCode.assert_called_with(http.NOT_MODIFIED)
+        self.assertEqual(req.written, '')
+        req = self.request(headers={
+            'if-modified-since': http.datetimeToString(1000000000)})
+        req.setResponseCode.assert_called_with(http.NOT_MODIFIED)
+        self.assertEqual(req.written, '')
+        # a stale entity tag wins over a recent date
+        req = self.request(headers={
+            'if-none-match': '"stale"',
+            'if-modified-since': http.datetimeToString(1000000000)})
+        self.assertIn('<rss', req.written)
+
+    def test_invalidated_by_finished_build(self):
+        first = self.addBuild()
+        etag = self.request().etag
+        self.addBuild(finished=1000000100)
+        self.cache.buildFinished('a', self.builds[-1], SUCCESS)
+        req = self.request(headers={'if-none-match': etag})
+        self.assertNotEqual(req.etag, etag)
+        self.assertEqual(req.written.count('<item>'), 2)
+        # the first build's entry was not rendered again
+        self.assertEqual(first.getSourceStamps.call_count, 1)
+
+    def test_failures_only(self):
+        self.addBuild(result=FAILURE)
+        data = self.request(failures_only='true').written
+        self.addBuild(finished=1000000100)
+        self.cache.buildFinished('a', self.builds[-1], SUCCESS)
+        self.assertEqual(self.request(failures_only='true').written, data)
+        self.cache.buildFinished('a', self.builds[-1], FAILURE)
+        self.assertNotEqual(self.request(failures_only='true').written, data)
+
+    def test_expires(self):
+        self.addBuild()
+        data = self.request().written
+        # a build whose notification was missed
+        self.addBuild(finished=1000000100)
+        self.assertEqual(self.request().written, data)
+        self.clock.advance(feeds.FeedCache.documentMaxAge + 1)
+        self.assertEqual(self.request().written.count('<item>'), 2)
+
+    def test_bounded(self):
+        self.patch(feeds.FeedCache, 'documentCacheSize', 2)
+        self.patch(feeds.FeedCache, 'entryCacheSize', 1)
+        self.addBuild()
+        self.addBuild()
+        for project in 'xyz':
+            self.request(project=project)
+        self.assertEqual(len(self.cache.documents), 2)
+        self.assertEqual(self.cache.entries.keys(), [('a', 0)])
+
+
+class FeedResourceWithStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.status = test_status_master.makeStatusWithBuilders(self, ['a'])
+        self.status.master.config.title = 'Project'
+        self.status.master.config.buildbotURL = 'http://bb/'
+        self.resource = feeds.Atom10StatusResource(self.status)
+        self.cache = None
+
+    def request(self):
+        req = FakeRequest()
+        if self.cache is None:
+            self.cache = req.site.buildbot_service.feedCache
+        req.site.buildbot_service.feedCache = self.cache
+        req.test_render(self.resource)
+        return req.written
+
+    def test_new_builds_shown(self):
+        builder = self.status.getBuilder('a')
+        test_status_master.finishBuild(
+            test_status_master.startBuild(builder), SUCCESS)
+        self.assertEqual(self.request().count('<entry>'), 1)
+        self.assertEqual(self.request().count('<entry>'), 1)
+
+        test_status_master.finishBuild(
+            test_status_master.startBuild(builder), FAILURE)
+        self.assertEqual(self.request().count('<entry>'), 2)
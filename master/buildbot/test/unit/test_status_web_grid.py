@@ -0,0 +1,92 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+
+from buildbot.status import history
+from buildbot.status.results import FAILURE
+from buildbot.status.web import grid
+from buildbot.test.fake.web import FakeRequest
+from buildbot.test.unit.test_status_history import FakeBuilder
+from twisted.trial import unittest
+
+
+class FakeGridBuilder(FakeBuilder):
+
+    def __init__(self, name, tags=()):
+        FakeBuilder.__init__(self, name)
+        self.tags = tags
+
+    def matchesAnyTag(self, tags):
+        return bool(set(self.tags) & set(tags))
+
+
+class TestGetGrid(unittest.TestCase):
+
+    def setUp(self):
+        self.builders = {
+            'a': FakeGridBuilder('a', tags=['x']),
+            'b': FakeGridBuilder('b'),
+        }
+        self.status = mock.Mock()
+        self.status.getBuilderNames.return_value = ['b', 'a']
+        self.status.getBuilder = self.builders.get
+        self.status.gridMatrix = history.GridMatrix()
+        self.mixin = grid.GridStatusMixin()
+        self.request = FakeRequest()
+
+    def run_build(self, builder, start, revision, result=0):
+        build = self.builders[builder].addBuild(start, None,
+                                                revision=revision)
+        self.status.gridMatrix.buildStarted(builder, build)
+        build.times = (start, start + 5)
+        build.result = result
+        self.status.gridMatrix.buildFinished(builder, build)
+
+    def test_from_matrix(self):
+        self.run_build('a', 10, 'r1')
+        self.run_build('b', 20, 'r2', result=FAILURE)
+        self.mixin.getRecentBuilds = mock.Mock()
+
+        stamps, builders, cells = self.mixin.getGrid(
+            self.request, self.status, 2, [], grid.ANYBRANCH)
+        self.assertEqual([ss[0]['revision'] for ss in stamps], ['r1', 'r2'])
+        self.assertEqual([b.getName() for b in builders], ['a', 'b'])
+        self.assertEqual(cells[0][0], {'name': 'a',
+                                       'url': './builders/a/builds/0',
+                                       'text': ['OK'], 'class': 'success'})
+        self.assertEqual(cells[0][1], {})
+        self.assertEqual(cells[1][1]['class'], 'failure')
+        # no build was loaded
+        self.assertFalse(self.mixin.getRecentBuilds.called)
+        self.assertEqual(self.builders['a'].loaded, [])
+
+    def test_tags(self):
+        self.run_build('a', 10, 'r1')
+        self.run_build('b', 20, 'r2')
+        stamps, builders, cells = self.mixin.getGrid(
+            self.request, self.status, 1, ['x'], grid.ANYBRANCH)
+        self.assertEqual([ss[0]['revision'] for ss in stamps], ['r1'])
+        self.assertEqual([b.getName() for b in builders], ['a'])
+
+    def test_not_enough_rows(self):
+        self.run_build('a', 10, 'r1')
+        self.mixin.getRecentSourcestamps = mock.Mock(return_value=[])
+        self.mixin.getRecentBuilds = mock.Mock(return_value=[])
+        stamps, builders, cells = self.mixin.getGrid(
+            self.request, self.status, 2, [], grid.ANYBRANCH)
+        self.mixin.getRecentSourcestamps.assert_called_with(
+            self.status, 2, [], grid.ANYBRANCH)
+        self.assertEqual(stamps, [])
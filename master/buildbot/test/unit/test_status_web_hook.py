@@ -18,6 +18,7 @@ from buildbot.test.fake.web import FakeRequest
 from buildbot.test.util import compat
 from buildbot.util import json
 
+from twisted.internet import defer
 from twisted.trial import unittest
 
 
@@ -181,3 +182,92 @@ class TestChangeHookConfiguredBogus(unittest.TestCase):
             self.assertEqual(len(self.flushLoggedErrors()), 1)
         d.addCallback(check)
         return d
+
+
+class TestChangeHookQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.changeHook = change_hook.ChangeHookResource(dialects={'base': True})
+        self.added = []
+        self.addDeferreds = []
+
+    def makeRequest(self, revision, deliveryId=None):
+        request = FakeRequest(args={'revision': [revision],
+                                    'repository': ['repo']})
+        request.uri = "/change_hook/"
+        request.method = "POST"
+        if deliveryId:
+            request.received_headers['X-GitHub-Delivery'] = deliveryId
+
+        def addChange(**kwargs):
+            self.added.append(kwargs['revision'])
+            d = defer.Deferred()
+            self.addDeferreds.append(d)
+            return d
+        request.site.buildbot_service.master.addChange = addChange
+        return request
+
+    @defer.inlineCallbacks
+    def test_responds_before_adding(self):
+        request = self.makeRequest('1')
+        yield request.test_render(self.changeHook)
+        request.setResponseCode.assert_called_with(202)
+        self.assertEqual(self.added, ['1'])
+
+        # changes arriving meanwhile wait for the first to be added
+        yield self.makeRequest('2').test_render(self.changeHook)
+        yield self.makeRequest('3').test_render(self.changeHook)
+        self.assertEqual(self.added, ['1'])
+        self.addDeferreds.pop(0).callback(None)
+        self.assertEqual(self.added, ['1', '2'])
+        self.addDeferreds.pop(0).callback(None)
+        self.addDeferreds.pop(0).callback(None)
+        self.assertEqual(self.added, ['1', '2', '3'])
+        self.assertFalse(self.changeHook.queue.draining)
+
+    @defer.inlineCallbacks
+    def test_duplicate_delivery(self):
+        yield self.makeRequest('1', deliveryId='abc').test_render(self.changeHook)
+        request = self.makeRequest('2', deliveryId='abc')
+        yield request.test_render(self.changeHook)
+        self.assertEqual(request.written, "duplicate delivery")
+        self.assertEqual(self.added, ['1'])
+
+    @defer.inlineCallbacks
+    def test_duplicate_revision(self):
+        yield self.makeRequest('1').test_render(self.changeHook)
+        self.addDeferreds[0].callback(None)
+        yield self.makeRequest('1').test_render(self.changeHook)
+        self.assertEqual(self.added, ['1'])
+
+        # until the window has passed
+        self.patch(change_hook.util, 'now', lambda: 10 ** 10)
+        yield self.makeRequest('1').test_render(self.changeHook)
+        self.assertEqual(self.added, ['1', '1'])
+
+    @compat.usesFlushLoggedErrors
+    @defer.inlineCallbacks
+    def test_failed_add_retried(self):
+        yield self.makeRequest('1', deliveryId='abc').test_render(
+            self.changeHook)
+        self.addDeferreds[0].errback(RuntimeError('db is down'))
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+
+        # the sender retries the same delivery
+        request = self.makeRequest('1', deliveryId='abc')
+        yield request.test_render(self.changeHook)
+        self.assertNotEqual(request.written, "duplicate delivery")
+        self.assertEqual(self.added, ['1', '1'])
+
+    @defer.inlineCallbacks
+    def test_dialect_module_cached(self):
+        calls = []
+        namedModule = change_hook.namedModule
+
+        def namedModuleMock(name):
+            calls.append(name)
+            return namedModule(name)
+        self.patch(change_hook, "namedModule", namedModuleMock)
+        yield self.makeRequest('1').test_render(self.changeHook)
+        yield self.makeRequest('2').test_render(self.changeHook)
+        self.assertEqual(calls, ['buildbot.status.web.hooks.base'])
@@ -0,0 +1,145 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+import os
+
+from buildbot import config
+from buildbot.status import logfile
+from buildbot.status.web import logs
+from buildbot.test.fake.web import FakeRequest
+from buildbot.test.util import dirs
+from twisted.internet import defer
+from twisted.trial import unittest
+
+
+class TestTailLog(unittest.TestCase, dirs.DirsMixin):
+
+    def setUp(self):
+        step = mock.Mock(name='build_step_status')
+        self.basedir = step.build.builder.basedir = os.path.abspath('basedir')
+        self.setUpDirs(self.basedir)
+        self.log = logfile.LogFile(step, 'stdio', '123-stdio')
+        self.log.master = mock.Mock()
+        self.log.master.config = config.MasterConfig()
+        self.tailers = None
+
+    def tearDown(self):
+        if self.log.openfile:
+            self.log.openfile.close()
+        self.tearDownDirs()
+
+    def addLines(self, first, last):
+        for i in range(first, last):
+            self.log.addStdout('line %d\n' % i)
+
+    def tail(self, **args):
+        req = FakeRequest(args=dict((k, [str(v)]) for k, v in args.items()))
+        if self.tailers is None:
+            self.tailers = req.site.buildbot_service.logTailers
+        else:
+            req.site.buildbot_service.logTailers = self.tailers
+        req.headers = {}
+        req.setHeader = req.headers.__setitem__
+        req.finished_d = defer.Deferred()
+        req.notifyFinish = lambda: req.finished_d
+        req.test_render(logs.TailLog(self.log))
+        return req
+
+    def test_last_lines_then_follow(self):
+        self.log.addHeader('command\n')
+        self.addLines(0, 10)
+        req = self.tail(lines=2)
+        self.assertEqual(req.written, 'line 8\nline 9\n')
+        self.assertEqual(req.headers['x-buildbot-log-offset'],
+                         str(len('line 0\n') * 8))
+
+        self.log.addStderr('oops\n')
+        self.log.addHeader('not shown\n')
+        self.assertEqual(req.written, 'line 8\nline 9\noops\n')
+
+        self.log.finish()
+        self.assertTrue(req.finished)
+        self.assertEqual(self.tailers.keys(), [])
+
+    def test_offset(self):
+        self.addLines(0, 3)
+        req = self.tail(offset=len('line 0\n') + 5)
+        self.assertEqual(req.written, '1\nline 2\n')
+
+    def test_outside_the_tail(self):
+        self.patch(logs.LogTailer, 'tailSize', 20)
+        self.addLines(0, 10)
+        req = self.tail(offset=3)
+        self.assertEqual(req.written,
+                         ''.join('line %d\n' % i for i in range(10))[3:])
+        req = self.tail(lines=5)
+        self.assertEqual(req.written,
+                         ''.join('line %d\n' % i for i in range(5, 10)))
+
+    def test_one_watcher_for_all_viewers(self):
+        self.addLines(0, 1)
+        first = self.tail()
+        second = self.tail()
+        self.assertEqual(len(self.log.watchers), 1)
+        self.addLines(1, 2)
+        self.assertEqual(first.written, 'line 0\nline 1\n')
+        self.assertEqual(second.written, 'line 0\nline 1\n')
+
+        first.finished_d.callback(None)
+        self.assertEqual(len(self.log.watchers), 1)
+        second.finished_d.errback(Exception('connection lost'))
+        self.assertEqual(self.log.watchers, [])
+        self.assertEqual(self.tailers.keys(), [])
+
+    def test_slow_viewer(self):
+        self.patch(logs.LogTailViewer, 'maxBuffered', 20)
+        req = self.tail()
+        viewer = req.registerProducer.call_args[0][0]
+        viewer.pauseProducing()
+        self.addLines(0, 5)
+        self.log.finish()
+        self.assertEqual(req.written, '')
+        self.assertFalse(req.finished)
+
+        viewer.resumeProducing()
+        self.assertEqual(req.written, '\n[... 21 bytes skipped ...]\n'
+                         'line 3\nline 4\n')
+        self.assertTrue(req.finished)
+
+    def test_finished_log(self):
+        self.addLines(0, 3)
+        self.log.finish()
+        req = self.tail(lines=1)
+        self.assertEqual(req.written, 'line 2\n')
+        self.assertTrue(req.finished)
+        self.assertEqual(self.tailers.keys(), [])
+
+    def test_finished_log_not_buffered(self):
+        self.addLines(0, 10)
+        self.log.finish()
+        self.patch(logs, 'LogTailer', None)
+        req = self.tail(lines=2)
+        self.assertEqual(req.written, 'line 8\nline 9\n')
+        self.assertEqual(req.headers['x-buildbot-log-offset'],
+                         str(len('line 0\n') * 8))
+        req = self.tail(lines=0)
+        self.assertEqual(req.written, '')
+        self.assertEqual(req.headers['x-buildbot-log-offset'],
+                         str(len('line 0\n') * 10))
+
+    def test_bad_args(self):
+        req = self.tail(lines='many')
+        req.setResponseCode.assert_called_with(400)
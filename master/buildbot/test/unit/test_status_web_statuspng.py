@@ -14,14 +14,18 @@
 # Copyright Buildbot Team Members
 # Copyright 2013 (c) - Manba Team
 
+import mock
 import os
+import types
 
 from twisted.internet.defer import inlineCallbacks
 from twisted.trial import unittest
+from twisted.web import http
 
 from buildbot.status import results
 from buildbot.status.web import pngstatus
 from buildbot.test.fake.web import FakeRequest
+from buildbot.test.unit import test_status_master
 
 sizes = ['small', 'normal', 'large']
 png_files = dict(
@@ -79,6 +83,44 @@ class TestPngStatusResource(unittest.TestCase):
 
         self.assertPngFile(self.request.written, exp)
 
+    def test_with_status(self):
+        status = test_status_master.makeStatusWithBuilders(
+            self, ['TestBuilder'])
+        builder = status.getBuilder('TestBuilder')
+        rsrc = pngstatus.PngStatusResource(status)
+
+        def badge(headers={}):
+            request = FakeRequest(self.request_data)
+            request.received_headers = headers
+            request.etag = None
+            request.setETag = types.MethodType(http.Request.setETag.im_func,
+                                               request)
+            request.test_render(rsrc)
+            return request
+
+        request = badge()
+        self.assertPngFile(request.written, 'unknown_normal')
+        build = test_status_master.startBuild(builder)
+        test_status_master.finishBuild(build, results.SUCCESS)
+        request = badge()
+        self.assertPngFile(request.written, 'success_normal')
+
+        # the results are kept until a build starts or finishes
+        patched = self.patch(builder, 'getBuild',
+                             mock.Mock(side_effect=AssertionError))
+        request = badge(headers={'if-none-match': request.etag})
+        request.setResponseCode.assert_called_with(http.NOT_MODIFIED)
+        self.assertEqual(request.written, '')
+        patched.restore()
+
+        build = test_status_master.startBuild(builder)
+        self.assertPngFile(badge().written, 'unknown_normal')
+        test_status_master.finishBuild(build, results.FAILURE)
+        self.assertPngFile(badge().written, 'failure_normal')
+
+        rsrc.stop()
+        self.assertNotIn(rsrc, status.watchers)
+
 # add methods to the class for each combination
 for size in None, 'small', 'normal', 'large':
     for status_code in range(len(results.Results)):
@@ -101,6 +143,9 @@ class FakeStatus(object):
     def getBuilder(self, ignore):
         return FakeBuilder(self._status_code)
 
+    def subscribe(self, receiver):
+        pass
+
 
 class FakeBuilder(object):
 
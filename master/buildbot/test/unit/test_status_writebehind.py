@@ -0,0 +1,161 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import cPickle
+import os
+
+from buildbot.status import writebehind
+from buildbot.test.util import compat
+from twisted.internet import defer
+from twisted.trial import unittest
+
+
+class Thing:
+
+    def __init__(self, items):
+        self.items = items
+        self.transient = 'not saved'
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        del d['transient']
+        return d
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def test_pickles_like_the_object(self):
+        thing = Thing([1, 2])
+        fromSnapshot = cPickle.loads(
+            cPickle.dumps(writebehind.snapshot(thing), -1))
+        fromThing = cPickle.loads(cPickle.dumps(thing, -1))
+        self.assertIdentical(fromSnapshot.__class__, Thing)
+        self.assertEqual(fromSnapshot.__dict__, fromThing.__dict__)
+
+    def test_unaffected_by_later_changes(self):
+        thing = Thing([1, 2])
+        snap = writebehind.snapshot(thing)
+        thing.items.append(3)
+        thing.other = 'new'
+        loaded = cPickle.loads(cPickle.dumps(snap, -1))
+        self.assertIsInstance(loaded, Thing)
+        self.assertEqual(loaded.__dict__, {'items': [1, 2]})
+
+
+class TestSaveQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = writebehind.SaveQueue()
+        self.basedir = os.path.abspath(self.mktemp())
+        os.makedirs(self.basedir)
+
+        # run the "thread" only when the test says so
+        self.threads = []
+
+        def deferToThread(fn, *args, **kwargs):
+            d = defer.Deferred()
+            self.threads.append((d, fn, args, kwargs))
+            return d
+        self.patch(writebehind.threads, 'deferToThread', deferToThread)
+
+    def runThread(self):
+        d, fn, args, kwargs = self.threads.pop(0)
+        d.callback(fn(*args, **kwargs))
+
+    def filename(self, name):
+        return os.path.join(self.basedir, name)
+
+    def loadFrom(self, name):
+        with open(self.filename(name), 'rb') as f:
+            return cPickle.load(f)
+
+    def test_synchronous_when_stopped(self):
+        self.queue.save(Thing([1]), self.filename('a'))
+        self.assertEqual(self.threads, [])
+        self.assertEqual(self.loadFrom('a').items, [1])
+
+    def test_write_behind(self):
+        self.queue.start()
+        thing = Thing([1])
+        self.queue.save(thing, self.filename('a'))
+        thing.items.append(2)
+        self.assertFalse(os.path.exists(self.filename('a')))
+        self.assertIdentical(self.queue.getPending(self.filename('a')), thing)
+
+        self.runThread()
+        self.assertEqual(self.loadFrom('a').items, [1])
+        self.assertEqual(self.queue.getPending(self.filename('a')), None)
+        self.assertEqual(self.queue.depth, 0)
+
+    def test_coalesce(self):
+        self.queue.start()
+        a, b = Thing(['a']), Thing(['b'])
+        self.queue.save(a, self.filename('a'))
+        self.queue.save(b, self.filename('b'))
+        a.items.append('again')
+        self.queue.save(a, self.filename('a'))
+        # b is queued behind the first save of a, which is in progress
+        self.assertEqual(self.queue.depth, 2)
+        self.assertIdentical(self.queue.getPending(self.filename('a')), a)
+
+        self.runThread()
+        self.runThread()
+        self.runThread()
+        self.assertEqual(self.threads, [])
+        self.assertEqual(self.loadFrom('a').items, ['a', 'again'])
+        self.assertEqual(self.loadFrom('b').items, ['b'])
+
+    def test_coalesce_pending(self):
+        self.queue.start()
+        self.queue.save(Thing([0]), self.filename('first'))
+        thing = Thing([1])
+        self.queue.save(thing, self.filename('a'))
+        thing.items.append(2)
+        self.queue.save(thing, self.filename('a'))
+        self.assertEqual(self.queue.depth, 1)
+        self.runThread()
+        self.runThread()
+        self.assertEqual(self.threads, [])
+        self.assertEqual(self.loadFrom('a').items, [1, 2])
+
+    def test_stop_waits(self):
+        self.queue.start()
+        self.queue.save(Thing([1]), self.filename('a'))
+        d = self.queue.stop()
+        self.assertNoResult(d)
+
+        # saved while stopping: queued behind the rest, not written now
+        self.queue.save(Thing([2]), self.filename('a'))
+        self.assertFalse(os.path.exists(self.filename('a')))
+
+        self.runThread()
+        self.assertNoResult(d)
+        self.runThread()
+        self.successResultOf(d)
+        self.assertEqual(self.loadFrom('a').items, [2])
+
+        # and once everything is written, saves are synchronous
+        self.queue.save(Thing([3]), self.filename('a'))
+        self.assertEqual(self.loadFrom('a').items, [3])
+
+    @compat.usesFlushLoggedErrors
+    def test_failure_logged(self):
+        self.queue.start()
+        self.queue.save(Thing([1]), self.filename('nosuchdir/a'))
+        self.queue.save(Thing([2]), self.filename('b'))
+        self.runThread()
+        self.runThread()
+        self.assertEqual(len(self.flushLoggedErrors(IOError)), 1)
+        self.assertEqual(self.loadFrom('b').items, [2])
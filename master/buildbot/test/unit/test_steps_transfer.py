@@ -559,7 +559,7 @@ class TestStringDownload(unittest.TestCase):
         s = transfer.StringDownload("Hello World", "hello.txt")
         s.build = Mock()
         s.build.getProperties.return_value = Properties()
-        s.build.getSlaveCommandVersion.return_value = 1
+        s.build.getSlaveCommandVersion.return_value = '2.16'
 
         s._step_status = Mock()
         s.buildslave = Mock()
@@ -580,6 +580,43 @@ class TestStringDownload(unittest.TestCase):
         else:
             self.assert_(False, "No downloadFile command found")
 
+    def getDownloadArgs(self, slave_version, **kwargs):
+        s = transfer.StringDownload("Hello World", "hello.txt", **kwargs)
+        s.build = Mock()
+        s.build.getProperties.return_value = Properties()
+        s.build.getSlaveCommandVersion.return_value = slave_version
+
+        s._step_status = Mock()
+        s.buildslave = Mock()
+        s.remote = Mock()
+
+        s.start()
+
+        for c in s.remote.method_calls:
+            name, command, args = c
+            if command[3] == 'downloadFile':
+                return command[-1]
+        self.fail("No downloadFile command found")
+
+    def testWindow(self):
+        kwargs = self.getDownloadArgs('2.17')
+        self.assertEqual(kwargs['window'], 8)
+        self.assertEqual(kwargs['maxblocksize'], 256 * 1024)
+
+    def testWindowOldSlave(self):
+        kwargs = self.getDownloadArgs('2.16')
+        self.assertNotIn('window', kwargs)
+        self.assertNotIn('maxblocksize', kwargs)
+
+    def testWindowDisabled(self):
+        kwargs = self.getDownloadArgs('2.17', window=1)
+        self.assertNotIn('window', kwargs)
+
+    def testWindowMaxBlocksizeNotBelowBlocksize(self):
+        kwargs = self.getDownloadArgs('2.17', blocksize=64 * 1024,
+                                      maxblocksize=1024)
+        self.assertEqual(kwargs['maxblocksize'], 64 * 1024)
+
 
 class TestJSONStringDownload(unittest.TestCase):
 
@@ -588,7 +625,7 @@ class TestJSONStringDownload(unittest.TestCase):
         s = transfer.JSONStringDownload(msg, "hello.json")
         s.build = Mock()
         s.build.getProperties.return_value = Properties()
-        s.build.getSlaveCommandVersion.return_value = 1
+        s.build.getSlaveCommandVersion.return_value = '2.16'
 
         s._step_status = Mock()
         s.buildslave = Mock()
@@ -618,7 +655,7 @@ class TestJSONPropertiesDownload(unittest.TestCase):
         props = Properties()
         props.setProperty('key1', 'value1', 'test')
         s.build.getProperties.return_value = props
-        s.build.getSlaveCommandVersion.return_value = 1
+        s.build.getSlaveCommandVersion.return_value = '2.16'
         ss = Mock()
         ss.asDict.return_value = dict(revision="12345")
         s.build.getSourceStamp.return_value = ss
@@ -68,3 +68,46 @@ class KeyedSets(unittest.TestCase):
 
     def test_pop_missing(self):
         self.assertEqual(self.ks.pop('flavors'), set())
+
+
+class OrderedDict(unittest.TestCase):
+
+    # the fallback used on Pythons without collections.OrderedDict
+
+    def setUp(self):
+        self.od = bbcollections._OrderedDict()
+        for key in 'cab':
+            self.od[key] = key.upper()
+
+    def test_order(self):
+        self.assertEqual(self.od.keys(), ['c', 'a', 'b'])
+        self.assertEqual(self.od.values(), ['C', 'A', 'B'])
+        self.assertEqual(list(self.od.iteritems()),
+                         [('c', 'C'), ('a', 'A'), ('b', 'B')])
+
+    def test_setitem_existing_keeps_position(self):
+        self.od['c'] = 'x'
+        self.assertEqual(self.od.items(),
+                         [('c', 'x'), ('a', 'A'), ('b', 'B')])
+
+    def test_pop_and_reinsert(self):
+        self.assertEqual(self.od.pop('c'), 'C')
+        self.assertEqual(self.od.pop('c', None), None)
+        self.assertRaises(KeyError, self.od.pop, 'c')
+        self.od['c'] = 'C'
+        self.assertEqual(self.od.keys(), ['a', 'b', 'c'])
+
+    def test_popitem(self):
+        self.assertEqual(self.od.popitem(last=False), ('c', 'C'))
+        self.assertEqual(self.od.popitem(), ('b', 'B'))
+        self.assertEqual(self.od.items(), [('a', 'A')])
+        del self.od['a']
+        self.assertRaises(KeyError, self.od.popitem)
+
+    def test_update_and_clear(self):
+        self.od.update([('d', 'D'), ('a', 'x')])
+        self.assertEqual(self.od.keys(), ['c', 'a', 'b', 'd'])
+        self.od.clear()
+        self.assertEqual(len(self.od), 0)
+        self.od['e'] = 'E'
+        self.assertEqual(self.od.items(), [('e', 'E')])
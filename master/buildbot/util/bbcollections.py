@@ -18,6 +18,115 @@ from collections import defaultdict
 assert defaultdict
 
 
+class _OrderedDict(dict):
+
+    """A dict that remembers the order its keys were first inserted in, for
+    Pythons older than 2.7.  Only the parts of C{collections.OrderedDict}
+    that buildbot uses are provided."""
+
+    def __init__(self):
+        dict.__init__(self)
+        # key -> [prev, next, key] in a circular list around self._root
+        self._root = root = []
+        root[:] = [root, root, None]
+        self._links = {}
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            root = self._root
+            last = root[0]
+            last[1] = root[0] = self._links[key] = [last, root, key]
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        prev, nxt, _ = self._links.pop(key)
+        prev[1] = nxt
+        nxt[0] = prev
+
+    def __iter__(self):
+        root = self._root
+        link = root[1]
+        while link is not root:
+            yield link[2]
+            link = link[1]
+
+    def __reversed__(self):
+        root = self._root
+        link = root[0]
+        while link is not root:
+            yield link[2]
+            link = link[0]
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        for key in self:
+            yield self[key]
+
+    def iteritems(self):
+        for key in self:
+            yield (key, self[key])
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    _marker = object()
+
+    def pop(self, key, default=_marker):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if default is self._marker:
+            raise KeyError(key)
+        return default
+
+    def popitem(self, last=True):
+        if not self:
+            raise KeyError('dictionary is empty')
+        if last:
+            key = reversed(self).next()
+        else:
+            key = iter(self).next()
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, other=(), **kwargs):
+        if hasattr(other, 'keys'):
+            other = [(key, other[key]) for key in other.keys()]
+        for key, value in other:
+            self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def clear(self):
+        dict.clear(self)
+        self._links.clear()
+        root = self._root
+        root[:] = [root, root, None]
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.items())
+
+
+try:
+    from collections import OrderedDict
+except ImportError:  # python 2.5 or 2.6
+    OrderedDict = _OrderedDict
+
+
 class KeyedSets:
 
     def __init__(self):
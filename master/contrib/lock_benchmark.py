@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""lock_benchmark.py [options]
+
+Push a number of builds through a single shared lock, the way
+Build.acquireLocks does: each build checks isAvailable(), waits with
+waitUntilMaybeAvailable() if it has to, claims the lock and releases it
+again a moment later.  Every few builds want exclusive access, so the
+anti-starvation rules of the wait queue are exercised too.
+
+Reports the time taken and the number of isAvailable() calls."""
+
+import time
+
+from twisted.internet import defer
+from twisted.internet import reactor
+
+from buildbot import locks
+from buildbot.util.eventual import eventually
+
+
+class FakeBuild(object):
+
+    def __init__(self, number):
+        self.number = number
+
+    def __repr__(self):
+        return 'build %d' % self.number
+
+
+class CountingLock(locks.BaseLock):
+
+    checks = 0
+
+    def isAvailable(self, requester, access):
+        self.checks += 1
+        return locks.BaseLock.isAvailable(self, requester, access)
+
+
+@defer.inlineCallbacks
+def run_build(lock, build, access):
+    while not lock.isAvailable(build, access):
+        yield lock.waitUntilMaybeAvailable(build, access)
+    lock.claim(build, access)
+    d = defer.Deferred()
+    eventually(d.callback, None)
+    yield d
+    lock.release(build, access)
+
+
+@defer.inlineCallbacks
+def main(options):
+    lockid = locks.SlaveLock('bench', maxCount=options.maxcount)
+    counting = locks.LockAccess(lockid, 'counting')
+    exclusive = locks.LockAccess(lockid, 'exclusive')
+    try:
+        lock = CountingLock('bench', maxCount=options.maxcount)
+        started = time.time()
+        builds = []
+        for n in xrange(options.builds):
+            access = counting
+            if options.exclusive and n % options.exclusive == 0:
+                access = exclusive
+            builds.append(run_build(lock, FakeBuild(n), access))
+        queued = len(lock.waiting)
+        yield defer.gatherResults(builds)
+        elapsed = time.time() - started
+        print "%d builds (%d queued at once), maxCount=%d: %.2fs, " \
+              "%d isAvailable() calls" % (options.builds, queued,
+                                           options.maxcount, elapsed,
+                                           lock.checks)
+    finally:
+        reactor.stop()
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser(__doc__)
+    parser.add_option("--builds", type="int", default=5000,
+                      help="number of builds (default: 5000)")
+    parser.add_option("--maxcount", type="int", default=4,
+                      help="maxCount of the lock (default: 4)")
+    parser.add_option("--exclusive", type="int", default=10, metavar="N",
+                      help="every Nth build wants exclusive access; "
+                           "0 for none (default: 10)")
+    options, args = parser.parse_args()
+
+    reactor.callWhenRunning(main, options)
+    reactor.run()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""scheduling_benchmark.py [options] [requests.csv]
+
+Replay a log of build requests against a pool of shared slaves and compare
+builder prioritization policies: the default oldest-request-first order and
+buildrequestdistributor.ShortestJobFirst with one or more aging factors.
+
+The request log is a CSV file with one request per line:
+
+    submitted_at,buildername,duration
+
+where submitted_at is seconds since the epoch and duration is how long the
+build took, in seconds.  Such a log can be extracted from a master database
+with --db, or a synthetic one generated with --generate.  Requests are not
+merged, and every slave can run every builder."""
+
+import csv
+import heapq
+import random
+
+from buildbot.process.buildrequestdistributor import ShortestJobFirst
+
+
+def load_csv(filename):
+    requests = []
+    with open(filename) as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#'):
+                continue
+            requests.append((float(row[0]), row[1], float(row[2])))
+    requests.sort()
+    return requests
+
+
+def load_db(url):
+    import sqlalchemy as sa
+    engine = sa.create_engine(url)
+    rows = engine.execute(sa.text(
+        "SELECT br.submitted_at, br.buildername, "
+        "       b.finish_time - b.start_time "
+        "FROM buildrequests br JOIN builds b ON b.brid = br.id "
+        "WHERE b.finish_time IS NOT NULL "
+        "ORDER BY br.submitted_at"))
+    return [(float(t), str(n), float(d)) for t, n, d in rows]
+
+
+def generate(count, seed):
+    # a mix of quick sanity builders and long full builds, as on a CI farm
+    # where every push triggers all of them
+    rnd = random.Random(seed)
+    builders = [('sanity', 300), ('docs', 600), ('linux', 3600),
+                ('windows', 5400), ('full', 7200)]
+    requests = []
+    t = 0
+    while len(requests) < count:
+        t += rnd.expovariate(1 / 3600.0)
+        for name, mean in builders:
+            if len(requests) < count:
+                requests.append((t, name, rnd.gauss(mean, mean / 10.0)))
+    return requests
+
+
+class FifoPolicy(object):
+
+    name = 'oldest-first'
+
+    def sortBuilders(self, builders, submitted, durations, now):
+        # the same order as BuildRequestDistributor._defaultSorter
+        items = sorted(zip(submitted, builders))
+        return [b for s, b in items]
+
+
+def simulate(requests, slaves, policy, history):
+    """Run the requests on the given number of slaves; return the list of
+    (buildername, wait) for each request and the time the last finished."""
+    pending = {}            # buildername -> list of (submitted_at, duration)
+    running = []            # heap of (finish time, buildername, duration)
+    finished = {}           # buildername -> durations of finished builds
+    waits = []
+    now = 0
+    i = 0
+    while i < len(requests) or pending or running:
+        # advance to the next event
+        next_times = []
+        if i < len(requests):
+            next_times.append(requests[i][0])
+        if running:
+            next_times.append(running[0][0])
+        now = max(now, min(next_times))
+        while i < len(requests) and requests[i][0] <= now:
+            submitted_at, name, duration = requests[i]
+            pending.setdefault(name, []).append((submitted_at, duration))
+            i += 1
+        while running and running[0][0] <= now:
+            t, name, duration = heapq.heappop(running)
+            finished.setdefault(name, []).append(duration)
+            history[name] = percentile(finished[name], 50)
+
+        # like the distributor, start builds on each builder in priority
+        # order until it has no requests left or the slaves run out
+        if len(running) < slaves and pending:
+            builders = sorted(pending)
+            submitted = [pending[b][0][0] for b in builders]
+            durations = [history.get(b) for b in builders]
+            order = policy.sortBuilders(builders, submitted, durations, now)
+            for name in order:
+                while pending.get(name) and len(running) < slaves:
+                    submitted_at, duration = pending[name].pop(0)
+                    waits.append((name, now - submitted_at))
+                    heapq.heappush(running, (now + duration, name, duration))
+                if not pending.get(name):
+                    pending.pop(name, None)
+    return waits, now
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[min(int(len(values) * p / 100.0), len(values) - 1)]
+
+
+def report(policy, requests, waits, end):
+    allwaits = [w for n, w in waits]
+    span = end - requests[0][0]
+    # median duration per builder decides what counts as a short build
+    durations = {}
+    for t, n, d in requests:
+        durations.setdefault(n, []).append(d)
+    cutoff = percentile([percentile(d, 50) for d in durations.values()], 50)
+    short = [w for n, w in waits if percentile(durations[n], 50) <= cutoff]
+    print "%-22s %8.2f %9.0f %9.0f %9.0f %9.0f" % (
+        policy.name, len(requests) / (span / 3600.0),
+        percentile(allwaits, 50), percentile(short, 50),
+        percentile(allwaits, 90), max(allwaits))
+
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser(__doc__)
+    parser.add_option("--slaves", type="int", default=6,
+                      help="number of shared slaves (default: 6)")
+    parser.add_option("--aging", type="float", action="append",
+                      help="ShortestJobFirst aging factor to try; may be "
+                           "repeated (default: 0, 0.25 and 1)")
+    parser.add_option("--db", metavar="URL",
+                      help="read requests from this master database URL")
+    parser.add_option("--generate", type="int", metavar="N",
+                      help="replay N synthetic requests instead of a log")
+    parser.add_option("--seed", type="int", default=0,
+                      help="random seed for --generate (default: 0)")
+    options, args = parser.parse_args()
+
+    if options.generate:
+        requests = generate(options.generate, options.seed)
+    elif options.db:
+        requests = load_db(options.db)
+    elif len(args) == 1:
+        requests = load_csv(args[0])
+    else:
+        parser.error("give a request log, --db or --generate")
+    if not requests:
+        parser.error("no requests to replay")
+
+    policies = [FifoPolicy()]
+    for aging in options.aging or [0, 0.25, 1]:
+        p = ShortestJobFirst(aging=aging)
+        p.name = 'shortest-job aging=%g' % aging
+        policies.append(p)
+
+    print "%d requests, %d slaves; waits in seconds" % (len(requests),
+                                                        options.slaves)
+    print "%-22s %8s %9s %9s %9s %9s" % ('policy', 'builds/h', 'median',
+                                         'short-med', 'p90', 'max')
+    for policy in policies:
+        # durations are learned as builds finish, as the master would
+        waits, end = simulate(requests, options.slaves, policy, {})
+        report(policy, requests, waits, end)
+
+
+if __name__ == '__main__':
+    main()
@@ -43,7 +43,7 @@ commands_lock = DeferredSharedLock(8)
 # this used to be a CVS $-style "Revision" auto-updated keyword, but since I
 # moved to Darcs as the primary repository, this is updated manually each
 # time this file is changed. The last cvs_ver that was here was 1.51 .
-command_version = "2.16"
+command_version = "2.17"
 
 # version history:
 #  >=1.17: commands are interruptable
@@ -78,6 +78,8 @@ command_version = "2.16"
 #  >= 2.16: 'sigtermTime' option is added to SlaveShellCommand
 #  >= 2.16: runprocess supports obfuscation via tuples (#1748)
 #  >= 2.16: listdir command added to read a directory
+#  >= 2.17: SlaveFileDownloadCommand accepts 'window' and 'maxblocksize' to
+#           keep several reads outstanding with growing block sizes
 
 
 class Command:
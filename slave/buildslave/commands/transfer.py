@@ -17,6 +17,8 @@ import os
 import tarfile
 import tempfile
 
+from collections import deque
+
 from twisted.internet import defer
 from twisted.python import log
 
@@ -257,6 +259,9 @@ class SlaveFileDownloadCommand(TransferCommand):
         - ['maxsize']:   max size (in bytes) of file to write
         - ['blocksize']: max size for each data block
         - ['mode']:      access mode for the new file
+        - ['window']:    number of reads kept outstanding at once (default 1)
+        - ['maxblocksize']: upper bound for the block size, which is doubled
+                         after every full block when window > 1
     """
     debug = False
     requiredArgs = ['workdir', 'slavedest', 'reader', 'blocksize']
@@ -268,6 +273,9 @@ class SlaveFileDownloadCommand(TransferCommand):
         self.bytes_remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.mode = args['mode']
+        self.window = args.get('window', 1)
+        self.maxblocksize = max(args.get('maxblocksize', self.blocksize),
+                                self.blocksize)
         self.stderr = None
         self.rc = 0
 
@@ -306,7 +314,10 @@ class SlaveFileDownloadCommand(TransferCommand):
                 log.msg("Cannot open file '%s' for download" % self.path)
 
         d = defer.Deferred()
-        self._reactor.callLater(0, self._loop, d)
+        if self.window > 1:
+            self._reactor.callLater(0, self._startPipeline, d)
+        else:
+            self._reactor.callLater(0, self._loop, d)
 
         def _close(res):
             # close the file, but pass through any errors from _loop
@@ -368,6 +379,81 @@ class SlaveFileDownloadCommand(TransferCommand):
         self.fp.write(data)
         return False
 
+    def _startPipeline(self, fire_when_done):
+        # each pending entry is [requested length, data]; data stays None
+        # until the reply arrives, and blocks are written strictly in order
+        self.pending = deque()
+        self.eof = False
+        self.done = False
+        self.filling = False
+        self.fire_when_done = fire_when_done
+        self._fillWindow()
+
+    def _fillWindow(self):
+        """Issue reads until self.window of them are outstanding."""
+        if self.done or self.filling:
+            return
+        # replies from a local reader can fire synchronously, re-entering
+        # this method; the flag turns that recursion into loop iterations
+        self.filling = True
+        try:
+            while (len(self.pending) < self.window and not self.eof and
+                   not self.interrupted and self.fp is not None):
+                length = self.blocksize
+                if self.bytes_remaining is not None:
+                    length = min(length, self.bytes_remaining)
+                    if length <= 0:
+                        break
+                    self.bytes_remaining -= length
+                entry = [length, None]
+                self.pending.append(entry)
+                d = self.reader.callRemote('read', length)
+                d.addCallbacks(self._gotBlock, self._pipelineFailed,
+                               callbackArgs=(entry,))
+                if self.done:
+                    return
+        finally:
+            self.filling = False
+
+        if not self.pending:
+            self._pipelineFinished()
+
+    def _gotBlock(self, data, entry):
+        if self.done:
+            return
+        if self.debug:
+            log.msg('SlaveFileDownloadCommand._gotBlock(): readlen=%d' %
+                    len(data))
+        entry[1] = data
+        if len(data) < entry[0]:
+            # a short read means the reader hit EOF; anything still in
+            # flight will come back empty
+            self.eof = True
+        elif self.blocksize < self.maxblocksize:
+            self.blocksize = min(self.blocksize * 2, self.maxblocksize)
+
+        while self.pending and self.pending[0][1] is not None:
+            length, data = self.pending.popleft()
+            if data and self.fp is not None:
+                self.fp.write(data)
+        self._fillWindow()
+
+    def _pipelineFailed(self, why):
+        if self.done:
+            return
+        self.done = True
+        self.fire_when_done.errback(why)
+
+    def _pipelineFinished(self):
+        self.done = True
+        if (not self.eof and not self.interrupted and self.fp is not None
+                and self.bytes_remaining is not None
+                and self.bytes_remaining <= 0 and self.stderr is None):
+            self.stderr = "Maximum filesize reached, truncating file '%s'" \
+                % self.path
+            self.rc = 1
+        self.fire_when_done.callback(None)
+
     def finished(self, res):
         if self.fp is not None:
             self.fp.close()
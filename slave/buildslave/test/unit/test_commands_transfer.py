@@ -534,3 +534,170 @@ class TestDownloadFile(CommandTestMixin, unittest.TestCase):
             ])
         dl.addCallback(check)
         return dl
+
+
+class TestDownloadFileWindow(CommandTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.setUpCommand()
+
+        self.fakemaster = FakeMasterMethods(self.add_update)
+
+        if os.path.exists(self.basedir):
+            shutil.rmtree(self.basedir)
+        os.makedirs(self.basedir)
+
+    def tearDown(self):
+        self.tearDownCommand()
+
+        if os.path.exists(self.basedir):
+            shutil.rmtree(self.basedir)
+
+    def assertTransferUpdates(self, updates):
+        # ignore timing and the header-only updates about the commands lock
+        my_updates = [u for u in self.get_updates()
+                      if not (isinstance(u, dict) and
+                              u.keys() in (['header'], ['elapsed']))]
+        self.assertEqual(my_updates, updates)
+
+    def make_window_command(self, reader, **kwargs):
+        args = dict(
+            workdir='.',
+            slavedest='data',
+            reader=reader,
+            maxsize=None,
+            blocksize=8,
+            mode=None,
+            window=4,
+            maxblocksize=32,
+        )
+        args.update(kwargs)
+        return self.make_command(transfer.SlaveFileDownloadCommand, args)
+
+    def readData(self):
+        return open(os.path.join(self.basedir, 'data'), 'rb').read()
+
+    def test_simple(self):
+        self.fakemaster.count_reads = True
+        self.fakemaster.data = test_data = '1234' * 13
+
+        self.make_window_command(FakeRemote(self.fakemaster))
+        d = self.run_command()
+
+        def check(_):
+            # block size doubles after each full block, up to maxblocksize
+            self.assertTransferUpdates([
+                'read 8', 'read 16', 'read 32', 'close',
+                {'rc': 0}
+            ])
+            self.assertEqual(self.readData(), test_data)
+        d.addCallback(check)
+        return d
+
+    def test_outstanding_reads(self):
+        reader = DeferredReader('x' * 100)
+
+        self.make_window_command(reader, maxblocksize=8)
+        d = self.run_command()
+
+        def answer(_):
+            self.assertEqual(reader.outstanding, 4)
+            reader.hold = False
+            # answer in reverse order; the data must still land in order
+            for call in reversed(reader.calls):
+                call.callback(None)
+        reader.waitForCalls(4).addCallback(answer)
+
+        def check(_):
+            self.assertEqual(self.readData(), 'x' * 100)
+            self.assertEqual(reader.max_outstanding, 4)
+        d.addCallback(check)
+        return d
+
+    def test_truncated(self):
+        self.fakemaster.data = test_data = 'tenchars--' * 10
+
+        self.make_window_command(FakeRemote(self.fakemaster), maxsize=50)
+        d = self.run_command()
+
+        def check(_):
+            self.assertTransferUpdates([
+                'read(s)', 'close',
+                {'rc': 1,
+                 'stderr': "Maximum filesize reached, truncating file '%s'"
+                 % os.path.join(self.basedir, '.', 'data')}
+            ])
+            self.assertEqual(self.readData(), test_data[:50])
+        d.addCallback(check)
+        return d
+
+    def test_read_failure(self):
+        reader = DeferredReader('x' * 100)
+
+        self.make_window_command(reader)
+        d = self.run_command()
+
+        def fail_reads(_):
+            reader.hold = False
+            reader.calls[0].errback(RuntimeError("oh noes"))
+            for call in reader.calls[1:]:
+                call.callback(None)
+        reader.waitForCalls(4).addCallback(fail_reads)
+
+        def check(_):
+            self.fail("should have failed")
+
+        def eb(f):
+            f.trap(RuntimeError)
+            self.assertTrue(reader.closed)
+        d.addCallbacks(check, eb)
+        return d
+
+
+class DeferredReader(object):
+
+    """
+    A remote reader whose replies are held back until the test fires them.
+    Each entry of C{calls} is a Deferred that, when fired, delivers the data
+    for that read.  Once C{hold} is cleared, further reads reply at once.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.hold = True
+        self.calls = []
+        self.outstanding = 0
+        self.max_outstanding = 0
+        self.closed = False
+
+    def waitForCalls(self, count):
+        d = defer.Deferred()
+
+        def poll():
+            if len(self.calls) >= count:
+                d.callback(None)
+            else:
+                reactor.callLater(0, poll)
+        poll()
+        return d
+
+    def callRemote(self, meth, *args):
+        if meth == 'close':
+            self.closed = True
+            return defer.succeed(None)
+        assert meth == 'read'
+        length, = args
+        chunk, self.data = self.data[:length], self.data[length:]
+        self.outstanding += 1
+        self.max_outstanding = max(self.max_outstanding, self.outstanding)
+
+        def reply(_):
+            self.outstanding -= 1
+            return chunk
+        d = defer.Deferred()
+        d.addCallback(reply)
+        if self.hold:
+            self.calls.append(d)
+        else:
+            d.callback(None)
+        return d
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""download_benchmark.py [options]
+
+Measure the throughput of the slave's downloadFile command against a
+simulated master with a configurable round-trip time.  Each read request
+is answered after the given latency, like a remote _FileReader would be,
+so the effect of the 'window' and 'maxblocksize' arguments can be compared
+with the old one-read-at-a-time protocol without a real network."""
+
+import os
+import shutil
+import tempfile
+import time
+
+from twisted.internet import defer
+from twisted.internet import reactor
+
+from buildslave.commands import transfer
+from buildslave.test.fake.slavebuilder import FakeSlaveBuilder
+
+
+class LatentReader(object):
+
+    """A local stand-in for a remote _FileReader with a fixed round-trip
+    time and an optional bandwidth limit (bytes per second)."""
+
+    def __init__(self, fp, rtt, bandwidth=None):
+        self.fp = fp
+        self.rtt = rtt
+        self.bandwidth = bandwidth
+        self.link_free_at = 0
+        self.reads = 0
+
+    def callRemote(self, meth, *args):
+        d = defer.Deferred()
+        delay = self.rtt
+        if meth == 'read':
+            self.reads += 1
+            data = self.fp.read(args[0])
+            if self.bandwidth:
+                # replies share the link, so they queue behind each other
+                now = time.time()
+                start = max(now, self.link_free_at)
+                self.link_free_at = start + float(len(data)) / self.bandwidth
+                delay += self.link_free_at - now
+        else:
+            data = None
+        reactor.callLater(delay, d.callback, data)
+        return d
+
+
+@defer.inlineCallbacks
+def run_one(srcfile, destdir, rtt, bandwidth, window, blocksize, maxblocksize):
+    builder = FakeSlaveBuilder(basedir=destdir)
+    reader = LatentReader(open(srcfile, 'rb'), rtt, bandwidth)
+    args = dict(workdir='.', slavedest='data', reader=reader, maxsize=None,
+                blocksize=blocksize, mode=None)
+    if window > 1:
+        args['window'] = window
+        args['maxblocksize'] = maxblocksize
+    cmd = transfer.SlaveFileDownloadCommand(builder, 'bench', args)
+    started = time.time()
+    yield cmd.doStart()
+    elapsed = time.time() - started
+    reader.fp.close()
+    defer.returnValue((elapsed, reader.reads))
+
+
+@defer.inlineCallbacks
+def main(options):
+    workdir = tempfile.mkdtemp()
+    try:
+        srcfile = os.path.join(workdir, 'source')
+        with open(srcfile, 'wb') as f:
+            f.write(os.urandom(options.size * 1024 * 1024))
+        size = os.path.getsize(srcfile)
+
+        print "%d MiB, rtt %.0fms" % (options.size, options.rtt * 1000)
+        for window in [1] + options.windows:
+            elapsed, reads = yield run_one(srcfile, workdir, options.rtt,
+                                           options.bandwidth, window,
+                                           options.blocksize,
+                                           options.maxblocksize)
+            print "window=%-3d reads=%-6d %7.2fs %8.1f KiB/s" % (
+                window, reads, elapsed, size / 1024.0 / elapsed)
+    finally:
+        shutil.rmtree(workdir)
+        reactor.stop()
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser(__doc__)
+    parser.add_option("--size", type="int", default=4,
+                      help="file size in MiB (default: 4)")
+    parser.add_option("--rtt", type="float", default=0.1,
+                      help="simulated round-trip time in seconds (default: 0.1)")
+    parser.add_option("--bandwidth", type="int", default=None,
+                      help="simulated link bandwidth in bytes/s (default: unlimited)")
+    parser.add_option("--blocksize", type="int", default=16 * 1024,
+                      help="initial block size (default: 16384)")
+    parser.add_option("--maxblocksize", type="int", default=256 * 1024,
+                      help="maximum block size (default: 262144)")
+    parser.add_option("--window", dest="windows", type="int", action="append",
+                      help="window size to compare with the unpipelined "
+                           "protocol; may be repeated (default: 4 and 8)")
+    options, args = parser.parse_args()
+    if not options.windows:
+        options.windows = [4, 8]
+
+    reactor.callWhenRunning(main, options)
+    reactor.run()